@@ -1,8 +1,27 @@
 __version__ = '0.1.1'
 
 from .simulation import Simulation
+from .pool import SimulationPool
 from . import util
 from . import parser 
 from . import modify_species_file 
+from . import workspace
+from . import container_pool
+from . import transfer
+from . import monitor
+from . import cache
+from . import warmstart
+from . import scan
+from . import journal
+from . import workqueue
+from . import build
+from . import templates
+from . import tables
+from . import sections
+from . import result
+from . import reparse
+from . import ensemble
+from . import catalog
 
 del simulation
+del pool
@@ -0,0 +1,188 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import subprocess
+import contextlib
+
+# How each model is built, paths are relative to the atmos directory
+MODELS = {
+        'photochem' : {'makefile' : 'PhotoMake', 'executable' : 'Photo.run', 'sources' : 'PHOTOCHEM'},
+        'clima' : {'makefile' : 'ClimaMake', 'executable' : 'Clima.run', 'sources' : 'CLIMA'},
+        }
+
+# Files of the source trees that are compiled or included
+SOURCE_EXTENSIONS = ['.f', '.f90', '.F', '.F90', '.for', '.inc', '.c', '.h']
+
+# Sub-directories of the source trees that only hold inputs and outputs
+EXCLUDED_DIRECTORIES = ['TEMPLATES', 'OUTPUT']
+
+# The include file that sets the dimensions of the models, it differs from template to template
+PARAMETERS_FILE = 'PHOTOCHEM/INPUTFILES/parameters.inc'
+TEMPLATE_PARAMETERS_FILE = 'PHOTOCHEM/INPUTFILES/TEMPLATES/{0}/parameters.inc'
+
+
+#_________________________________________________________________________
+def source_files(atmos_directory, model):
+    '''
+    List the files a model is compiled from
+    Args:
+        atmos_directory: string, path to the atmos directory
+        model: string, 'photochem' or 'clima'
+    Returns:
+        sorted list of paths relative to atmos_directory, the makefile first
+    '''
+    files = []
+    source_directory = os.path.join(atmos_directory, MODELS[model]['sources'])
+    for directory, sub_directories, file_names in os.walk(source_directory):
+        sub_directories[:] = sorted(name for name in sub_directories if name not in EXCLUDED_DIRECTORIES)
+        for name in file_names:
+            if os.path.splitext(name)[1] in SOURCE_EXTENSIONS:
+                files.append(os.path.relpath(os.path.join(directory, name), atmos_directory).replace(os.sep, '/'))
+    return [MODELS[model]['makefile']] + sorted(files)
+
+
+#_________________________________________________________________________
+def build_key(atmos_directory, model, template=None):
+    '''
+    Hash of everything a compiled model depends on: its makefile, its Fortran sources and the parameters.inc it is built with
+    Args:
+        atmos_directory: string, path to the atmos directory
+        model: string, 'photochem' or 'clima'
+        template: string (optional), name of the template (e.g. 'ModernEarth') whose parameters.inc is used,
+                  by default the parameters.inc currently in PHOTOCHEM/INPUTFILES
+    Returns:
+        string, hex digest
+    '''
+    files = [file_name for file_name in source_files(atmos_directory, model) if file_name != PARAMETERS_FILE] + [PARAMETERS_FILE]
+
+    sha = hashlib.sha256(model.encode())
+    for file_name in files:
+        path = os.path.join(atmos_directory, file_name)
+        if file_name == PARAMETERS_FILE and template is not None:
+            path = os.path.join(atmos_directory, TEMPLATE_PARAMETERS_FILE.format(template))
+        sha.update(file_name.encode()+b'\0')
+        try:
+            with open(path, 'rb') as file:
+                sha.update(hashlib.sha256(file.read()).digest())
+        except IOError:
+            sha.update(b'missing')
+    return sha.hexdigest()
+
+
+#_________________________________________________________________________
+class BuildCache():
+    def __init__(self, cache_directory):
+        '''
+        Cache of compiled Photo.run and Clima.run, keyed by build_key(), so that atmos is only recompiled when its sources
+        or the parameters.inc of the template change. Binaries are stored as <cache_directory>/<key[:2]>/<key>/<executable>
+        and symbolic links to them are put in the atmos directory.
+        The cache can be shared by several processes, builds are serialized with a lock file
+        cache_directory: string, where the binaries are kept
+        '''
+        self._cache_directory = os.path.abspath(cache_directory)
+        os.makedirs(self._cache_directory, exist_ok=True)
+
+    #_________________________________________________________________________
+    def _binary(self, key, model):
+        return os.path.join(self._cache_directory, key[:2], key, MODELS[model]['executable'])
+
+    #_________________________________________________________________________
+    def get(self, key, model):
+        '''
+        Returns:
+            path of the cached binary, or None if it is not in the cache
+        '''
+        binary = self._binary(key, model)
+        return binary if os.path.isfile(binary) else None
+
+    #_________________________________________________________________________
+    def put(self, key, model, binary):
+        '''
+        Store a compiled binary
+        Returns:
+            path of the cached binary
+        '''
+        entry_directory = os.path.dirname(self._binary(key, model))
+        os.makedirs(os.path.dirname(entry_directory), exist_ok=True)
+        tmp_directory = tempfile.mkdtemp(prefix='.tmp_', dir=os.path.dirname(entry_directory))
+        try:
+            shutil.copy2(binary, os.path.join(tmp_directory, MODELS[model]['executable']))
+            os.rename(tmp_directory, entry_directory)
+        except OSError:
+            # another process stored the same binary in the meantime
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+        return self._binary(key, model)
+
+    #_________________________________________________________________________
+    @contextlib.contextmanager
+    def _lock(self):
+        import fcntl
+        with open(os.path.join(self._cache_directory, 'build.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    #_________________________________________________________________________
+    def build(self, atmos_directory, model, template=None):
+        '''
+        Compile a model from scratch (make clean, then make)
+        Args:
+            atmos_directory: string, path to the atmos directory
+            model: string, 'photochem' or 'clima'
+            template: string (optional), the parameters.inc of this template is copied into PHOTOCHEM/INPUTFILES first
+        Returns:
+            path of the compiled binary, or None if the compilation failed
+        '''
+        if template is not None:
+            shutil.copy2(os.path.join(atmos_directory, TEMPLATE_PARAMETERS_FILE.format(template)), os.path.join(atmos_directory, PARAMETERS_FILE))
+
+        makefile = MODELS[model]['makefile']
+        print('Compiling {0} with {1} ...'.format(model, makefile))
+        for command in [['make', '-f', makefile, 'clean'], ['make', '-f', makefile]]:
+            process = subprocess.run(command, cwd=atmos_directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            if process.returncode != 0 and command[-1] != 'clean':
+                print('ERROR: {0} failed:\n{1}'.format(' '.join(command), process.stdout.decode(errors='replace')))
+                return None
+
+        binary = os.path.join(atmos_directory, MODELS[model]['executable'])
+        return binary if os.path.isfile(binary) else None
+
+    #_________________________________________________________________________
+    def install(self, atmos_directory, model, template=None):
+        '''
+        Put the right binary of a model in the atmos directory: link the cached one, or compile it and store it in the cache
+        Args:
+            atmos_directory: string, path to the atmos directory
+            model: string, 'photochem' or 'clima'
+            template: string (optional), see build_key()
+        Returns:
+            path of the cached binary, or None if the compilation failed
+        '''
+        key = build_key(atmos_directory, model, template)
+        binary = self.get(key, model)
+        if binary is None:
+            with self._lock():
+                binary = self.get(key, model)
+                if binary is None:
+                    built = self.build(atmos_directory, model, template)
+                    if built is None:
+                        return None
+                    binary = self.put(key, model, built)
+        else:
+            print('Using cached {0} {1}'.format(model, binary))
+            if template is not None:
+                shutil.copy2(os.path.join(atmos_directory, TEMPLATE_PARAMETERS_FILE.format(template)), os.path.join(atmos_directory, PARAMETERS_FILE))
+
+        # replace the executable by a link to the cached binary, in one go
+        executable = os.path.join(atmos_directory, MODELS[model]['executable'])
+        if os.path.islink(executable) and os.readlink(executable) == binary:
+            return binary
+        link = executable+'.tmp_link'
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(binary, link)
+        os.replace(link, executable)
+        return binary
@@ -0,0 +1,256 @@
+import os
+import json
+import types
+import shutil
+import hashlib
+import tempfile
+
+# Statuses that only depend on the inputs of the run, and can therefore be cached
+CACHED_STATUSES = ['success', 'photochem_nonconverged', 'photochem_diverged', 'clima_error']
+
+# Input files of atmos (relative to the atmos directory) that determine the outputs of Simulation.run, besides the template of the run.
+# in.dist and TempOut.dat are the solutions the run starts from
+RUN_INPUT_FILES = [
+        'PHOTOCHEM/INPUTFILES/input_photchem.dat',
+        'PHOTOCHEM/INPUTFILES/PLANET.dat',
+        'PHOTOCHEM/INPUTFILES/reactions.rx',
+        'PHOTOCHEM/INPUTFILES/parameters.inc',
+        'PHOTOCHEM/in.dist',
+        'CLIMA/IO/input_clima.dat',
+        'CLIMA/IO/TempOut.dat',
+        ]
+
+ENTRY_FILE_NAME = 'entry.json'
+
+# Number of entries a ResultCache stores between two scans of the whole cache, to account for the entries stored 
+# and evicted by other processes
+RESCAN_INTERVAL = 100
+
+
+#_________________________________________________________________________
+def list_files(directory):
+    '''
+    List the files of a directory with their modification time and size, to find the files written by a run
+    Returns:
+        dictionary of { 'file name' : (mtime in ns, size) }, empty if the directory does not exist
+    '''
+    files = {}
+    if not os.path.isdir(directory):
+        return files
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            stat = entry.stat()
+            files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+#_________________________________________________________________________
+def describe(value, _functions=()):
+    '''
+    Turn a run input into something that can be hashed reproducibly:
+    dictionaries are sorted, bytes are replaced by their sha256, functions (lambdas and closures included) by their
+    bytecode, constants, defaults, the values of their closure and the plain values of the globals they use,
+    classes and builtins by their qualified name, and other objects by their class name and attributes
+    Raises:
+        ValueError if the value cannot be described reproducibly, the run must then not be cached
+    '''
+    if isinstance(value, dict):
+        return { str(k) : describe(v, _functions) for k, v in sorted(value.items(), key=lambda item: str(item[0])) }
+    if isinstance(value, (list, tuple)):
+        return [describe(v, _functions) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted([describe(v, _functions) for v in value], key=lambda v: json.dumps(v, sort_keys=True))
+    if isinstance(value, bytes):
+        return 'sha256:'+hashlib.sha256(value).hexdigest()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, types.MethodType):
+        return { '__method__' : describe(value.__func__, _functions), '__self__' : describe(value.__self__, _functions) }
+    if isinstance(value, types.FunctionType):
+        name = '{0}.{1}'.format(value.__module__, value.__qualname__)
+        if value in _functions:
+            # recursive function
+            return name
+        _functions = _functions + (value,)
+        try:
+            closure = [cell.cell_contents for cell in value.__closure__ or ()]
+        except ValueError:
+            raise ValueError('cannot describe {0}, its closure is not complete'.format(name))
+        plain_globals = { global_name : value.__globals__[global_name] for global_name in _global_names(value.__code__)
+                          if isinstance(value.__globals__.get(global_name), (str, int, float, bool, tuple, frozenset)) }
+        return { '__function__' : name,
+                 '__code__' : describe(value.__code__, _functions),
+                 '__defaults__' : describe(value.__defaults__, _functions),
+                 '__kwdefaults__' : describe(value.__kwdefaults__, _functions),
+                 '__closure__' : describe(closure, _functions),
+                 '__globals__' : describe(plain_globals, _functions) }
+    if isinstance(value, types.CodeType):
+        return { 'co_code' : describe(value.co_code), 'co_consts' : describe(value.co_consts, _functions), 'co_names' : list(value.co_names) }
+    if hasattr(value, '__qualname__'):
+        return '{0}.{1}'.format(value.__module__, value.__qualname__)
+    try:
+        attributes = vars(value)
+    except TypeError:
+        raise ValueError('cannot describe {0} reproducibly'.format(repr(value)))
+    return { '__class__' : '{0}.{1}'.format(type(value).__module__, type(value).__qualname__),
+             '__dict__' : describe(attributes, _functions) }
+
+
+#_________________________________________________________________________
+def _global_names(code):
+    '''
+    Names a code object (and the code objects nested in it, e.g. of a generator expression) looks up
+    '''
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names |= _global_names(constant)
+    return sorted(names)
+
+
+#_________________________________________________________________________
+class ResultCache():
+    def __init__(self, cache_directory, max_size=10*1024**3):
+        '''
+        Persistent on-disk cache of the outputs of Simulation.run, keyed by a hash of all the inputs of the run
+        Entries are stored as <cache_directory>/<key[:2]>/<key>/, with the output files and an entry.json
+        holding the status and the metadata of the run.
+        The least recently used entries are evicted once the cache grows over max_size. The size of the cache is kept as a running
+        total of the entries stored, the cache is only scanned when that total goes over max_size, or every RESCAN_INTERVAL entries
+        cache_directory: string, where the cache lives (can be shared by several processes)
+        max_size: int, maximum size of the cache in bytes
+        '''
+        self._cache_directory = cache_directory
+        self._max_size        = max_size
+        # size of the cache at the last scan plus the entries stored since, None until the first scan
+        self._size            = None
+        self._n_puts          = 0
+        os.makedirs(cache_directory, exist_ok=True)
+
+    #_________________________________________________________________________
+    @staticmethod
+    def key(inputs):
+        '''
+        Compute the cache key of a run
+        Args:
+            inputs: dictionary of everything that determines the outputs of the run, see describe()
+        Returns:
+            string, hex digest
+        '''
+        text = json.dumps(describe(inputs), sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    #_________________________________________________________________________
+    def _entry_directory(self, key):
+        return os.path.join(self._cache_directory, key[:2], key)
+
+    #_________________________________________________________________________
+    def get(self, key):
+        '''
+        Look up an entry, and mark it as recently used
+        Returns:
+            dictionary with 'status', 'metadata', 'files' and 'size', or None if the key is not in the cache
+        '''
+        entry_file_name = os.path.join(self._entry_directory(key), ENTRY_FILE_NAME)
+        try:
+            with open(entry_file_name, 'r') as file:
+                entry = json.load(file)
+            os.utime(entry_file_name)
+        except (IOError, ValueError):
+            return None
+        return entry
+
+    #_________________________________________________________________________
+    def materialize(self, key, output_directory):
+        '''
+        Copy the output files of a cached run into output_directory
+        Returns:
+            the cache entry (see get()), or None if the key is not in the cache
+        '''
+        entry = self.get(key)
+        if entry is None:
+            return None
+        os.makedirs(output_directory, exist_ok=True)
+        try:
+            for file_name in entry['files']:
+                shutil.copy2(os.path.join(self._entry_directory(key), file_name), output_directory)
+        except IOError:
+            # evicted while being copied
+            return None
+        return entry
+
+    #_________________________________________________________________________
+    def put(self, key, status, output_directory, file_names, metadata=None):
+        '''
+        Store the outputs of a run
+        Args:
+            key: string, see key()
+            status: string, status of the run. Only statuses in CACHED_STATUSES are stored
+            output_directory: string, directory holding the outputs of the run
+            file_names: list of names of the files of output_directory written by the run
+            metadata: dictionary (optional), metadata of the run
+        '''
+        if status not in CACHED_STATUSES:
+            return
+        entry_directory = self._entry_directory(key)
+        if os.path.exists(entry_directory):
+            return
+
+        # write the entry in a temporary directory, then move it in place in one go
+        os.makedirs(os.path.dirname(entry_directory), exist_ok=True)
+        tmp_directory = tempfile.mkdtemp(prefix='.tmp_', dir=os.path.dirname(entry_directory))
+        try:
+            files = sorted(file_names)
+            size = 0
+            for file_name in files:
+                path = os.path.join(output_directory, file_name)
+                shutil.copy2(path, tmp_directory)
+                size += os.path.getsize(path)
+            entry = {'status' : status, 'metadata' : metadata, 'files' : files, 'size' : size}
+            with open(os.path.join(tmp_directory, ENTRY_FILE_NAME), 'w') as file:
+                json.dump(entry, file, sort_keys=True, indent=4)
+            os.rename(tmp_directory, entry_directory)
+        except OSError as e:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            # unless another process stored the same entry in the meantime
+            if not os.path.isdir(entry_directory):
+                print('Could not store the outputs of {0} in the cache: {1}'.format(output_directory, e))
+            return
+
+        if self._size is None or self._n_puts >= RESCAN_INTERVAL:
+            self.evict()
+            return
+        self._size += size
+        self._n_puts += 1
+        if self._size > self._max_size:
+            self.evict()
+
+    #_________________________________________________________________________
+    def evict(self):
+        '''
+        Scan the cache, and remove the least recently used entries until it is smaller than max_size
+        '''
+        entries = []
+        total_size = 0
+        for prefix in os.listdir(self._cache_directory):
+            prefix_directory = os.path.join(self._cache_directory, prefix)
+            if not os.path.isdir(prefix_directory):
+                continue
+            for key in os.listdir(prefix_directory):
+                entry_file_name = os.path.join(prefix_directory, key, ENTRY_FILE_NAME)
+                try:
+                    with open(entry_file_name, 'r') as file:
+                        size = json.load(file)['size']
+                    last_used = os.path.getmtime(entry_file_name)
+                except (IOError, ValueError, KeyError):
+                    continue
+                entries.append((last_used, size, os.path.join(prefix_directory, key)))
+                total_size += size
+
+        for last_used, size, entry_directory in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            shutil.rmtree(entry_directory, ignore_errors=True)
+            total_size -= size
+        self._size = total_size
+        self._n_puts = 0
@@ -0,0 +1,243 @@
+import os
+import json
+import sqlite3
+import contextlib
+
+import pyatmos
+
+_SCHEMA = [
+'''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    output_directory TEXT NOT NULL UNIQUE,
+    status TEXT,
+    template TEXT,
+    start_time REAL,
+    duration REAL,
+    photochem_duration REAL,
+    clima_duration REAL,
+    photochem_iterations INTEGER,
+    clima_iterations INTEGER,
+    cache_hit INTEGER,
+    surface_temperature REAL,
+    surface_pressure REAL,
+    metadata TEXT
+)
+''',
+'''
+CREATE TABLE IF NOT EXISTS run_values (
+    run INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    quantity TEXT NOT NULL,
+    species TEXT NOT NULL,
+    value REAL
+)
+''',
+'CREATE INDEX IF NOT EXISTS run_values_by_species ON run_values (quantity, species, value)',
+'CREATE INDEX IF NOT EXISTS run_values_by_run ON run_values (run)',
+'CREATE INDEX IF NOT EXISTS runs_by_status ON runs (status)',
+]
+
+# Numeric columns of the runs table that can be queried, see RunCatalog.query
+COLUMNS = ['start_time', 'duration', 'photochem_duration', 'clima_duration', 'photochem_iterations', 'clima_iterations',
+           'surface_temperature', 'surface_pressure']
+
+# Per species values of a run: the inputs, and the surface outputs
+QUANTITIES = ['concentrations', 'fluxes', 'surface_mixing_ratios', 'surface_fluxes']
+
+
+#_________________________________________________________________________
+def surface_values(result):
+    '''
+    Surface outputs of a run, for the models that converged (see pyatmos.warmstart)
+    Args:
+        result: pyatmos.result.RunResult
+    Returns:
+        dictionary of { 'surface_temperature' : ..., 'surface_pressure' : ..., 'surface_mixing_ratios' : { 'species' : ... },
+        'surface_fluxes' : { 'species' : ... } }, the values that are not available are None (or empty)
+    '''
+    values = { 'surface_temperature' : None, 'surface_pressure' : None, 'surface_mixing_ratios' : {}, 'surface_fluxes' : {} }
+    if result in pyatmos.warmstart.PHOTOCHEM_CONVERGED_STATUSES:
+        try:
+            for name, df, surface in [('surface_mixing_ratios', result.photochem_mixing_ratios, None), ('surface_fluxes', result.photochem_fluxes, 0)]:
+                row = df.loc[df['Z'].idxmin()] if surface is None else df[df['Z'] == surface].iloc[0]
+                values[name] = { str(species) : float(value) for species, value in row.items()
+                                 if not (species == 'Z' or str(species).startswith('Z.') or str(species).startswith('Unnamed:')) }
+        except (IOError, OSError, KeyError, IndexError, ValueError):
+            print('Could not read the surface outputs of photochem in {0}'.format(result.output_directory))
+    if result in pyatmos.warmstart.CLIMA_CONVERGED_STATUSES:
+        try:
+            values['surface_temperature'] = result.surface_temperature
+            values['surface_pressure'] = result.surface_pressure
+        except (IOError, OSError, KeyError, IndexError, ValueError):
+            print('Could not read the surface outputs of clima in {0}'.format(result.output_directory))
+    return values
+
+
+#_________________________________________________________________________
+class RunCatalog():
+    def __init__(self, database_file):
+        '''
+        Catalog of runs in an SQLite database, indexed by their inputs (species concentrations and fluxes) and outcomes
+        (status, durations, iteration counts, surface temperature, pressure, mixing ratios and fluxes), to find runs without
+        reading their metadata files. Simulation.run() adds every run to it (see Simulation(catalog=...))
+        Runs are identified by their output directory, a run made again in the same directory replaces the previous one
+        The database can be shared by the processes of one machine (e.g. those of a SimulationPool). SQLite relies on file locks, which
+        network filesystems such as NFS do not implement reliably: workers on several machines should each have their own catalog
+        database_file: string, path of the database (created if needed)
+        '''
+        self._database_file = database_file
+        with self._connect() as connection:
+            for statement in _SCHEMA:
+                connection.execute(statement)
+
+    #_________________________________________________________________________
+    @contextlib.contextmanager
+    def _connect(self):
+        '''
+        One connection per operation, so that the catalog can be used from several threads and processes
+        '''
+        connection = sqlite3.connect(self._database_file, timeout=60, isolation_level=None)
+        try:
+            connection.execute('PRAGMA foreign_keys = ON')
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+                connection.execute('COMMIT')
+            except:
+                connection.execute('ROLLBACK')
+                raise
+        finally:
+            connection.close()
+
+    #_________________________________________________________________________
+    def add(self, result, species_concentrations=None, species_fluxes=None, metadata=None):
+        '''
+        Add a run to the catalog
+        Args:
+            result: pyatmos.result.RunResult returned by Simulation.run
+            species_concentrations: dictionary (optional), input concentrations of the run, see Simulation.run
+            species_fluxes: dictionary (optional), input fluxes of the run, see Simulation.run
+            metadata: dictionary (optional), see Simulation.get_metadata
+        Returns:
+            id of the run in the catalog
+        '''
+        metadata = metadata or {}
+        surface = surface_values(result)
+
+        row = {
+                'output_directory' : os.path.abspath(result.output_directory),
+                'status' : result.status,
+                'template' : metadata.get('template'),
+                'start_time' : metadata.get('atmos_start_time'),
+                'duration' : metadata.get('atmos_run_duration'),
+                'photochem_duration' : metadata.get('photochem_duration'),
+                'clima_duration' : metadata.get('clima_duration'),
+                'photochem_iterations' : metadata.get('photochem_iterations'),
+                'clima_iterations' : metadata.get('clima_iterations'),
+                'cache_hit' : metadata.get('cache_hit'),
+                'surface_temperature' : surface['surface_temperature'],
+                'surface_pressure' : surface['surface_pressure'],
+                # e.g. run_iteration_call can be anything
+                'metadata' : json.dumps(metadata, sort_keys=True, default=str),
+                }
+        values = {
+                'concentrations' : species_concentrations or {},
+                'fluxes' : species_fluxes or {},
+                'surface_mixing_ratios' : surface['surface_mixing_ratios'],
+                'surface_fluxes' : surface['surface_fluxes'],
+                }
+
+        with self._connect() as connection:
+            connection.execute('DELETE FROM runs WHERE output_directory = ?', (row['output_directory'],))
+            run_id = connection.execute('INSERT INTO runs ({0}) VALUES ({1})'.format(', '.join(row), ', '.join('?'*len(row))),
+                                        list(row.values())).lastrowid
+            connection.executemany('INSERT INTO run_values (run, quantity, species, value) VALUES (?, ?, ?, ?)',
+                                   [(run_id, quantity, species, float(value)) for quantity in QUANTITIES for species, value in values[quantity].items()])
+        return run_id
+
+    #_________________________________________________________________________
+    @staticmethod
+    def _condition(expression, condition):
+        '''
+        SQL condition on expression: condition is a value (equality), or (minimum, maximum) where either can be None (bounds included)
+        Returns:
+            (sql, parameters)
+        '''
+        if not isinstance(condition, (tuple, list)):
+            return '{0} = ?'.format(expression), [condition]
+        minimum, maximum = condition
+        sql, parameters = [], []
+        if minimum is not None:
+            sql.append('{0} >= ?'.format(expression))
+            parameters.append(minimum)
+        if maximum is not None:
+            sql.append('{0} <= ?'.format(expression))
+            parameters.append(maximum)
+        return ' AND '.join(sql) or '1', parameters
+
+    #_________________________________________________________________________
+    def query(self, status=None, template=None, concentrations=None, fluxes=None, surface_mixing_ratios=None, surface_fluxes=None, **columns):
+        '''
+        Find runs, e.g. the converged runs with CH4 above 1e-4 and a surface temperature above 273 K:
+            catalog.query(status='success', concentrations={'CH4' : (1e-4, None)}, surface_temperature=(273, None))
+        Conditions are values (equality) or (minimum, maximum) ranges where either bound can be None, bounds are included
+        Args:
+            status: string or list of strings (optional), status of the runs
+            template: string (optional), template of the runs
+            concentrations, fluxes: dictionaries (optional) of { 'species' : condition } on the inputs of the runs.
+                                    Runs that did not set a species do not match a condition on it
+            surface_mixing_ratios, surface_fluxes: dictionaries (optional) of { 'species' : condition } on the surface outputs of photochem
+            columns: conditions on the values in COLUMNS, e.g. surface_temperature=(273, None), clima_iterations=(None, 100)
+        Returns:
+            list of the output directories of the matching runs, in the order they were added
+        '''
+        sql = ['SELECT output_directory FROM runs WHERE 1']
+        parameters = []
+        if status is not None:
+            statuses = [status] if isinstance(status, str) else list(status)
+            sql.append('AND status IN ({0})'.format(', '.join('?'*len(statuses))))
+            parameters += statuses
+        if template is not None:
+            sql.append('AND template = ?')
+            parameters.append(template)
+        for column, condition in columns.items():
+            if column not in COLUMNS:
+                raise ValueError('cannot query {0}, expected one of {1}'.format(column, COLUMNS))
+            condition_sql, condition_parameters = self._condition(column, condition)
+            sql.append('AND '+condition_sql)
+            parameters += condition_parameters
+        for quantity, conditions in zip(QUANTITIES, [concentrations, fluxes, surface_mixing_ratios, surface_fluxes]):
+            for species, condition in (conditions or {}).items():
+                condition_sql, condition_parameters = self._condition('value', condition)
+                sql.append('AND id IN (SELECT run FROM run_values WHERE quantity = ? AND species = ? AND {0})'.format(condition_sql))
+                parameters += [quantity, species] + condition_parameters
+        sql.append('ORDER BY id')
+
+        with self._connect() as connection:
+            return [row[0] for row in connection.execute(' '.join(sql), parameters)]
+
+    #_________________________________________________________________________
+    def get(self, output_directory):
+        '''
+        Args:
+            output_directory: string, output directory of a run
+        Returns:
+            dictionary of the columns of the run, with its metadata and its per species values (see QUANTITIES), or None if it is not in the catalog
+        '''
+        with self._connect() as connection:
+            cursor = connection.execute('SELECT * FROM runs WHERE output_directory = ?', (os.path.abspath(output_directory),))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            run = dict(zip([description[0] for description in cursor.description], row))
+            run['metadata'] = json.loads(run['metadata'])
+            for quantity in QUANTITIES:
+                run[quantity] = {}
+            for quantity, species, value in connection.execute('SELECT quantity, species, value FROM run_values WHERE run = ?', (run['id'],)):
+                run[quantity][species] = value
+        return run
+
+    #_________________________________________________________________________
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
@@ -0,0 +1,155 @@
+import sys
+import json
+import argparse
+
+import pyatmos
+
+
+#_________________________________________________________________________
+def read_specs(file_name):
+    '''
+    Read run specs (see SimulationPool.imap) from a json file holding a list, or from a file with one json spec per line
+    '''
+    with open(file_name, 'r') as file:
+        text = file.read()
+    try:
+        specs = json.loads(text)
+    except ValueError:
+        specs = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(specs, dict):
+        specs = [specs]
+    return specs
+
+
+#_________________________________________________________________________
+def _simulation_kwargs(arguments):
+    kwargs = {
+            'docker_image' : arguments.docker_image,
+            'code_path' : arguments.code_path,
+            'DEBUG' : arguments.debug,
+            'atmos_directory' : arguments.atmos_directory,
+            'workspace_directory' : arguments.workspace_directory,
+            'output_format' : arguments.output_format,
+            }
+    if arguments.cache_directory is not None:
+        kwargs['cache'] = pyatmos.cache.ResultCache(arguments.cache_directory)
+    if arguments.build_cache_directory is not None:
+        kwargs['build_cache'] = pyatmos.build.BuildCache(arguments.build_cache_directory)
+    if arguments.catalog is not None:
+        kwargs['catalog'] = pyatmos.catalog.RunCatalog(arguments.catalog)
+    return kwargs
+
+
+#_________________________________________________________________________
+def coordinator(arguments):
+    queue = pyatmos.workqueue.WorkQueue(arguments.database, arguments.lease_duration, arguments.max_attempts)
+    if arguments.specs is not None:
+        job_ids = queue.add(read_specs(arguments.specs))
+        print('Added {0} jobs to {1}'.format(len(job_ids), arguments.database))
+    if arguments.no_serve:
+        return
+    pyatmos.workqueue.Coordinator(queue, arguments.host, arguments.port).serve(exit_when_finished=not arguments.keep_serving)
+
+
+#_________________________________________________________________________
+def worker(arguments):
+    pyatmos.workqueue.Worker(arguments.address, _simulation_kwargs(arguments),
+                             worker_id=arguments.worker_id,
+                             heartbeat_interval=arguments.heartbeat_interval,
+                             poll_interval=arguments.poll_interval).run()
+
+
+#_________________________________________________________________________
+def status(arguments):
+    queue = pyatmos.workqueue.WorkQueue(arguments.database)
+    print(json.dumps(queue.counts(), indent=4))
+    if arguments.results:
+        for job in queue.results():
+            status = job['result']['status'] if job['result'] else None
+            print('{0}\t{1}\t{2}\t{3}'.format(job['id'], job['state'], status, job['spec'].get('output_directory')))
+
+
+#_________________________________________________________________________
+def build(arguments):
+    build_cache = pyatmos.build.BuildCache(arguments.build_cache_directory)
+    for model in arguments.models:
+        binary = build_cache.install(arguments.code_path, model, arguments.template)
+        if binary is None:
+            sys.exit(1)
+        print('{0}: {1}'.format(pyatmos.build.MODELS[model]['executable'], binary))
+
+
+#_________________________________________________________________________
+def reparse(arguments):
+    summary = pyatmos.reparse.reparse(arguments.root_directory, arguments.output_format, arguments.processes, arguments.force, arguments.progress_interval)
+    if arguments.failures is not None:
+        with open(arguments.failures, 'w') as file:
+            for directory, error in sorted(summary['failed']):
+                file.write('{0}\t{1}\n'.format(directory, error))
+    if summary['failed']:
+        sys.exit(1)
+
+
+#_________________________________________________________________________
+def main(argv=None):
+    '''
+    Entry point of the pyatmos command
+    '''
+    parser = argparse.ArgumentParser(prog='pyatmos', description='Run atmos sweeps')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_coordinator = subparsers.add_parser('coordinator', help='queue run specs and serve them to workers')
+    parser_coordinator.add_argument('database', help='path of the sqlite database of the queue')
+    parser_coordinator.add_argument('--specs', help='json file of run specs to add to the queue (a list, or one spec per line)')
+    parser_coordinator.add_argument('--host', default='0.0.0.0')
+    parser_coordinator.add_argument('--port', type=int, default=8765)
+    parser_coordinator.add_argument('--lease-duration', type=float, default=600, help='seconds before the job of a silent worker is requeued')
+    parser_coordinator.add_argument('--max-attempts', type=int, default=3)
+    parser_coordinator.add_argument('--keep-serving', action='store_true', help='keep serving once all the jobs are finished')
+    parser_coordinator.add_argument('--no-serve', action='store_true', help='only add the specs, workers use the database directly (workers on this machine only, other machines need a coordinator)')
+    parser_coordinator.set_defaults(function=coordinator)
+
+    parser_worker = subparsers.add_parser('worker', help='pull jobs from a coordinator and run them')
+    parser_worker.add_argument('address', help='http://host:port of the coordinator, or path of the database for a worker on the machine of the database')
+    parser_worker.add_argument('--code-path', help='local atmos directory')
+    parser_worker.add_argument('--docker-image', help='docker image of atmos')
+    parser_worker.add_argument('--atmos-directory', default='/code/atmos', help='path to atmos inside the docker image')
+    parser_worker.add_argument('--workspace-directory', help='where the per-run clones of atmos are made (local mode)')
+    parser_worker.add_argument('--cache-directory', help='directory of a pyatmos.cache.ResultCache')
+    parser_worker.add_argument('--build-cache-directory', help='directory of a pyatmos.build.BuildCache (local mode)')
+    parser_worker.add_argument('--catalog', help='sqlite database of a pyatmos.catalog.RunCatalog the runs are added to')
+    parser_worker.add_argument('--output-format', choices=sorted(pyatmos.tables.FORMATS), default='csv', help='format of the parsed tables')
+    parser_worker.add_argument('--worker-id')
+    parser_worker.add_argument('--heartbeat-interval', type=float, default=60)
+    parser_worker.add_argument('--poll-interval', type=float, default=10)
+    parser_worker.add_argument('--debug', action='store_true')
+    parser_worker.set_defaults(function=worker)
+
+    parser_status = subparsers.add_parser('status', help='print the state of a queue')
+    parser_status.add_argument('database')
+    parser_status.add_argument('--results', action='store_true', help='also print every job')
+    parser_status.set_defaults(function=status)
+
+    parser_build = subparsers.add_parser('build', help='link cached Photo.run and Clima.run into atmos, compiling them only if needed')
+    parser_build.add_argument('code_path', help='local atmos directory')
+    parser_build.add_argument('build_cache_directory', help='directory of the pyatmos.build.BuildCache')
+    parser_build.add_argument('--template', help='template whose parameters.inc is used (default: the current parameters.inc)')
+    parser_build.add_argument('--models', nargs='+', choices=sorted(pyatmos.build.MODELS), default=sorted(pyatmos.build.MODELS))
+    parser_build.set_defaults(function=build)
+
+    parser_reparse = subparsers.add_parser('reparse', help='parse the outputs of a tree of run directories again, in parallel')
+    parser_reparse.add_argument('root_directory', help='directory holding the run directories (searched recursively)')
+    parser_reparse.add_argument('--output-format', choices=sorted(pyatmos.tables.FORMATS), default='csv', help='format of the parsed tables')
+    parser_reparse.add_argument('--processes', type=int, help='number of processes (default: number of CPUs)')
+    parser_reparse.add_argument('--force', action='store_true', help='also parse the directories whose parsed tables are newer than their outputs')
+    parser_reparse.add_argument('--progress-interval', type=float, default=10, help='seconds between two progress reports')
+    parser_reparse.add_argument('--failures', help='file the failed directories are written to, with their error')
+    parser_reparse.set_defaults(function=reparse)
+
+    arguments = parser.parse_args(argv)
+    arguments.function(arguments)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
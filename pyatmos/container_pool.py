@@ -0,0 +1,164 @@
+import docker
+import queue
+import contextlib
+
+import pyatmos
+
+# Where the pristine copy of the modified files is kept inside every container
+PRISTINE_SNAPSHOT = '/tmp/pyatmos_pristine.tar'
+
+
+#_________________________________________________________________________
+def _writable_files_command(atmos_directory):
+    '''
+    Shell command listing the files of the atmos directory that are modified by a run (see pyatmos.workspace)
+    '''
+    workspace = pyatmos.workspace
+    trees = ' '.join(workspace.COPIED_TREES)
+    directories = ' '.join([d if d else '.' for d in workspace.COPIED_DIRECTORIES])
+    exclude = ' '.join(["! -name '{0}'".format(f) for f in workspace.HARDLINKED_FILES])
+    return 'cd {0} && {{ find {1} -type f 2>/dev/null; find {2} -maxdepth 1 -type f {3} 2>/dev/null; }}'.format(atmos_directory, trees, directories, exclude)
+
+
+#_________________________________________________________________________
+def snapshot_container(container, atmos_directory='/code/atmos'):
+    '''
+    Save a pristine copy of the files modified by a run, inside the container
+    Args:
+        container: docker container
+        atmos_directory: string, path to atmos inside the container
+    '''
+    command = '{0} | tar -cf {1} -T -'.format(_writable_files_command(atmos_directory), PRISTINE_SNAPSHOT)
+    container.exec_run(['sh', '-c', command])
+
+
+#_________________________________________________________________________
+def reset_container(container, atmos_directory='/code/atmos'):
+    '''
+    Restore the working state of a container from the snapshot taken by snapshot_container()
+    Files created by the previous run are removed: all the files of the output directories, and the files of the input 
+    directories that are not in the snapshot (e.g. an in.dist that was not there when the snapshot was taken)
+    Args:
+        container: docker container
+        atmos_directory: string, path to atmos inside the container
+    '''
+    trees = ' '.join(pyatmos.workspace.COPIED_TREES)
+    command = ('cd {0} && find {1} -type f -delete 2>/dev/null; '
+               '{2} | grep -vxF "$(tar -tf {3})" | while IFS= read -r file; do rm -f "$file"; done; '
+               'cd {0} && tar -xf {3}').format(atmos_directory, trees, _writable_files_command(atmos_directory), PRISTINE_SNAPSHOT)
+    container.exec_run(['sh', '-c', command])
+
+
+#_________________________________________________________________________
+class ContainerPool():
+    def __init__(self, docker_image, n_containers=1, atmos_directory='/code/atmos', pull=False):
+        '''
+        Keeps n_containers containers of docker_image running, and hands them out to runs.
+        Between two runs a container is reset from a pristine snapshot instead of being replaced.
+        docker_image: string, name of the docker image
+        n_containers: int, number of containers kept warm
+        atmos_directory: string, path to atmos inside the container
+        pull: bool, if True always pull the image. Otherwise it is only pulled when it is not available locally
+        '''
+        self._docker_image    = docker_image
+        self._n_containers    = n_containers
+        self._atmos_directory = atmos_directory
+        self._pull            = pull
+        self._docker_client   = None
+        self._image           = None
+        self._containers      = []
+        self._available       = queue.Queue()
+
+    #_________________________________________________________________________
+    def _get_image(self):
+        '''
+        Look the image up once, pulling it only if needed. Containers are started from the image id,
+        so all of them use the same digest even if the tag is moved while the pool is running
+        '''
+        self._docker_client = docker.from_env()
+        image = None
+        if not self._pull:
+            try:
+                image = self._docker_client.images.get(self._docker_image)
+                print('Using local image {0} ({1})'.format(self._docker_image, image.id))
+            except docker.errors.ImageNotFound:
+                pass
+        if image is None:
+            print('Pulling latest image... {}'.format(self._docker_image))
+            self._docker_client.images.pull(self._docker_image)
+            image = self._docker_client.images.get(self._docker_image)
+        return image
+
+    #_________________________________________________________________________
+    def start(self):
+        '''
+        Start the containers and take their pristine snapshot
+        '''
+        if self._image is None:
+            self._image = self._get_image()
+        while len(self._containers) < self._n_containers:
+            container = self._docker_client.containers.run(self._image.id, detach=True, tty=True)
+            snapshot_container(container, self._atmos_directory)
+            self._containers.append(container)
+            self._available.put(container)
+            print("Container '{0}' running.".format(container.name))
+
+    #_________________________________________________________________________
+    @property
+    def containers(self):
+        return list(self._containers)
+
+    #_________________________________________________________________________
+    def acquire(self, timeout=None):
+        '''
+        Take a container out of the pool, waits until one is available
+        Args:
+            timeout: float (optional), seconds to wait for. Raises queue.Empty on timeout
+        Returns:
+            docker container
+        '''
+        if not self._containers:
+            self.start()
+        return self._available.get(timeout=timeout)
+
+    #_________________________________________________________________________
+    def release(self, container):
+        '''
+        Reset a container and give it back to the pool
+        '''
+        reset_container(container, self._atmos_directory)
+        self._available.put(container)
+
+    #_________________________________________________________________________
+    @contextlib.contextmanager
+    def container(self, timeout=None):
+        '''
+        Borrow a container for the duration of a with block:
+            with pool.container() as container:
+                simulation = pyatmos.Simulation(docker_image=image, docker_container=container)
+        '''
+        container = self.acquire(timeout)
+        try:
+            yield container
+        finally:
+            self.release(container)
+
+    #_________________________________________________________________________
+    def __enter__(self):
+        self.start()
+        return self
+
+    #_________________________________________________________________________
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    #_________________________________________________________________________
+    def close(self):
+        for container in self._containers:
+            print('Container {0} killed.'.format(container.name))
+            try:
+                container.kill()
+            except docker.errors.APIError:
+                pass
+        self._containers = []
+        self._available = queue.Queue()
@@ -0,0 +1,264 @@
+import os
+import json
+
+import pyatmos
+
+# Parsed tables kept in an ensemble store by default, see pyatmos.result.TABLES
+TABLES = ['parsed_photochem_mixing_ratios', 'parsed_photochem_fluxes', 'parsed_clima_final']
+
+# Version of the layout of the store, change it when the layout changes
+STORE_VERSION = 1
+
+_META_FILE = 'meta.json'
+_RUN_IDS_FILE = 'run_ids.txt'
+
+
+#_________________________________________________________________________
+class EnsembleStore():
+    def __init__(self, directory, tables=TABLES):
+        '''
+        The parsed tables of many runs in one directory, as arrays of (runs x altitude levels) for every column (species, T, P, ALT, ...).
+        Every column of every table is a file of float64 values, the profile of each run one after the other, so that the profiles
+        of one species across the whole ensemble are a single contiguous, memory-mapped read. New runs are appended at the end of the files.
+        meta.json holds the number of runs and the columns of the tables. It is replaced atomically after the values of the new runs
+        are written, so a store interrupted while appending keeps the runs it had, the incomplete values are overwritten by the next append.
+        A store is written by one process at a time, it can be read by any number of processes.
+        Runs with fewer altitude levels than the first run of a table are padded with NaN, as are the columns a run does not have
+        directory: string, directory of the store, created if needed
+        tables: list of the parsed tables appended from each run (see pyatmos.result.TABLES)
+        '''
+        self._directory = directory
+        self._tables = list(tables)
+        self._run_ids = None
+        self._positions = None
+        os.makedirs(directory, exist_ok=True)
+        self._meta = self._read_meta()
+
+    #_________________________________________________________________________
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self._directory, _META_FILE), 'r') as file:
+                meta = json.load(file)
+        except IOError:
+            return {'version' : STORE_VERSION, 'n_runs' : 0, 'run_ids_size' : 0, 'tables' : {}}
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError('ensemble store {0} has version {1}, expected {2}'.format(self._directory, meta.get('version'), STORE_VERSION))
+        return meta
+
+    #_________________________________________________________________________
+    def _write_meta(self, meta):
+        file_name = os.path.join(self._directory, _META_FILE)
+        tmp_file_name = '{0}.tmp_{1}'.format(file_name, os.getpid())
+        with open(tmp_file_name, 'w') as file:
+            json.dump(meta, file)
+        os.replace(tmp_file_name, file_name)
+        self._meta = meta
+
+    #_________________________________________________________________________
+    def _column_file(self, table, position):
+        return os.path.join(self._directory, table, 'column_{0}.f64'.format(position))
+
+    #_________________________________________________________________________
+    def __len__(self):
+        return self._meta['n_runs']
+
+    #_________________________________________________________________________
+    def __contains__(self, run_id):
+        return run_id in self._run_positions()
+
+    #_________________________________________________________________________
+    @property
+    def run_ids(self):
+        '''
+        list of the ids of the runs, in the order they were appended
+        '''
+        if self._run_ids is None:
+            with open(os.path.join(self._directory, _RUN_IDS_FILE), 'rb') as file:
+                data = file.read(self._meta['run_ids_size'])
+            self._run_ids = [json.loads(line) for line in data.decode().splitlines()]
+        return self._run_ids
+
+    #_________________________________________________________________________
+    def _run_positions(self):
+        if self._meta['n_runs'] == 0:
+            return {}
+        if self._positions is None:
+            self._positions = { run_id : position for position, run_id in enumerate(self.run_ids) }
+        return self._positions
+
+    #_________________________________________________________________________
+    @property
+    def tables(self):
+        '''
+        list of the tables held by the store
+        '''
+        return sorted(self._meta['tables'])
+
+    #_________________________________________________________________________
+    def columns(self, table):
+        '''
+        Returns:
+            list of the columns of a table (see pyatmos.tables.columnar for the names of repeated columns, e.g. 'Z.1')
+        '''
+        return list(self._meta['tables'][table]['columns'])
+
+    #_________________________________________________________________________
+    def n_levels(self, table):
+        '''
+        Returns:
+            int, number of altitude levels of a table
+        '''
+        return self._meta['tables'][table]['n_levels']
+
+    #_________________________________________________________________________
+    def _run_tables(self, run):
+        '''
+        The tables of a run to append
+        Args:
+            run: pyatmos.result.RunResult, output directory of a run, or dictionary of { 'table' : dataframe }
+        Returns:
+            dictionary of { 'table' : (list of columns, float64 array of (levels, columns)) } of the tables of self._tables the run has
+        '''
+        import numpy as np
+        if isinstance(run, dict):
+            tables = run
+        else:
+            if not isinstance(run, pyatmos.result.RunResult):
+                run = pyatmos.result.RunResult('', run)
+            tables = {}
+            for table in self._tables:
+                try:
+                    tables[table] = run.table(table)
+                except (IOError, OSError):
+                    # e.g. clima did not run
+                    continue
+        run_tables = {}
+        for table in self._tables:
+            if tables.get(table) is None:
+                continue
+            df = tables[table]
+            # without the index column of the csv files
+            keep = [not str(column).startswith('Unnamed:') for column in df.columns]
+            columns = [column for column, kept in zip(pyatmos.tables.unique_columns(df.columns), keep) if kept]
+            run_tables[table] = (columns, np.asarray(df.to_numpy(dtype=np.float64)[:, keep]))
+        return run_tables
+
+    #_________________________________________________________________________
+    def append(self, run_id, run):
+        '''
+        Append a run to the store
+        Args:
+            run_id: string or int, id of the run, must not be in the store yet
+            run: pyatmos.result.RunResult, output directory of a run, or dictionary of { 'table' : dataframe }
+        '''
+        self.extend([(run_id, run)])
+
+    #_________________________________________________________________________
+    def extend(self, runs):
+        '''
+        Append several runs to the store, every file of the store is opened once for all of them
+        Args:
+            runs: iterable of (run_id, run), see append()
+        '''
+        import numpy as np
+        runs = [(run_id, self._run_tables(run)) for run_id, run in runs]
+        if len(runs) == 0:
+            return
+
+        positions = self._run_positions()
+        run_ids = [run_id for run_id, _ in runs]
+        new_run_ids = set()
+        for run_id in run_ids:
+            if run_id in positions or run_id in new_run_ids:
+                raise ValueError('run {0} is already in the ensemble store {1}'.format(run_id, self._directory))
+            new_run_ids.add(run_id)
+
+        meta = json.loads(json.dumps(self._meta))
+        n_runs = meta['n_runs']
+        for table in self._tables:
+            frames = [run_tables.get(table) for _, run_tables in runs]
+            if all(frame is None for frame in frames):
+                continue
+            schema = meta['tables'].setdefault(table, {'n_levels' : max(len(frame[1]) for frame in frames if frame is not None), 'columns' : []})
+            known_columns = set(schema['columns'])
+            for run_id, frame in zip(run_ids, frames):
+                if frame is None:
+                    continue
+                columns, values = frame
+                if len(values) > schema['n_levels']:
+                    raise ValueError('run {0} has {1} levels in {2}, the ensemble store has {3}'.format(run_id, len(values), table, schema['n_levels']))
+                for column in columns:
+                    if column not in known_columns:
+                        schema['columns'].append(column)
+                        known_columns.add(column)
+
+        # the values, after the runs already in the store (anything after them is left over from an interrupted append)
+        for table, schema in meta['tables'].items():
+            os.makedirs(os.path.join(self._directory, table), exist_ok=True)
+            n_levels = schema['n_levels']
+            column_positions = { column : position for position, column in enumerate(schema['columns']) }
+            values = np.full((len(schema['columns']), len(runs), n_levels), np.nan)
+            for i, (_, run_tables) in enumerate(runs):
+                frame = run_tables.get(table)
+                if frame is not None:
+                    columns, run_values = frame
+                    values[[column_positions[column] for column in columns], i, :len(run_values)] = run_values.T
+            for position in range(len(schema['columns'])):
+                with open(self._column_file(table, position), 'ab') as file:
+                    size = os.fstat(file.fileno()).st_size
+                    if size > n_runs*n_levels*8:
+                        file.truncate(n_runs*n_levels*8)
+                    elif size < n_runs*n_levels*8:
+                        # new column, NaN for the runs already in the store
+                        np.full((n_runs*n_levels - size//8), np.nan).tofile(file)
+                    values[position].tofile(file)
+
+        with open(os.path.join(self._directory, _RUN_IDS_FILE), 'ab') as file:
+            file.truncate(meta['run_ids_size'])
+            file.write(''.join(json.dumps(run_id)+'\n' for run_id in run_ids).encode())
+            meta['run_ids_size'] = file.tell()
+        meta['n_runs'] = n_runs + len(runs)
+        self._write_meta(meta)
+
+        if self._run_ids is not None:
+            self._run_ids += run_ids
+        self._positions = None
+
+    #_________________________________________________________________________
+    def load(self, table, column, runs=None, levels=None):
+        '''
+        Profiles of a column across the ensemble
+        Args:
+            table: string, one of tables
+            column: string, one of columns(table), e.g. 'O3' or 'T'
+            runs: list of run ids (optional), defaults to all the runs, in the order they were appended
+            levels: slice or list of ints (optional), the altitude levels to take, defaults to all of them
+        Returns:
+            numpy array of shape (runs, levels). Without runs, it is read-only and memory-mapped
+        '''
+        import numpy as np
+        schema = self._meta['tables'][table]
+        n_runs, n_levels = self._meta['n_runs'], schema['n_levels']
+        if n_runs == 0:
+            values = np.zeros((0, n_levels))
+        else:
+            values = np.memmap(self._column_file(table, schema['columns'].index(column)), dtype=np.float64, mode='r', shape=(n_runs, n_levels))
+        if runs is not None:
+            positions = self._run_positions()
+            values = values[[positions[run_id] for run_id in runs]]
+        if levels is not None:
+            values = values[:, levels]
+        return values
+
+    #_________________________________________________________________________
+    def frame(self, table, run_id):
+        '''
+        Table of one run, as it was appended
+        Returns:
+            pandas dataframe, without the levels the run did not have
+        '''
+        import numpy as np
+        import pandas as pd
+        position = self._run_positions()[run_id]
+        df = pd.DataFrame({ column : np.array(self.load(table, column)[position]) for column in self.columns(table) }, columns=self.columns(table))
+        return df.dropna(how='all').reset_index(drop=True)
@@ -0,0 +1,145 @@
+import os
+import json
+import hashlib
+
+import pyatmos
+
+# Statuses of runs that did not finish properly (crashed, killed at their resource limits or cancelled), 
+# these runs are made again when a sweep is resumed
+RETRIED_STATUSES = ['error', 'photochem_error', 'photochem_timeout', 'clima_timeout', 'clima_cancelled', None]
+
+
+#_________________________________________________________________________
+def spec_key(spec):
+    '''
+    Identifier of a run spec (see SimulationPool.imap), run_id is left out
+    '''
+    spec = dict(spec)
+    spec.pop('run_id', None)
+    spec.setdefault('method', 'run')
+    return pyatmos.cache.ResultCache.key(spec)
+
+
+#_________________________________________________________________________
+def hash_file(path):
+    '''
+    sha256 of a file, read in chunks
+    '''
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024*1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+#_________________________________________________________________________
+def hash_artifacts(output_directory):
+    '''
+    Hash the files of the output directory of a run
+    Returns:
+        dictionary of { 'file name' : { 'sha256' : ..., 'size' : ... } }
+    '''
+    artifacts = {}
+    if output_directory is None or not os.path.isdir(output_directory):
+        return artifacts
+    for file_name in sorted(os.listdir(output_directory)):
+        path = os.path.join(output_directory, file_name)
+        if os.path.isfile(path):
+            artifacts[file_name] = {'sha256' : hash_file(path), 'size' : os.path.getsize(path)}
+    return artifacts
+
+
+#_________________________________________________________________________
+class SweepJournal():
+    def __init__(self, journal_file, verify='size', retried_statuses=None):
+        '''
+        Append-only journal of the runs of a sweep, so that a sweep that was interrupted can be resumed where it stopped.
+        Every finished run is recorded as one json line with its spec, status, timings and the hashes of its output files.
+        Lines are flushed and synced to disk one by one, a line cut short by a crash is ignored when the journal is read.
+        journal_file: string, path of the journal (created if needed)
+        verify: string or None, how the output files of a recorded run are checked before the run is considered complete:
+                'hash' (sha256 of every file), 'size' (the files exist and have the recorded size) or None (no check)
+        retried_statuses: list (optional), statuses of the recorded runs that are made again, RETRIED_STATUSES by default. 
+                          e.g. add 'photochem_nonconverged' to retry the runs that did not converge with more iterations
+        '''
+        self._journal_file = journal_file
+        self._verify       = verify
+        self._retried      = RETRIED_STATUSES if retried_statuses is None else retried_statuses
+        self._records      = {}
+        self._offset       = 0
+
+    #_________________________________________________________________________
+    def _load(self):
+        '''
+        Read the records appended to the journal since the last call
+        '''
+        if not os.path.exists(self._journal_file):
+            return
+        with open(self._journal_file, 'rb') as file:
+            file.seek(self._offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                self._offset += len(line)
+                try:
+                    record = json.loads(line.decode())
+                except ValueError:
+                    continue
+                self._records[record['key']] = record
+
+    #_________________________________________________________________________
+    @property
+    def records(self):
+        self._load()
+        return list(self._records.values())
+
+    #_________________________________________________________________________
+    def record(self, spec, result, artifacts=None):
+        '''
+        Append a finished run to the journal
+        Args:
+            spec: dictionary, run spec (see SimulationPool.imap)
+            result: dictionary, result of the run (see SimulationPool.imap)
+            artifacts: dictionary (optional), see hash_artifacts(). Computed from the output directory of the run if not given
+        Returns:
+            the record written
+        '''
+        if artifacts is None:
+            artifacts = hash_artifacts(spec.get('output_directory'))
+        record = {
+                'key' : spec_key(spec),
+                'spec' : spec,
+                'result' : result,
+                'artifacts' : artifacts,
+                'time' : pyatmos.util.UTC_now(),
+                }
+        pyatmos.util.append_line(self._journal_file, json.dumps(record, sort_keys=True, default=str)+'\n', sync=True)
+        return record
+
+    #_________________________________________________________________________
+    def _artifacts_valid(self, record):
+        output_directory = record['spec'].get('output_directory')
+        for file_name, artifact in record['artifacts'].items():
+            path = os.path.join(output_directory, file_name)
+            if not os.path.isfile(path):
+                return False
+            if self._verify == 'size' and os.path.getsize(path) != artifact['size']:
+                return False
+            if self._verify == 'hash' and hash_file(path) != artifact['sha256']:
+                return False
+        return True
+
+    #_________________________________________________________________________
+    def completed(self, spec):
+        '''
+        Look up a run spec in the journal
+        Returns:
+            the record of the run if it finished properly and its output files are still valid, None otherwise
+        '''
+        self._load()
+        record = self._records.get(spec_key(spec))
+        if record is None or record['result'].get('status') in self._retried:
+            return None
+        if self._verify is not None and not self._artifacts_valid(record):
+            return None
+        return record
@@ -36,35 +36,46 @@ def speciesfile_to_df(species_filename):
         longlived_df contains the long-lived species
         other_df contains the other species
     '''
+    with open(species_filename, 'r') as file:
+        return species_lines_to_df(file.readlines())
+
+#_____________________________________________________________________________
+def species_lines_to_df(lines):
+    '''
+    Same as speciesfile_to_df, for the content of a species.dat file already held in memory
+    Args:
+        lines: list of strings, the lines of the species.dat file
+    Returns:
+        longlived_df, other_df (see speciesfile_to_df)
+    '''
     import pandas as pd
     pd.options.mode.chained_assignment = None  # default='warn' 
     counter = 0
     data = []
     columns = []
-    with open(species_filename, 'r') as file:
-        for line in file.readlines():
-            line = line.rstrip('\n\r')
-            line = ' '.join(line.split())
-
-            # strip away "!*" 
-            if '!' in line:
-                line = line.split('!')[0]
-
-            # deal with the column headings
-            if 'LONG-LIVED' in line:
-
-                columns = line.replace('*','')
-                columns = 'order species' + columns
-                columns = columns.split()
-
-            # deal with the rows
-            if not line.startswith('*'):
-                
-                if len(line)>0:
-                    line = str(counter)+ ' ' + line
-                    counter +=1 # keep track of order (may be important!)
-                    data.append(line.split())
-                
+    for line in lines:
+        line = line.rstrip('\n\r')
+        line = ' '.join(line.split())
+
+        # strip away "!*" 
+        if '!' in line:
+            line = line.split('!')[0]
+
+        # deal with the column headings
+        if 'LONG-LIVED' in line:
+
+            columns = line.replace('*','')
+            columns = 'order species' + columns
+            columns = columns.split()
+
+        # deal with the rows
+        if not line.startswith('*'):
+            
+            if len(line)>0:
+                line = str(counter)+ ' ' + line
+                counter +=1 # keep track of order (may be important!)
+                data.append(line.split())
+            
     # Create the dataframe            
     df = pd.DataFrame(data=data, columns=columns)
                 
@@ -0,0 +1,288 @@
+import os
+import time
+
+import pyatmos
+
+#_____________________________________________________________________________
+def parse_photochem_iteration_line(line):
+    '''
+    Parse an iteration line of photochem, for example
+        N =    120   EMAX = 1.000E-04 FOR SPECIES O3    AT Z =  1   TIME = 1.0E+05
+    Args:
+        line: string
+    Returns:
+        (iteration, emax) as (int, float), or None if the line is not an iteration line
+    '''
+    if not ('N =' in line and 'EMAX' in line):
+        return None
+    info = line.split()
+    try:
+        iteration = int(info[2])
+        emax = float(info[info.index('EMAX')+2])
+    except (ValueError, IndexError):
+        return None
+    return iteration, emax
+
+
+#_____________________________________________________________________________
+class EmaxGrowthRule():
+    def __init__(self, max_growth=1e6, min_iterations=100):
+        '''
+        Divergence rule for PhotochemMonitor: photochem is considered diverged once EMAX has grown by more than
+        max_growth relative to the smallest EMAX seen so far
+        max_growth: float, allowed ratio between the current and the smallest EMAX
+        min_iterations: int, the rule is not applied before this many iterations
+        '''
+        self.max_growth = max_growth
+        self.min_iterations = min_iterations
+
+    def __call__(self, iteration, emax, history):
+        if iteration < self.min_iterations:
+            return False
+        smallest = min([e for _, e in history])
+        return smallest > 0 and emax/smallest > self.max_growth
+
+
+#_____________________________________________________________________________
+class PhotochemMonitor():
+    def __init__(self, max_iterations, divergence_rule=None):
+        '''
+        Follows the output of a running photochem, line by line, and decides when to abort it
+        max_iterations: int, photochem is aborted as soon as it reaches this many iterations (it can no longer converge)
+        divergence_rule: callable (optional), called as divergence_rule(iteration, emax, history) for every iteration,
+                         where history is the list of (iteration, emax) seen so far. Photochem is aborted if it returns True.
+                         Must be picklable (e.g. a module level function or EmaxGrowthRule) to be used with SimulationPool
+        '''
+        self.max_iterations = max_iterations
+        self.divergence_rule = divergence_rule
+        self.history = []
+        self.status = None
+
+    @property
+    def iteration(self):
+        if self.history:
+            return self.history[-1][0]
+        return None
+
+    @property
+    def emax(self):
+        if self.history:
+            return self.history[-1][1]
+        return None
+
+    def update(self, line):
+        '''
+        Feed a line of output
+        Returns:
+            None to carry on, or the status of the run if photochem must be aborted
+            ('photochem_nonconverged' or 'photochem_diverged')
+        '''
+        parsed = parse_photochem_iteration_line(line)
+        if parsed is None:
+            return None
+        iteration, emax = parsed
+        self.history.append(parsed)
+
+        if iteration >= self.max_iterations:
+            self.status = 'photochem_nonconverged'
+        elif self.divergence_rule is not None and self.divergence_rule(iteration, emax, self.history):
+            self.status = 'photochem_diverged'
+        return self.status
+
+
+#_____________________________________________________________________________
+class ClimaMonitor():
+    def __init__(self, max_steps, divfrms_tolerance=1e-5, dt_tolerance=1e-3, n_steps=5):
+        '''
+        Follows the output of a running clima, step by step, and decides when it has settled.
+        Clima is considered converged once DIVFrms < divfrms_tolerance and |DT(ND)| < dt_tolerance for n_steps consecutive steps.
+        Clima only writes its final tables once it has done all of its NSTEPS, so a clima that is stopped early has to be run 
+        again with NSTEPS set to the converged step (see Simulation._run_clima). The monitor therefore only asks for a stop 
+        when that is cheaper than letting clima finish, i.e. when converged before max_steps/2.
+        Simulation._run_clima feeds it the steps clima writes to clima_allout.tab (through a ClimaTail), the same lines pyatmos.parser.parse_clima reads from it
+        max_steps: int, NSTEPS clima was started with
+        divfrms_tolerance: float, tolerance on DIVFrms (the rms flux divergence)
+        dt_tolerance: float, tolerance on the absolute value of DT(ND) (the change of the surface temperature)
+        n_steps: int, number of consecutive steps the tolerances must be met for
+        '''
+        self.max_steps = max_steps
+        self.divfrms_tolerance = divfrms_tolerance
+        self.dt_tolerance = dt_tolerance
+        self.n_steps = n_steps
+        self.records = []
+        self.converged_step = None
+        self.status = None
+        self._n_settled = 0
+
+    @property
+    def step(self):
+        if self.records:
+            return int(self.records[-1]['NST'])
+        return None
+
+    def update(self, line):
+        '''
+        Feed a line of output
+        Returns:
+            None to carry on, or 'clima_converged' if clima should be stopped
+        '''
+        try:
+            record = pyatmos.parser.parse_clima_iteration_line(line)
+        except (ValueError, IndexError):
+            return None
+        if record is None:
+            return None
+        return self.update_record(record)
+
+    def update_record(self, record):
+        '''
+        Feed a parsed step record (see pyatmos.parser.parse_clima_iteration_line)
+        Returns:
+            None to carry on, or 'clima_converged' if clima should be stopped
+        '''
+        self.records.append(record)
+        if record['DIVFrms'] < self.divfrms_tolerance and abs(record['DT(ND)']) < self.dt_tolerance:
+            self._n_settled += 1
+        else:
+            self._n_settled = 0
+
+        if self._n_settled >= self.n_steps and self.converged_step is None:
+            self.converged_step = int(record['NST'])
+            if 2*self.converged_step < self.max_steps:
+                self.status = 'clima_converged'
+        return self.status
+
+
+#_____________________________________________________________________________
+class ClimaTail():
+    def __init__(self, file_name=None, callback=None, monitor=None, read=None):
+        '''
+        Parses the steps of a running clima incrementally, and publishes every step record (NST, JCONV, CHG, DIVFrms, DT(ND), T(ND), ...,
+        see pyatmos.parser.parse_clima_iteration_line) as soon as its line is complete. No byte is read or parsed twice.
+        The lines come either from clima_allout.tab, read from the offset reached so far (poll(), follow(), this is how Simulation._run_clima 
+        follows clima, in local and in docker mode), or from any other stream of lines, through update() and feed()
+        file_name: string (optional), path of the clima_allout.tab to follow with poll()
+        callback: callable (optional), called with every step record. Clima is cancelled (status 'clima_cancelled') if it returns True
+        monitor: ClimaMonitor (optional), also fed every step record, clima is stopped when it asks for it
+        read: callable (optional), called with an offset, returns the bytes of file_name from that offset (empty if the file does not exist).
+              To follow a file that is not on this machine, e.g. inside a docker container
+        '''
+        self.file_name = file_name
+        self.callback = callback
+        self.monitor = monitor
+        self.read = read
+        self.offset = 0
+        self.records = []
+        self.status = None
+        self._partial = b''
+
+    @property
+    def step(self):
+        if self.records:
+            return int(self.records[-1]['NST'])
+        return None
+
+    def update(self, line):
+        '''
+        Feed a complete line of output
+        Returns:
+            None to carry on, 'clima_cancelled' if the callback asked to cancel clima, or the status of the monitor if it asked to stop clima
+        '''
+        try:
+            record = pyatmos.parser.parse_clima_iteration_line(line)
+        except (ValueError, IndexError):
+            return None
+        if record is None:
+            return None
+        self.records.append(record)
+        if self.callback is not None and self.callback(record) and self.status is None:
+            self.status = 'clima_cancelled'
+        if self.monitor is not None and self.status is None:
+            self.status = self.monitor.update_record(record)
+        return self.status
+
+    def feed(self, data):
+        '''
+        Feed a chunk of output, split at an arbitrary position. The incomplete last line is kept until the rest of it comes in
+        Args:
+            data: bytes or string
+        Returns:
+            list of the records of the steps completed by data
+        '''
+        if not isinstance(data, bytes):
+            data = data.encode()
+        lines = (self._partial+data).split(b'\n')
+        self._partial = lines.pop()
+        n_records = len(self.records)
+        for line in lines:
+            self.update(line.decode(errors='replace')+'\n')
+        return self.records[n_records:]
+
+    def poll(self):
+        '''
+        Read what clima has appended to file_name since the last poll
+        Returns:
+            list of the new step records
+        '''
+        if self.read is not None:
+            data = self.read(self.offset)
+            self.offset += len(data)
+            return self.feed(data)
+        try:
+            with open(self.file_name, 'rb') as file:
+                if os.fstat(file.fileno()).st_size < self.offset:
+                    # clima was started again and truncated the file
+                    self.offset = 0
+                    self._partial = b''
+                file.seek(self.offset)
+                data = file.read()
+        except (IOError, OSError):
+            # clima has not created it yet
+            return []
+        self.offset += len(data)
+        return self.feed(data)
+
+    def follow(self, stop=None, interval=1.0):
+        '''
+        Follow file_name while clima runs
+        Args:
+            stop: threading.Event (optional), following stops (after a last poll) once it is set. Without it, follow until the run is cancelled or stopped
+            interval: float, seconds between two polls
+        Yields:
+            step records, as they are written
+        '''
+        while True:
+            done = (stop is not None and stop.is_set()) or self.status is not None
+            for record in self.poll():
+                yield record
+            if done:
+                return
+            time.sleep(interval)
+
+
+#_____________________________________________________________________________
+def coupling_converged(previous, current, temperature_tolerance=0.1, pressure_tolerance=1e-3, mixing_ratio_tolerance=1e-2):
+    '''
+    Decide whether two consecutive iterations of coupled photochem and clima agree, see Simulation.run_coupled
+    Args:
+        previous, current: dictionaries of the state at the end of an iteration, formatted as
+                           { 'T' : surface temperature [K], 'P' : surface pressure [bar], 'mixing_ratios' : { 'species' : surface mixing ratio } }
+        temperature_tolerance: float, maximum absolute change of the surface temperature [K]
+        pressure_tolerance: float, maximum relative change of the surface pressure
+        mixing_ratio_tolerance: float, maximum relative change of the surface mixing ratios
+    Returns:
+        bool
+    '''
+    if previous is None:
+        return False
+    if abs(current['T'] - previous['T']) > temperature_tolerance:
+        return False
+    if abs(current['P'] - previous['P']) > pressure_tolerance*abs(previous['P']):
+        return False
+    for species, mixing_ratio in current['mixing_ratios'].items():
+        previous_mixing_ratio = previous['mixing_ratios'].get(species)
+        if previous_mixing_ratio is None:
+            return False
+        if abs(mixing_ratio - previous_mixing_ratio) > mixing_ratio_tolerance*abs(previous_mixing_ratio):
+            return False
+    return True
@@ -1,147 +1,149 @@
+import warnings
+import contextlib
 
-#_____________________________________________________________________________
-def parse_photochem(input_file, output_directory, debug):
-
-    ph_file = open(input_file, 'r')
+import pyatmos
 
-    flux_tables = [] 
-    all_tables = [] 
-
-    capture_flux = False 
-    mixing_ratio_line_number = 0 
-    line_number = 0
-    for line in ph_file:
-        line_number += 1 
+#_____________________________________________________________________________
+# Lines of the out.out file of photochem that open and close its sections
+PHOTOCHEM_FLUXES_START = 'FLUXES OF LONG-LIVED SPECIES'
+PHOTOCHEM_FLUXES_END = 'AQUEOUS PHASE SPECIES'
+PHOTOCHEM_MIXING_RATIOS_START = 'MIXING RATIOS OF LONG-LIVED SPECIES'
+PHOTOCHEM_MIXING_RATIOS_END = 'OZONE COLUMN DEPTH'
 
-        '''
-        Note to reader, one could capture _all_ tables using Z as the start/stop condition.
-        (one would have to be careful)
-        '''
+#_____________________________________________________________________________
+def _is_table_header(line, tokens):
+    '''
+    Whether a line starts a table of mixing ratios: one of its columns (but the last) is Z
+    '''
+    return 'Z' in line and 'Z,' in ','.join(tokens)
 
-        # prepare line for CSV 
-        info = line.rstrip('\n\r')
-        info = info.split()
-        info = ','.join(info)
+#_____________________________________________________________________________
+def iterate_photochem_tables(lines):
+    '''
+    Reads the out.out file of photochem in a single pass, and yields its tables as soon as they are complete.
+    Only the table being read is held in memory.
+    Two state machines follow the lines:
+        fluxes: 'outside' until PHOTOCHEM_FLUXES_START, then 'inside' until PHOTOCHEM_FLUXES_END. Inside, every line with a Z starts a new table
+        mixing ratios: every PHOTOCHEM_MIXING_RATIOS_START opens a new block, that is read until PHOTOCHEM_MIXING_RATIOS_END.
+                       A line with a Z column starts a new table, the 'TP, TL' line and the two lines after it are skipped
+    Photochem prints its mixing ratios several times, the tables of the last block are the final ones
+    Args:
+        lines: iterable of strings, e.g. the opened out.out file
+    Yields:
+        (kind, block, table): kind is 'fluxes' or 'mixing_ratios', block is the number of mixing ratio blocks opened so far, 
+        table is a list of rows (lists of strings), the first row holds the column names
+    '''
+    flux_state  = 'outside'
+    flux_table  = None
 
-        ###################
-        # Simply capture all tables (may be poorly formatted) 
-        ###################
-        if len(info) > 0:
-            if 'Z,' in info:
-                try:
-                    if len(this_all_table) > 0:
-                        all_tables.append(this_all_table)
-                        this_all_table = []
-                except UnboundLocalError:
-                    this_all_table = []
-                this_all_table.append(info)
+    block       = 0
+    mix_state   = 'reading' # 'reading' the lines of a block, 'capturing' the rows of a table, or 'done' once the block is closed
+    mix_table   = None
+    tptl_line_number = None
 
+    for line_number, line in enumerate(lines):
+        tokens = line.split()
 
         ###################
-        # Capture flux tables
+        # fluxes
         ###################
-        if 'FLUXES OF LONG-LIVED SPECIES' in line:
-            capture_flux = True
-            continue # skip this line
-
-
-        if capture_flux:
-            if len(info) > 0:
-                if 'Z' in info: # start condition for new table 
-                    try: 
-                        if len(this_flux_table) > 0:
-                            flux_tables.append(this_flux_table)
-                            this_flux_table = [] # clear it 
-                    except UnboundLocalError: # create the first table 
-                        this_flux_table = [] 
-
-                if not 'AQUEOUS PHASE SPECIES' in line:
-                    this_flux_table.append(info.split(','))
-                
-                if 'AQUEOUS PHASE SPECIES' in line:
-                    flux_tables.append(this_flux_table)
-
-        # stop condition 
-        if 'AQUEOUS PHASE SPECIES' in line:
-            capture_flux = False 
-
+        if PHOTOCHEM_FLUXES_START in line:
+            flux_state = 'inside'
+        elif flux_state == 'inside' and tokens:
+            if 'Z' in line:
+                if flux_table:
+                    yield 'fluxes', block, flux_table
+                flux_table = []
+            if PHOTOCHEM_FLUXES_END in line:
+                if flux_table:
+                    yield 'fluxes', block, flux_table
+                flux_table = None
+                flux_state = 'outside'
+            elif flux_table is not None:
+                flux_table.append(tokens)
 
         ###################
-        # get line number of last 'mixing ratios' 
+        # mixing ratios
         ###################
-        if 'MIXING RATIOS OF LONG-LIVED SPECIES' in line:
-            mixing_ratio_line_number = line_number 
-
-    ph_file.close()
+        if PHOTOCHEM_MIXING_RATIOS_START in line:
+            block += 1
+            mix_state = 'reading'
+            mix_table = None
+            tptl_line_number = None
+        if mix_state == 'done':
+            continue
+
+        if tokens:
+            if _is_table_header(line, tokens) or PHOTOCHEM_MIXING_RATIOS_END in line:
+                if mix_table:
+                    yield 'mixing_ratios', block, mix_table
+                mix_table = []
+                mix_state = 'capturing'
+
+            # skip 'TP, TL' and the two lines after it
+            if 'TP, TL' in line:
+                tptl_line_number = line_number
+                mix_state = 'reading'
+            if tptl_line_number is not None and line_number - tptl_line_number <= 2:
+                continue
+
+            if mix_state == 'capturing' and mix_table is not None:
+                mix_table.append(tokens)
+
+        if PHOTOCHEM_MIXING_RATIOS_START in line:
+            mix_state = 'capturing'
+        if PHOTOCHEM_MIXING_RATIOS_END in line:
+            mix_state = 'done'
 
-    ###################
-    # parse mixing ratios
-    ###################
-
-    # open file again and re-read
-    ph_file = open(input_file, 'r')
-    line_number = 0
-    capture_mixratio = False 
-    tptl_line_number = -999 
+#_____________________________________________________________________________
+def parse_photochem(input_file, output_directory, debug, output_format='csv'):
+    '''
+    Parse the out.out file of photochem, and write its flux and (final) mixing ratio tables to 
+    parsed_photochem_fluxes and parsed_photochem_mixing_ratios (read them with pyatmos.tables.read_table)
+    Args:
+        input_file: string, path to the out.out file
+        output_directory: string, path to the directory to store the results
+        debug: bool, turn on/off debug mode
+        output_format: string, format of the tables, see pyatmos.tables.FORMATS. None to only return the tables
+    Returns:
+        dictionary of { 'parsed_photochem_fluxes' : dataframe, 'parsed_photochem_mixing_ratios' : dataframe }, see pyatmos.tables.columnar
+    '''
+    flux_tables = []
     mix_tables = []
-    for line in ph_file:
-        line_number += 1
-
-        # start 
-        if line_number >= mixing_ratio_line_number:
-
-            # prepare line for CSV 
-            info = line.rstrip('\n\r')
-            info = info.split()
-            info = ','.join(info)
-
-            if len(info) > 0:
-                if 'Z,' in info or 'OZONE COLUMN DEPTH' in line: # start condition for new table
-                    capture_mixratio = True
-                    try:
-                        if len(this_mix_table) > 0:
-                            mix_tables.append(this_mix_table)
-                            this_mix_table = [] 
-                    except UnboundLocalError:
-                        this_mix_table = [] 
-
-                # skip next two lines for 'TP, TL'  
-                if 'TP, TL' in line:
-                    tptl_line_number = line_number 
-                    capture_mixratio = False
-                if line_number == tptl_line_number or line_number == tptl_line_number+1 or line_number == tptl_line_number+2:
-                    continue
-
-                if capture_mixratio:
-                    this_mix_table.append(info.split(','))
-
-            # start 
-            if 'MIXING RATIOS OF LONG-LIVED SPECIES' in line:
-                capture_mixratio = True
-
-            # stop 
-            if 'OZONE COLUMN DEPTH' in line:
-                capture_mixratio = False 
-
-            # end
-            if 'OZONE COLUMN DEPTH' in line:
-                break
-
-    ph_file.close()
-
+    mix_block = None
+    with contextlib.ExitStack() as stack:
+        index = stack.enter_context(pyatmos.sections.SectionIndex(input_file))
+        # only the flux sections and the last block of mixing ratios are decoded. The block is read to the end of the file,
+        # iterate_photochem_tables decides where it closes (the closing line is ignored right after 'TP, TL')
+        for kind, block, table in iterate_photochem_tables(index.lines('fluxes', None)):
+            if kind == 'fluxes':
+                flux_tables.append(table)
+        if index.count('mixing_ratios') > 0:
+            mix_lines = index.lines('mixing_ratios', closed=False)
+        else:
+            mix_lines = stack.enter_context(open(input_file, 'r'))
+        for kind, block, table in iterate_photochem_tables(mix_lines):
+            if kind == 'fluxes':
+                continue
+            # a new block of mixing ratios supersedes the previous one
+            if block != mix_block:
+                mix_tables = []
+                mix_block = block
+            mix_tables.append(table)
 
     ########################
-    # concatenate tables, write to output CSV
+    # concatenate tables, write to output files
     ########################
     if debug: print('flux tables: ', len(flux_tables))
     final_flux_table = concatenate_tables(flux_tables)
     if debug: print('mixing ratio tables: ', len(mix_tables))
     final_mix_table = concatenate_tables(mix_tables)
 
-    final_flux_table.to_csv(output_directory+'/parsed_photochem_fluxes.csv')
-    #print('Writing', output_directory+'/parsed_photochem_fluxes.csv')
-    final_mix_table.to_csv(output_directory+'/parsed_photochem_mixing_ratios.csv')
-    #print('Writing', output_directory+'/parsed_photochem_mixing_ratios.csv')
+    tables = {'parsed_photochem_fluxes' : final_flux_table, 'parsed_photochem_mixing_ratios' : final_mix_table}
+    if output_format is not None:
+        for name, table in tables.items():
+            pyatmos.tables.write_table(table, output_directory+'/'+name, output_format)
+    return { name : pyatmos.tables.columnar(table) for name, table in tables.items() }
 
 
 
@@ -206,95 +208,160 @@ def concatenate_tables(tables):
 def table_to_dataframe(table):
     '''
     Convert table into pandas dataframe 
-    Check that the floats can be converted 
     Args:
-        table: list of sub-lists, first sub-list must be columns, second must be floats 
+        table: list of sub-lists, first sub-list must be columns, the others rows of numbers (see fortran_to_float_array)
     '''
     import pandas as pd 
     columns = table[0]
-    data_temp    = table[1:]
-    data = []
-    for d in data_temp:
-        data.append(check_float_conversion(d))
-    df = pd.DataFrame(data=data,columns=columns)
-    return df 
+    data = fortran_to_float_array(table[1:], len(columns))
+    return pd.DataFrame(data=data, columns=columns)
 
+#_____________________________________________________________________________
+def _to_float(token):
+    '''
+    Returns:
+        float value of token, NaN if it is not a number
+    '''
+    try:
+        return float(token)
+    except ValueError:
+        return float('nan')
+
+#_____________________________________________________________________________
+def fortran_to_float_array(block, n_columns=None):
+    '''
+    Convert a block of numbers printed by photochem or clima to floats in one go.
+    Fortran drops the E of three-digit exponents (such as '5.36-102'): a sign that follows a digit or a dot is an exponent,
+    the missing E are put back with array operations over the bytes of the whole block
+    Args:
+        block: string or bytes (rows of numbers separated by whitespace, one row per line), 
+               or list of rows, each a list of strings
+        n_columns: int (optional), minimum number of columns
+    Returns:
+        numpy float64 array of shape (number of rows, number of columns), short rows are padded with NaN,
+        the fields that are not numbers (such as ******* for an overflow) are NaN
     '''
-    #data    = [x.split(',') for x in table[1:]]
-    #columns = table[0].split(',')
-    convert to floats 
     import numpy as np
-    for col in df:
-        df[col]=df[col].astype(np.number)
+    if isinstance(block, str):
+        block = block.encode()
+    if isinstance(block, bytes):
+        widths = [len(line.split()) for line in block.splitlines()]
+        text = block
+    else:
+        widths = [len(row) for row in block]
+        text = '\n'.join(' '.join(row) for row in block).encode()
+    widths = [width for width in widths if width > 0]
+
+    characters = np.frombuffer(text, dtype=np.uint8)
+    previous = characters[:-1]
+    is_sign = (characters[1:] == ord('-')) | (characters[1:] == ord('+'))
+    is_exponent = is_sign & (((previous >= ord('0')) & (previous <= ord('9'))) | (previous == ord('.')))
+    positions = np.flatnonzero(is_exponent) + 1
+    if positions.size > 0:
+        text = np.insert(characters, positions, ord('E')).tobytes()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        values = np.fromstring(text, sep=' ') if widths else np.empty(0)
+    if values.size != sum(widths):
+        # fromstring stops at the first token that is not a number, e.g. the ******* Fortran prints for an overflow
+        values = np.array([_to_float(token) for token in text.decode(errors='replace').split()], dtype=np.float64)
+    n_columns = max(widths + [n_columns or 0])
+    if all(width == n_columns for width in widths):
+        return values.reshape(len(widths), n_columns)
+
+    data = np.full((len(widths), n_columns), np.nan)
+    start = 0
+    for i, width in enumerate(widths):
+        data[i, :width] = values[start:start+width]
+        start += width
+    return data
+
+#_____________________________________________________________________________
+# Quantities printed by clima at every step
+CLIMA_ITERATION_COLUMNS = ['NST', 'JCONV', 'CHG', 'dt0', 'DIVF(1)', 'DIVFrms', 'DT(ND)', 'T(ND)']
+
+#_____________________________________________________________________________
+def parse_clima_iteration_line(line):
+    '''
+    Parse a line printed by clima at every step, such as
+        NST=   4  JCONV=  1  CHG= 2.500E-01  dt0= 1.00E+04  DIVF(1)= 2.500E-03  DIVFrms= 1.000E-04  DT(ND)= 6.250E-02  T(ND)= 2.882E+02
+    Args:
+        line: string
+    Returns:
+        dictionary of { quantity : float } for the quantities in CLIMA_ITERATION_COLUMNS, or None if the line is not a step line
     '''
+    if not 'DIVFrms' in line:
+        return None
+    info = line.split()
+    info = ' '.join(info).replace('= ', '=')
+    info = info.split()
+    return { key : float(info[i].split('=')[-1]) for i, key in enumerate(CLIMA_ITERATION_COLUMNS) }
 
 #_____________________________________________________________________________
-def parse_clima(input_file, output_directory, debug=False):
+def parse_clima(input_file, output_directory, debug=False, output_format='csv'):
     """Parse the clima output file named 'out.out' and turn into a CSV file 
     There are two 'tables' extracted from the 'out.out' file, each of which is bounded 
     by the string 'binding' 
-    Each table is written to a separate csv file
+    Each table is written to a separate file (parsed_clima_initial, parsed_clima_final), 
+    the steps of clima to parsed_clima_iterations, read them with pyatmos.tables.read_table
     Args:
         input_file: string, path to the out.out file
         output_directory: string, path to the directory to store the results
         debug: bool, turn on/off debug mode (default off) 
+        output_format: string, format of the tables, see pyatmos.tables.FORMATS. None to only return the tables
+    Returns:
+        dictionary of { 'parsed_clima_initial' : dataframe, 'parsed_clima_final' : dataframe, 'parsed_clima_iterations' : dataframe }
     """
 
     # Define the "boxing" used in the clima output file
     binding = "J     P         ALT         T        CONVEC       DT          TOLD        FH20       FSAVE        FO3        TCOOL       THEAT"
     
-    cfile = open(input_file, 'r')
-    
-    ofile1 = open(output_directory+'/parsed_clima_initial.csv', 'w')
-    ofile2 = open(output_directory+'/parsed_clima_final.csv', 'w')
-    ofile3 = open(output_directory+'/parsed_clima_iterations.csv', 'w')
-    ofile3.write('NST,JCONV,CHG,dt0,DIVF(1),DIVFrms,DT(ND),T(ND)\n')
-    
-    unused_lines = [] 
+    tables = {'initial' : [], 'final' : []}
+    iterations = []
     capture = False
     n_tables = 0 
-    for line in cfile: 
-
-        # test for box
-        if binding in line:
-            capture = not capture
-            if capture:
-                n_tables += 1 
+    with open(input_file, 'r') as cfile:
+        for line in cfile: 
 
-        # CSV-ify the table 
-        if capture:
-            info = line.split()
+            # test for box
+            if binding in line:
+                capture = not capture
+                if capture:
+                    n_tables += 1 
 
-            if n_tables == 1:
-                ofile1.write( ','.join(info)) 
-                ofile1.write('\n')
-            if n_tables == 2:
-                ofile2.write( ','.join(info)) 
-                ofile2.write('\n')
-
-        # capture lines with DIVFrms in 
-        if 'NST' and 'DIVFrms' in line:
-            info = line.split()
-            info = ' '.join(info).replace('= ', '=')
-            info = info.split()
-
-            new_line = '{0},{1},{2},{3},{4},{5},{6},{7}\n'.format( 
-                                                                         float(info[0].split('=')[-1]), 
-                                                                         float(info[1].split('=')[-1]),
-                                                                         float(info[2].split('=')[-1]),
-                                                                         float(info[3].split('=')[-1]),
-                                                                         float(info[4].split('=')[-1]),
-                                                                         float(info[5].split('=')[-1]),
-                                                                         float(info[6].split('=')[-1]),
-                                                                         float(info[7].split('=')[-1])
-                                                                         )
-            ofile3.write(new_line)
-
-
-
-
-    ofile1.close()
-    ofile2.close()
-    ofile3.close()
+            # split the table into rows
+            if capture:
+                info = line.split()
+
+                if n_tables == 1:
+                    tables['initial'].append(info)
+                if n_tables == 2:
+                    tables['final'].append(info)
+
+            # capture lines with DIVFrms in 
+            record = parse_clima_iteration_line(line)
+            if record is not None:
+                iterations.append(record)
+
+    import pandas as pd
+    dfs = {}
+    for name, rows in tables.items():
+        columns = rows[0] if rows else []
+        dfs['parsed_clima_'+name] = pd.DataFrame(data=fortran_to_float_array(rows[1:], len(columns)), columns=columns)
+    dfs['parsed_clima_iterations'] = pd.DataFrame(data=iterations, columns=CLIMA_ITERATION_COLUMNS)
+
+    if output_format == 'csv':
+        # written as printed by clima
+        for name, rows in tables.items():
+            with open(output_directory+'/parsed_clima_{0}.csv'.format(name), 'w') as ofile:
+                ofile.write(''.join(','.join(info)+'\n' for info in rows))
+        with open(output_directory+'/parsed_clima_iterations.csv', 'w') as ofile:
+            ofile.write(','.join(CLIMA_ITERATION_COLUMNS)+'\n')
+            ofile.write(''.join(','.join([str(record[key]) for key in CLIMA_ITERATION_COLUMNS])+'\n' for record in iterations))
+    elif output_format is not None:
+        for name, df in dfs.items():
+            pyatmos.tables.write_table(df, output_directory+'/'+name, output_format, index=False)
 
     if debug: print('parse_clima finished')
+    return { name : pyatmos.tables.columnar(df) for name, df in dfs.items() }
@@ -2,6 +2,7 @@
 
 from Axis import Axis 
 import pandas as pd 
+import pyatmos
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -14,11 +15,11 @@ def main(input_file):
 
     base_dir = '/Users/Will/Documents/FDL/results/docker_image'
 
-    flux_path = base_dir + '/parsed_photochem_fluxes.csv'
-    mix_path  = base_dir + '/parsed_photochem_mixing_ratios.csv'
+    flux_path = base_dir + '/parsed_photochem_fluxes'
+    mix_path  = base_dir + '/parsed_photochem_mixing_ratios'
 
-    flux_dataframe = pd.read_csv(flux_path)
-    mix_dataframe  = pd.read_csv(mix_path) 
+    flux_dataframe = pyatmos.tables.read_table(flux_path)
+    mix_dataframe  = pyatmos.tables.read_table(mix_path) 
     
     # convert cm to km
     mix_dataframe['Z'] = mix_dataframe['Z']/1e5
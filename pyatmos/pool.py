@@ -0,0 +1,251 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
+import docker
+
+import pyatmos
+
+# Simulation owned by the current worker process, see _initialize_worker()
+_worker_simulation = None
+_worker_container = None
+_worker_atmos_directory = None
+_worker_hash_artifacts = False
+
+
+#_________________________________________________________________________
+def _initialize_worker(simulation_kwargs, workspace_root, container_names, hash_artifacts=False):
+    '''
+    Runs once inside every worker process of the pool.
+    Each worker gets its own Simulation: in docker mode the worker takes one of the warm containers of the pool,
+    in local mode every run is made in its own clone of the atmos tree (see pyatmos.workspace) so that the input files
+    (species.dat, input_clima.dat, in.dist, TempIn.dat) are not shared between runs
+    hash_artifacts: bool, hash the output files of every run for the journal of the pool (see pyatmos.journal)
+    '''
+    global _worker_simulation, _worker_container, _worker_atmos_directory, _worker_hash_artifacts
+
+    _worker_hash_artifacts = hash_artifacts
+
+    simulation_kwargs = dict(simulation_kwargs)
+    if simulation_kwargs.get('code_path') is not None:
+        simulation_kwargs['workspace_directory'] = workspace_root
+    if container_names is not None:
+        _worker_container = docker.from_env().containers.get(container_names.get())
+        _worker_atmos_directory = simulation_kwargs['atmos_directory']
+        simulation_kwargs['docker_container'] = _worker_container
+
+    _worker_simulation = pyatmos.Simulation(**simulation_kwargs)
+    _worker_simulation.start()
+
+
+#_________________________________________________________________________
+def run_spec(simulation, index, spec):
+    '''
+    Runs a single run spec on a Simulation
+    Args:
+        simulation: pyatmos.Simulation, already started
+        index: identifier of the spec, e.g. its position in the list given to the pool
+        spec: dictionary, see SimulationPool.imap
+    Returns:
+        dictionary with the status and outputs of the run
+    '''
+    spec = dict(spec)
+    method = spec.pop('method', 'run')
+    run_id = spec.pop('run_id', index)
+
+    result = {
+            'index' : index,
+            'run_id' : run_id,
+            'method' : method,
+            'output_directory' : spec.get('output_directory'),
+            'status' : None,
+            'metadata' : None,
+            'error' : None,
+            'worker' : os.getpid(),
+            'journaled' : False,
+            }
+
+    start_time = pyatmos.util.UTC_now()
+    try:
+        status = getattr(simulation, method)(**spec)
+        # the parsed tables of a RunResult stay in the worker, only the status is sent back
+        result['status'] = str(status) if isinstance(status, pyatmos.result.RunResult) else status
+        result['metadata'] = simulation.get_metadata()
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = '{0}: {1}'.format(type(e).__name__, e)
+    result['duration'] = pyatmos.util.UTC_now() - start_time
+    return result
+
+
+#_________________________________________________________________________
+def _run_spec(indexed_spec):
+    '''
+    Runs a single run spec on the Simulation of this worker process
+    Args:
+        indexed_spec: tuple of (index, spec), index is the position of the spec in the list given to the pool
+    Returns:
+        dictionary with the status and outputs of the run, see run_spec()
+    '''
+    index, spec = indexed_spec
+    result = run_spec(_worker_simulation, index, spec)
+    if _worker_hash_artifacts:
+        result['artifacts'] = pyatmos.journal.hash_artifacts(result['output_directory'])
+
+    # get the container ready for the next run
+    if _worker_container is not None:
+        pyatmos.container_pool.reset_container(_worker_container, _worker_atmos_directory)
+        _worker_simulation.atmos_restored()
+
+    return result
+
+
+#_________________________________________________________________________
+class SimulationPool():
+    def __init__(self,
+            n_workers=None,
+            docker_image=None,
+            code_path=None,
+            workspace_directory=None,
+            DEBUG=False,
+            atmos_directory = '/code/atmos',
+            pull_image=False,
+            cache=None,
+            solution_index=None,
+            journal=None,
+            limits=None,
+            build_cache=None,
+            output_format='csv',
+            template='ModernEarth',
+            catalog=None):
+        '''
+        Runs many ATMOS jobs concurrently, one job per worker process, each worker with its own copy of atmos
+        n_workers: int (optional), number of concurrent runs. Defaults to the number of cores
+        docker_image: string (optional). If specified, n_workers containers of this image are kept warm (see pyatmos.container_pool)
+                      for as long as the pool is open, every worker runs in one of them. Containers are reset between runs
+        code_path: string (optional). If specified, every run is made in a private clone of this local atmos directory
+        workspace_directory: string (optional), where the per-run clones of atmos are made (local mode only). Defaults to the system temp directory.
+                             Use a directory on the same filesystem as code_path so that the clones can hardlink the read-only files
+        DEBUG: bool, if set to true, extra debug messages are printed
+        pull_image: bool, if True always pull docker_image, otherwise it is only pulled if it is not available locally
+        cache: pyatmos.cache.ResultCache (optional), shared by all the workers, see Simulation
+        solution_index: pyatmos.warmstart.SolutionIndex (optional), shared by all the workers, see Simulation
+        journal: pyatmos.journal.SweepJournal (optional). If specified, every finished run is recorded in the journal, and the runs 
+                 already completed in the journal are not made again (their recorded result is returned instead), so that an interrupted 
+                 sweep can be resumed by running the same run specs again
+        limits: dictionary (optional), resource limits of photochem and clima in every run, see Simulation
+        build_cache: pyatmos.build.BuildCache (optional, local mode only), see Simulation. The binaries are compiled at most once, by the first worker
+        output_format: string, format of the parsed tables of every run, see Simulation
+        template: string, name of the template atmos is set up with, and the default template of the runs, see Simulation
+        catalog: pyatmos.catalog.RunCatalog (optional), shared by all the workers, see Simulation
+        '''
+
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+
+        self._n_workers           = n_workers
+        self._workspace_directory = workspace_directory
+        self._journal             = journal
+        self._simulation_kwargs   = {
+                'docker_image' : docker_image,
+                'code_path' : code_path,
+                'DEBUG' : DEBUG,
+                'atmos_directory' : atmos_directory,
+                'cache' : cache,
+                'solution_index' : solution_index,
+                'limits' : limits,
+                'build_cache' : build_cache,
+                'output_format' : output_format,
+                'template' : template,
+                'catalog' : catalog,
+                }
+
+        self._container_pool = None
+        if docker_image is not None:
+            self._container_pool = pyatmos.container_pool.ContainerPool(docker_image, n_workers, atmos_directory, pull=pull_image)
+
+    #_________________________________________________________________________
+    def imap(self, run_specs):
+        '''
+        Run a list of run specs concurrently, yielding the result of each run as soon as it finishes
+        Args:
+            run_specs: list of dictionaries. Each dictionary holds the keyword arguments of Simulation.run, e.g.
+                            { 'species_concentrations' : {'CH4' : 1e-4}, 'output_directory' : '/results/run_0' }
+                       Optional extra keys:
+                            'method' : name of the Simulation method to call, 'run' (default) or 'run_distance_modification'
+                            'run_id' : identifier returned with the result (defaults to the position in run_specs)
+        Yields:
+            dictionaries with keys 'index', 'run_id', 'method', 'output_directory', 'status', 'metadata', 'error', 'worker', 'duration' 
+            and 'journaled' (True if the run was not made because it is already completed in the journal)
+        '''
+        run_specs = list(run_specs)
+
+        # skip the runs already completed
+        pending = []
+        for index, spec in enumerate(run_specs):
+            record = self._journal.completed(spec) if self._journal is not None else None
+            if record is None:
+                pending.append((index, spec))
+                continue
+            result = dict(record['result'])
+            result.update({'index' : index, 'run_id' : spec.get('run_id', index), 'journaled' : True})
+            yield result
+
+        if len(pending) == 0:
+            return
+        n_workers = min(self._n_workers, len(pending))
+
+        # hand one warm container to each worker
+        container_names = None
+        if self._container_pool is not None:
+            self._container_pool.start()
+            container_names = multiprocessing.Queue()
+            for container in self._container_pool.containers[:n_workers]:
+                container_names.put(container.name)
+
+        workspace_root = tempfile.mkdtemp(prefix='pyatmos_pool_', dir=self._workspace_directory)
+        pool = multiprocessing.Pool(processes = n_workers,
+                                    initializer = _initialize_worker,
+                                    initargs = (self._simulation_kwargs, workspace_root, container_names, self._journal is not None))
+        try:
+            for result in pool.imap_unordered(_run_spec, pending):
+                if self._journal is not None:
+                    self._journal.record(run_specs[result['index']], result, result.pop('artifacts'))
+                yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            shutil.rmtree(workspace_root, ignore_errors=True)
+
+    #_________________________________________________________________________
+    def run(self, run_specs):
+        '''
+        Run a list of run specs concurrently and wait for all of them to finish
+        Args:
+            run_specs: list of dictionaries, see imap()
+        Returns:
+            list of result dictionaries (see imap()), in the same order as run_specs
+        '''
+        results = sorted(self.imap(run_specs), key=lambda result: result['index'])
+        for result in results:
+            print('Run {0}: {1}'.format(result['run_id'], result['status']))
+        return results
+
+    #_________________________________________________________________________
+    def __enter__(self):
+        return self
+
+    #_________________________________________________________________________
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    #_________________________________________________________________________
+    def close(self):
+        '''
+        Kill the warm containers (docker mode)
+        '''
+        if self._container_pool is not None:
+            self._container_pool.close()
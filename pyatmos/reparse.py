@@ -0,0 +1,150 @@
+import os
+import time
+import multiprocessing
+
+import pyatmos
+
+# Raw outputs of the models, with their parser
+RAW_OUTPUTS = {
+        'out.out' : 'photochem',
+        'clima_allout.tab' : 'clima',
+        }
+
+
+#_________________________________________________________________________
+def find_run_directories(root_directory):
+    '''
+    Walk a tree of run directories (e.g. the output directories of a sweep, including the iteration_n directories of coupled runs)
+    Args:
+        root_directory: string
+    Yields:
+        paths of the directories holding out.out or clima_allout.tab
+    '''
+    for directory, sub_directories, file_names in os.walk(root_directory):
+        sub_directories.sort()
+        if any(raw_file in file_names for raw_file in RAW_OUTPUTS):
+            yield directory
+
+
+#_________________________________________________________________________
+def stale_outputs(directory, output_format='csv'):
+    '''
+    Find the raw outputs of a run directory whose parsed tables are missing or older than them
+    Args:
+        directory: string, run directory
+        output_format: string, format of the parsed tables, see pyatmos.tables.FORMATS
+    Returns:
+        list of the names of the raw outputs to parse again (see RAW_OUTPUTS)
+    '''
+    stale = []
+    for raw_file in RAW_OUTPUTS:
+        input_file = os.path.join(directory, raw_file)
+        try:
+            input_time = os.stat(input_file).st_mtime_ns
+        except OSError:
+            continue
+        for name, (table_file, _) in pyatmos.result.TABLES.items():
+            if table_file != raw_file:
+                continue
+            try:
+                output_time = os.stat(os.path.join(directory, name+pyatmos.tables.FORMATS[output_format])).st_mtime_ns
+            except OSError:
+                output_time = None
+            if output_time is None or output_time < input_time:
+                stale.append(raw_file)
+                break
+    return stale
+
+
+#_________________________________________________________________________
+def reparse_directory(directory, output_format='csv', force=False):
+    '''
+    Parse the raw outputs of a run directory again, unless its parsed tables are newer
+    Args:
+        directory: string, run directory
+        output_format: string, format of the parsed tables, see pyatmos.tables.FORMATS
+        force: bool, parse even if the parsed tables are newer than the raw outputs
+    Returns:
+        dictionary with keys 'directory', 'parsed' (list of the raw outputs parsed, empty if the directory was skipped)
+        and 'error' (None, or the error the parser failed with)
+    '''
+    result = { 'directory' : directory, 'parsed' : [], 'error' : None }
+    raw_files = [raw_file for raw_file in RAW_OUTPUTS if os.path.isfile(os.path.join(directory, raw_file))] if force else stale_outputs(directory, output_format)
+    for raw_file in raw_files:
+        input_file = os.path.join(directory, raw_file)
+        try:
+            if RAW_OUTPUTS[raw_file] == 'photochem':
+                pyatmos.parser.parse_photochem(input_file, directory, False, output_format=output_format)
+            else:
+                pyatmos.parser.parse_clima(input_file, directory, output_format=output_format)
+        except Exception as e:
+            result['error'] = '{0}: {1}: {2}'.format(raw_file, type(e).__name__, e)
+            break
+        result['parsed'].append(raw_file)
+    return result
+
+
+#_________________________________________________________________________
+def _reparse_directory(arguments):
+    return reparse_directory(*arguments)
+
+
+#_________________________________________________________________________
+def reparse(root_directory, output_format='csv', n_workers=None, force=False, progress_interval=10.0):
+    '''
+    Parse the raw outputs of all the run directories under root_directory again, across a pool of processes,
+    e.g. after the parsers or the output format changed. Directories whose parsed tables are newer than their raw outputs are skipped
+    Args:
+        root_directory: string, see find_run_directories()
+        output_format: string, format of the parsed tables, see pyatmos.tables.FORMATS
+        n_workers: int (optional), number of processes, defaults to the number of CPUs
+        force: bool, parse every directory
+        progress_interval: float, seconds between two progress reports
+    Returns:
+        dictionary with the number of directories 'parsed' and 'skipped', and the list of the 'failed' ones as (directory, error)
+    '''
+    if output_format not in pyatmos.tables.FORMATS:
+        raise ValueError('unknown output format {0}, expected one of {1}'.format(output_format, sorted(pyatmos.tables.FORMATS)))
+    directories = list(find_run_directories(root_directory))
+    summary = { 'parsed' : 0, 'skipped' : 0, 'failed' : [] }
+    if len(directories) == 0:
+        print('No run directories in {0}'.format(root_directory))
+        return summary
+
+    n_workers = min(n_workers or multiprocessing.cpu_count(), len(directories))
+    print('Reparsing {0} run directories with {1} processes'.format(len(directories), n_workers))
+    start_time = time.time()
+    last_report = start_time
+
+    def report():
+        n_done = summary['parsed'] + summary['skipped'] + len(summary['failed'])
+        elapsed = time.time() - start_time
+        print('{0}/{1} directories: {2} parsed, {3} skipped, {4} failed, {5:.1f} seconds'.format(
+                n_done, len(directories), summary['parsed'], summary['skipped'], len(summary['failed']), elapsed))
+
+    pool = multiprocessing.Pool(processes = n_workers)
+    try:
+        tasks = [(directory, output_format, force) for directory in directories]
+        # small chunks keep the pool busy without sending each directory on its own
+        chunk_size = max(1, min(100, len(tasks)//(4*n_workers)))
+        for result in pool.imap_unordered(_reparse_directory, tasks, chunk_size):
+            if result['error'] is not None:
+                summary['failed'].append((result['directory'], result['error']))
+            elif result['parsed']:
+                summary['parsed'] += 1
+            else:
+                summary['skipped'] += 1
+            if time.time() - last_report >= progress_interval:
+                report()
+                last_report = time.time()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    report()
+    for directory, error in sorted(summary['failed']):
+        print('FAILED {0}: {1}'.format(directory, error))
+    return summary
@@ -0,0 +1,177 @@
+import os
+
+import pyatmos
+
+# Parsed tables of a run, { 'name of the table' : (raw output file it is parsed from, parser) }
+TABLES = {
+        'parsed_photochem_fluxes' : ('out.out', 'photochem'),
+        'parsed_photochem_mixing_ratios' : ('out.out', 'photochem'),
+        'parsed_clima_initial' : ('clima_allout.tab', 'clima'),
+        'parsed_clima_final' : ('clima_allout.tab', 'clima'),
+        'parsed_clima_iterations' : ('clima_allout.tab', 'clima'),
+        }
+
+
+#_________________________________________________________________________
+def surface_fluxes(photochem_fluxes, gases):
+    '''
+    Args:
+        photochem_fluxes: dataframe of the fluxes of photochem (parsed_photochem_fluxes)
+        gases: list of gases to get the flux for
+    Returns:
+        A dictionary of {'flux_gas' : flux }
+    '''
+    fluxes = photochem_fluxes[photochem_fluxes['Z'] == 0]
+    return { 'flux_'+gas : float(fluxes[gas].iloc[0]) for gas in gases }
+
+
+#_________________________________________________________________________
+def surface_temperature(clima_final):
+    '''
+    Args:
+        clima_final: dataframe of the final profile of clima (parsed_clima_final)
+    Returns:
+        temperature at the surface in Kelvin
+    '''
+    return float(clima_final[clima_final['ALT'] == 0]['T'].iloc[0])
+
+
+#_________________________________________________________________________
+def surface_pressure(clima_final):
+    '''
+    Args:
+        clima_final: dataframe of the final profile of clima (parsed_clima_final)
+    Returns:
+        pressure at the surface in bar
+    '''
+    return float(clima_final[clima_final['ALT'] == 0]['P'].iloc[0])
+
+
+#_________________________________________________________________________
+def final_clima_deviation(clima_iterations):
+    '''
+    Args:
+        clima_iterations: dataframe of the steps of clima (parsed_clima_iterations)
+    Returns:
+        DIVFrms of the last step of clima
+    '''
+    return float(clima_iterations[clima_iterations['NST'] == clima_iterations['NST'].max()]['DIVFrms'].iloc[0])
+
+
+#_________________________________________________________________________
+class RunResult(str):
+    def __new__(cls, status, output_directory=None, tables=None):
+        '''
+        Result of Simulation.run(). It is the status string of the run ('success', 'photochem_nonconverged', ...), so it can be
+        compared to statuses and serialized as before, and it also holds the parsed tables of the run in memory.
+        Tables that are not in memory are loaded on first access: from the parsed files of output_directory if there are any
+        (see pyatmos.tables.read_table), otherwise by parsing out.out or clima_allout.tab.
+        Derived quantities (surface temperature, ...) are computed once and kept. Nothing is written to disk until save() is called
+        status: string, status of the run
+        output_directory: string, output directory of the run
+        tables: dictionary (optional) of { 'name' : dataframe } of the tables already parsed, see TABLES
+        '''
+        result = str.__new__(cls, status)
+        result.output_directory = output_directory
+        result._tables = dict(tables or {})
+        result._values = {}
+        return result
+
+    #_________________________________________________________________________
+    def __repr__(self):
+        return 'RunResult({0}, {1})'.format(str.__repr__(self), repr(self.output_directory))
+
+    #_________________________________________________________________________
+    @property
+    def status(self):
+        return str(self)
+
+    #_________________________________________________________________________
+    def table(self, name):
+        '''
+        Args:
+            name: string, one of TABLES
+        Returns:
+            pandas dataframe, shared with the result: copy it before modifying it
+        '''
+        if name not in self._tables:
+            try:
+                self._tables[name] = pyatmos.tables.read_table(os.path.join(self.output_directory, name))
+            except IOError:
+                # not written to disk, parse the output of the model
+                raw_file, parser = TABLES[name]
+                input_file = os.path.join(self.output_directory, raw_file)
+                if parser == 'photochem':
+                    tables = pyatmos.parser.parse_photochem(input_file, self.output_directory, False, output_format=None)
+                else:
+                    tables = pyatmos.parser.parse_clima(input_file, self.output_directory, output_format=None)
+                for table_name, table in tables.items():
+                    self._tables.setdefault(table_name, table)
+        return self._tables[name]
+
+    #_________________________________________________________________________
+    def _value(self, key, compute):
+        if key not in self._values:
+            self._values[key] = compute()
+        return self._values[key]
+
+    #_________________________________________________________________________
+    @property
+    def photochem_fluxes(self):
+        return self.table('parsed_photochem_fluxes')
+
+    #_________________________________________________________________________
+    @property
+    def photochem_mixing_ratios(self):
+        return self.table('parsed_photochem_mixing_ratios')
+
+    #_________________________________________________________________________
+    @property
+    def clima_initial(self):
+        return self.table('parsed_clima_initial')
+
+    #_________________________________________________________________________
+    @property
+    def clima_final(self):
+        return self.table('parsed_clima_final')
+
+    #_________________________________________________________________________
+    @property
+    def clima_iterations(self):
+        return self.table('parsed_clima_iterations')
+
+    #_________________________________________________________________________
+    @property
+    def surface_temperature(self):
+        return self._value('surface_temperature', lambda: surface_temperature(self.clima_final))
+
+    #_________________________________________________________________________
+    @property
+    def surface_pressure(self):
+        return self._value('surface_pressure', lambda: surface_pressure(self.clima_final))
+
+    #_________________________________________________________________________
+    @property
+    def final_clima_deviation(self):
+        return self._value('final_clima_deviation', lambda: final_clima_deviation(self.clima_iterations))
+
+    #_________________________________________________________________________
+    def surface_fluxes(self, gases):
+        '''
+        Returns:
+            A dictionary of {'flux_gas' : flux }, see pyatmos.result.surface_fluxes
+        '''
+        return { 'flux_'+gas : self._value('flux_'+gas, lambda: surface_fluxes(self.photochem_fluxes, [gas])['flux_'+gas]) for gas in gases }
+
+    #_________________________________________________________________________
+    def save(self, output_format='csv', output_directory=None):
+        '''
+        Write the parsed tables of the run
+        Args:
+            output_format: string, see pyatmos.tables.FORMATS
+            output_directory: string (optional), defaults to the output directory of the run
+        Returns:
+            list of the files written
+        '''
+        output_directory = output_directory or self.output_directory
+        return [pyatmos.tables.write_table(self.table(name), os.path.join(output_directory, name), output_format, index=False) for name in TABLES]
@@ -0,0 +1,194 @@
+import os
+import math
+
+import pyatmos
+
+# Keys of a point that give the solutions a run starts from
+_SOLUTION_KEYS = ['previous_photochem_solution', 'previous_clima_solution']
+
+
+#_________________________________________________________________________
+def point_features(point):
+    '''
+    Features of a scan point (keyword arguments of Simulation.run or Simulation.run_distance_modification), see pyatmos.warmstart.run_features()
+    '''
+    return pyatmos.warmstart.run_features(point.get('species_concentrations'), point.get('species_fluxes'), point.get('flux_scaling'))
+
+
+#_________________________________________________________________________
+def order_points(points, order='nearest'):
+    '''
+    Order the points of a scan along a path through parameter space, so that every point is close to the one before it
+    Args:
+        points: list of dictionaries, keyword arguments of the runs
+        order: string
+            'given': keep the order of points
+            'sorted': sort on the features of the points (e.g. on flux_scaling for a distance scan)
+            'nearest': greedy nearest-neighbour tour, starting from the first point in sorted order
+    Returns:
+        list of indices into points
+    '''
+    features = [point_features(point) for point in points]
+    indices = sorted(range(len(points)), key=lambda i: sorted(features[i].items()))
+    if order == 'given':
+        return list(range(len(points)))
+    if order == 'sorted' or len(points) < 3:
+        return indices
+
+    if order != 'nearest':
+        raise ValueError('unknown order {0}'.format(order))
+    tour = [indices[0]]
+    remaining = indices[1:]
+    while remaining:
+        last = features[tour[-1]]
+        closest = min(remaining, key=lambda i: pyatmos.warmstart.distance(last, features[i]))
+        remaining.remove(closest)
+        tour.append(closest)
+    return tour
+
+
+#_________________________________________________________________________
+def interpolate_point(start, target, fraction):
+    '''
+    Point between start and target: flux_scaling and the fluxes are interpolated linearly, the concentrations logarithmically.
+    Parameters only set in target are taken from target
+    Args:
+        start: dictionary, keyword arguments of the run the interpolation starts from
+        target: dictionary, keyword arguments of the run to interpolate to
+        fraction: float, 0 is start and 1 is target
+    Returns:
+        dictionary, keyword arguments of the run in between
+    '''
+    point = dict(target)
+    if 'flux_scaling' in start and 'flux_scaling' in target:
+        a = float(start['flux_scaling'])
+        b = float(target['flux_scaling'])
+        point['flux_scaling'] = a + fraction*(b-a)
+
+    concentrations = dict(target.get('species_concentrations', {}))
+    for species, b in concentrations.items():
+        a = start.get('species_concentrations', {}).get(species)
+        if a is not None and a > 0 and b > 0:
+            concentrations[species] = math.exp(math.log(a) + fraction*(math.log(b)-math.log(a)))
+    if concentrations:
+        point['species_concentrations'] = concentrations
+
+    fluxes = dict(target.get('species_fluxes', {}))
+    for species, b in fluxes.items():
+        a = start.get('species_fluxes', {}).get(species)
+        if a is not None:
+            fluxes[species] = a + fraction*(b-a)
+    if fluxes:
+        point['species_fluxes'] = fluxes
+    return point
+
+
+#_________________________________________________________________________
+class ContinuationScan():
+    def __init__(self, simulation, method='run', order='nearest', max_bisections=3):
+        '''
+        Runs the points of a scan one after the other along a path through parameter space, every run starting from
+        the solutions (out.dist and TempOut.dat) of the last converged run.
+        When a point fails, the step from the last converged point is bisected: the point half way is run first,
+        and the point is run again from its solutions
+        simulation: pyatmos.Simulation, already started
+        method: string, 'run' (concentration and flux sweeps) or 'run_distance_modification' (distance scans)
+        order: string, see order_points()
+        max_bisections: int, maximum number of times a step is halved before the point is given up
+        '''
+        self._simulation     = simulation
+        self._method         = method
+        self._order          = order
+        self._max_bisections = max_bisections
+        self._n_intermediate = 0
+
+    #_________________________________________________________________________
+    def _converged(self, status):
+        if self._method == 'run_distance_modification':
+            return status is True
+        return status == 'success'
+
+    #_________________________________________________________________________
+    def _solutions(self, status, output_directory):
+        '''
+        Solutions of a run that the next runs can start from
+        '''
+        solutions = {}
+        photochem_converged = status in pyatmos.warmstart.PHOTOCHEM_CONVERGED_STATUSES
+        clima_converged = self._converged(status)
+        if self._method == 'run' and photochem_converged:
+            solutions['previous_photochem_solution'] = os.path.join(output_directory, pyatmos.warmstart.SOLUTION_FILES['photochem'])
+        if clima_converged:
+            solutions['previous_clima_solution'] = os.path.join(output_directory, pyatmos.warmstart.SOLUTION_FILES['clima'])
+        return solutions
+
+    #_________________________________________________________________________
+    def _call(self, point, solutions):
+        kwargs = dict(point)
+        kwargs.update(solutions)
+        if 'species_concentrations' in kwargs:
+            # Simulation.run modifies the dictionary
+            kwargs['species_concentrations'] = dict(kwargs['species_concentrations'])
+        return getattr(self._simulation, self._method)(**kwargs)
+
+    #_________________________________________________________________________
+    def _advance(self, start, solutions, target, depth):
+        '''
+        Run target starting from solutions (obtained at point start), bisecting the step if target fails
+        Returns:
+            (status, solutions, number of runs made)
+        '''
+        status = self._call(target, solutions)
+        n_runs = 1
+        if self._converged(status) or start is None or depth >= self._max_bisections:
+            return status, self._solutions(status, target['output_directory']), n_runs
+
+        self._n_intermediate += 1
+        middle = interpolate_point(start, target, 0.5)
+        middle['output_directory'] = os.path.join(target['output_directory'], 'continuation_{0}'.format(self._n_intermediate))
+        print('Step to {0} failed ({1}), bisecting'.format(point_features(target), status))
+
+        middle_status, middle_solutions, middle_runs = self._advance(start, solutions, middle, depth+1)
+        n_runs += middle_runs
+        if not self._converged(middle_status):
+            return status, self._solutions(status, target['output_directory']), n_runs
+
+        status, target_solutions, target_runs = self._advance(middle, middle_solutions, target, depth+1)
+        return status, target_solutions, n_runs + target_runs
+
+    #_________________________________________________________________________
+    def run(self, points):
+        '''
+        Run all the points of the scan
+        Args:
+            points: list of dictionaries, keyword arguments of the runs (each must have an 'output_directory'), e.g. for a distance scan
+                        [ { 'flux_scaling' : 1.0/distance**2, 'output_directory' : '/results/distance_{0}'.format(distance) } for distance in distances ]
+                    Solutions given with 'previous_photochem_solution' or 'previous_clima_solution' are only used for the first point
+        Returns:
+            list of dictionaries with keys 'index' (position in points), 'point', 'status', 'converged' and 'n_runs', in the order the points were run
+        '''
+        results = []
+        start = None
+        solutions = {}
+        for index in order_points(points, self._order):
+            point = dict(points[index])
+            if not results:
+                solutions = { key : point[key] for key in _SOLUTION_KEYS if point.get(key) }
+            for key in _SOLUTION_KEYS:
+                point.pop(key, None)
+
+            status, point_solutions, n_runs = self._advance(start, solutions, point, 0)
+            converged = self._converged(status)
+            if converged:
+                start = point
+                solutions = point_solutions
+
+            print('Scan point {0} ({1}/{2}): {3} after {4} runs'.format(index, len(results)+1, len(points), status, n_runs))
+            results.append({
+                    'index' : index,
+                    'point' : points[index],
+                    'status' : status,
+                    'converged' : converged,
+                    'n_runs' : n_runs,
+                    })
+        return results
@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import mmap
+
+import pyatmos
+
+# Lines that open or close the sections of the out.out file of photochem: { 'name' : text of the line }
+MARKERS = {
+        'mixing_ratios' : pyatmos.parser.PHOTOCHEM_MIXING_RATIOS_START,
+        'ozone_column_depth' : pyatmos.parser.PHOTOCHEM_MIXING_RATIOS_END,
+        'fluxes' : pyatmos.parser.PHOTOCHEM_FLUXES_START,
+        'aqueous_phase_species' : pyatmos.parser.PHOTOCHEM_FLUXES_END,
+        }
+
+# Sections that can be extracted: { 'section' : marker of the line that closes it }
+SECTIONS = {
+        'mixing_ratios' : 'ozone_column_depth',
+        'fluxes' : 'aqueous_phase_species',
+        }
+
+# Iteration lines (N = ... EMAX = ...) are found through their EMAX
+_ITERATION_MARKER = b'EMAX'
+
+_PATTERN = re.compile(b'|'.join(re.escape(text.encode()) for text in list(MARKERS.values())+[_ITERATION_MARKER.decode()]))
+_NAMES = { text.encode() : name for name, text in MARKERS.items() }
+
+# Version of the index files, change it when their content changes
+INDEX_VERSION = 1
+
+
+#_________________________________________________________________________
+class SectionIndex():
+    def __init__(self, file_name=None, data=None, save_index=True):
+        '''
+        Byte offsets of the sections of the out.out file of photochem, so that a section is only decoded when it is asked for.
+        The file is memory-mapped, and the offsets of the lines in MARKERS and of the iteration lines are found in a single
+        regular expression search over its bytes, the first time they are needed.
+        The index is kept next to the file (<file_name>.index) and reused as long as the file is not modified
+        file_name: string, path to the out.out file
+        data: bytes (optional), content of the out.out file, instead of file_name (e.g. read out of a docker container)
+        save_index: bool, write the index next to the file
+        '''
+        self._file_name  = file_name
+        self._save_index = save_index and file_name is not None
+        self._offsets    = None
+        self._file       = None
+        self._data       = data
+        if data is None:
+            self._file = open(file_name, 'rb')
+            stat = os.fstat(self._file.fileno())
+            self._stat = [stat.st_size, stat.st_mtime_ns]
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size > 0 else b''
+
+    #_________________________________________________________________________
+    def _index_file_name(self):
+        return self._file_name+'.index'
+
+    #_________________________________________________________________________
+    def _load_index(self):
+        try:
+            with open(self._index_file_name(), 'r') as file:
+                index = json.load(file)
+        except (IOError, ValueError):
+            return None
+        if index.get('version') != INDEX_VERSION or index.get('stat') != self._stat:
+            return None
+        return index['offsets']
+
+    #_________________________________________________________________________
+    def _write_index(self):
+        tmp_file_name = '{0}.tmp_{1}'.format(self._index_file_name(), os.getpid())
+        try:
+            with open(tmp_file_name, 'w') as file:
+                json.dump({'version' : INDEX_VERSION, 'stat' : self._stat, 'offsets' : self._offsets}, file)
+            os.replace(tmp_file_name, self._index_file_name())
+        except OSError:
+            # e.g. read-only directory, the index is only an optimization
+            if os.path.exists(tmp_file_name):
+                os.remove(tmp_file_name)
+
+    #_________________________________________________________________________
+    def _line_start(self, position):
+        return self._data.rfind(b'\n', 0, position) + 1
+
+    #_________________________________________________________________________
+    def _line_end(self, position):
+        end = self._data.find(b'\n', position)
+        return len(self._data) if end < 0 else end + 1
+
+    #_________________________________________________________________________
+    def offsets(self):
+        '''
+        Returns:
+            dictionary of { 'marker' : list of the byte offsets of the lines holding it }, for the markers of MARKERS and 'iterations'
+        '''
+        if self._offsets is None and self._file is not None:
+            self._offsets = self._load_index()
+        if self._offsets is None:
+            offsets = { name : [] for name in list(MARKERS)+['iterations'] }
+            previous = {}
+            for match in _PATTERN.finditer(self._data):
+                name = _NAMES.get(match.group(), 'iterations')
+                start = self._line_start(match.start())
+                if previous.get(name) == start:
+                    continue
+                if name == 'iterations' and b'N =' not in self._data[start:match.start()]:
+                    continue
+                offsets[name].append(start)
+                previous[name] = start
+            self._offsets = offsets
+            if self._save_index:
+                self._write_index()
+        return self._offsets
+
+    #_________________________________________________________________________
+    def count(self, section):
+        '''
+        Returns:
+            int, number of times photochem printed a section (see SECTIONS) or a marker (see MARKERS, 'iterations')
+        '''
+        return len(self.offsets()[section])
+
+    #_________________________________________________________________________
+    def _spans(self, section, occurrence=-1, closed=True):
+        '''
+        Byte offsets of a section, see section()
+        Returns:
+            list of (start, end), None if photochem did not print the section
+        '''
+        offsets = self.offsets()
+        starts = offsets[section]
+        if not starts:
+            return None
+        if occurrence is None:
+            return [self._spans(section, i, closed)[0] for i in range(len(starts))]
+        start = starts[occurrence]
+        following = [offset for offset in starts if offset > start]
+        end = following[0] if following else len(self._data)
+        for end_offset in offsets[SECTIONS[section]] if closed else []:
+            if start <= end_offset < end:
+                end = self._line_end(end_offset)
+                break
+        return [(start, end)]
+
+    #_________________________________________________________________________
+    def section(self, section, occurrence=-1, closed=True):
+        '''
+        Bytes of a section, from the line that opens it to the line that closes it (included), 
+        or to the next opening of the same section, or to the end of the file
+        Args:
+            section: string, one of SECTIONS
+            occurrence: int, which of the sections printed by photochem, the last one by default. None for all of them, one after the other
+            closed: bool, stop at the line that closes the section. If False, continue up to the next opening of the section
+        Returns:
+            bytes, None if photochem did not print the section
+        '''
+        spans = self._spans(section, occurrence, closed)
+        if spans is None:
+            return None
+        return b''.join(bytes(self._data[start:end]) for start, end in spans)
+
+    #_________________________________________________________________________
+    def lines(self, section, occurrence=-1, closed=True):
+        '''
+        Decoded lines of a section, see section(). The lines are read one by one out of the memory-mapped file while they are iterated,
+        the section is never copied as a whole, so the index must not be closed before the iteration is over
+        Returns:
+            iterator of strings, empty if photochem did not print the section
+        '''
+        for start, end in self._spans(section, occurrence, closed) or []:
+            position = start
+            while position < end:
+                line_end = min(self._line_end(position), end)
+                yield self._data[position:line_end].decode(errors='replace')
+                position = line_end
+
+    #_________________________________________________________________________
+    def last_iteration(self):
+        '''
+        Last iteration line printed by photochem, searched backwards from the end of the file unless the index is already built
+        Returns:
+            (iteration, emax), see pyatmos.monitor.parse_photochem_iteration_line, or None if there is no iteration line
+        '''
+        if self._offsets is not None and self._offsets['iterations']:
+            start = self._offsets['iterations'][-1]
+            parsed = pyatmos.monitor.parse_photochem_iteration_line(self._data[start:self._line_end(start)].decode(errors='replace'))
+            if parsed is not None:
+                return parsed
+        position = len(self._data)
+        while True:
+            position = self._data.rfind(_ITERATION_MARKER, 0, position)
+            if position < 0:
+                return None
+            line = self._data[self._line_start(position):self._line_end(position)].decode(errors='replace')
+            parsed = pyatmos.monitor.parse_photochem_iteration_line(line)
+            if parsed is not None:
+                return parsed
+
+    #_________________________________________________________________________
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if self._file is not None:
+            self._file.close()
+        self._data = None
+        self._file = None
+
+    #_________________________________________________________________________
+    def __enter__(self):
+        return self
+
+    #_________________________________________________________________________
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
@@ -1,8 +1,13 @@
 import docker
-import tempfile
 import os
 import inspect
 import json 
+import contextlib
+import shutil
+import math
+import signal
+import subprocess
+import threading
 #import numpy
 
 import pyatmos
@@ -24,17 +29,77 @@ def format_datetime(unix_timestamp):
     ).strftime('%Y-%m-%d %H:%M:%S')
 
 
+#_________________________________________________________________________
+def _set_resource_limits(limits):
+    '''
+    Apply the cpu_time and memory limits of a model run (see Simulation._stream_command) to the current process, 
+    called in the child process before the model is started
+    '''
+    import resource
+    if limits.get('cpu_time'):
+        cpu_time = int(math.ceil(limits['cpu_time']))
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time+1))
+    if limits.get('memory'):
+        memory = int(limits['memory'])
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+
+#_________________________________________________________________________
+def _killed_by_limit(exit_code):
+    '''
+    Whether a process (or the shell that ran it) was killed by SIGXCPU or SIGKILL, the signals RLIMIT_CPU is enforced with
+    '''
+    signals = [signal.SIGXCPU, signal.SIGKILL]
+    return exit_code is not None and (-exit_code in signals or exit_code-128 in signals)
+
+
 #_________________________________________________________________________
 class Simulation():
     def __init__(self, 
             docker_image=None, # 'registry.gitlab.com/frontierdevelopmentlab/astrobiology/pyatmos', 
             code_path=None,
             DEBUG=False, 
-            atmos_directory = '/code/atmos'):
+            atmos_directory = '/code/atmos',
+            workspace_directory = None,
+            docker_container = None,
+            cache = None,
+            solution_index = None,
+            limits = None,
+            build_cache = None,
+            template = 'ModernEarth',
+            template_registry = None,
+            output_format = 'csv',
+            catalog = None):
         '''
         docker_image: string (optional). If specified, pyatmos will communicate with a docker image, otherwise use the code_path 
         code_path: string (optional). If specified, pyatmos will communicate witha local version of atmos. The string is the path to the atmos directory 
         DEBUG: bool, if set to true, extra debug messages are printed
+        workspace_directory: string (optional, local mode only). If specified, every run is made in a private clone of code_path created inside this directory
+                             (see pyatmos.workspace), code_path itself is never modified and the clone is deleted after the run
+        docker_container: docker container or container name (optional, docker mode only). If specified, pyatmos runs inside this already running 
+                          container (e.g. one handed out by pyatmos.container_pool.ContainerPool) instead of pulling the image and starting its own.
+                          The container is not killed by close()
+        cache: pyatmos.cache.ResultCache (optional). If specified, run() first looks the run up in this cache, and only runs atmos 
+               if an identical run (same inputs, template files and previous solutions) has not been made before 
+        solution_index: pyatmos.warmstart.SolutionIndex (optional). If specified, runs that are not given a previous solution start from 
+                        the converged solution of the closest past run in the index, and the solutions of every converged run are added to it
+        limits: dictionary (optional), resource limits of every run of photochem and clima, formatted as 
+                    { 'photochem' : { 'wall_time' : 3600, 'cpu_time' : 3600, 'memory' : 4e9 }, 'clima' : { ... } }
+                wall_time and cpu_time are in seconds, memory in bytes, all keys are optional. A model that runs for longer than wall_time
+                or uses more than cpu_time is killed and the run returns 'photochem_timeout' or 'clima_timeout'. 
+                memory limits the address space of the model, a model that needs more fails to allocate and crashes
+        build_cache: pyatmos.build.BuildCache (optional, local mode only). If specified, start() links Photo.run and Clima.run 
+                     to the binaries cached for the current sources and parameters.inc of code_path, and only compiles them if they are not cached
+        template: string, name of the template atmos is set up with (the docker image and code_path), and the default template of the runs
+        template_registry: pyatmos.templates.TemplateRegistry (optional), parsed templates, can be shared by the Simulations of a process.
+                           Each template is read and parsed once, runs with another template than the one in place only write its files into atmos 
+                           (and recompile atmos if its parameters.inc differs, see build_cache)
+        output_format: string, format of the parsed tables of photochem and clima written to the output directories (see pyatmos.tables.FORMATS),
+                       'npz', 'feather' or 'parquet' are much faster to load than 'csv'. Read them with pyatmos.tables.read_table.
+                       None to keep them in memory only, in the RunResult returned by run() (see pyatmos.result.RunResult.save)
+        catalog: pyatmos.catalog.RunCatalog (optional). If specified, run() and run_coupled() add every run to it, with its inputs, 
+                 status, durations, iteration counts and surface outputs, so that runs can be queried without reading their metadata.
+                 Errors of the catalog are printed, they do not fail the run
         '''
 
         # get input arguments
@@ -51,15 +116,35 @@ class Simulation():
 
 
         # initialize docker if need be 
+        self._workspace_manager = None
+        self._container = None
         if self._docker_image is not None:
-            self._initialize_docker()
+            self._initialize_docker(docker_container)
         else:
             self._atmos_directory = self._code_path 
+            if workspace_directory is not None:
+                self._workspace_manager = pyatmos.workspace.WorkspaceManager(self._code_path, workspace_directory)
 
         # initialize other runtime variables
         self._save_logfiles = False
-        self._container = None
         self._run_iteration_call = None
+        self._cache = cache
+        self._cache_hit = False
+        self._code_version = None
+        self._solution_index = solution_index
+        self._warm_start = {}
+        self._coupling_iterations = []
+        self._limits = limits or {}
+        self._build_cache = build_cache
+        self._template = template
+        self._template_registry = template_registry if template_registry is not None else pyatmos.templates.TemplateRegistry()
+        self._installed_template = template
+        # parameters.inc Photo.run and Clima.run were compiled with, None until known (they match the parameters.inc in place at start)
+        self._compiled_parameters = None
+        self._run_template = None
+        self._parsed_tables = {}
+        self._output_format = output_format
+        self._catalog = catalog
 
         # metadata for runtime 
         self._start_time         = 0
@@ -80,9 +165,15 @@ class Simulation():
         print('Initialization complete: '+format_datetime(self._initialize_time))
 
     #_________________________________________________________________________
-    def _initialize_docker(self):
+    def _initialize_docker(self, docker_container=None):
         print('Initializing Docker...')
         self._docker_client = docker.from_env()
+        self._owns_container = docker_container is None
+        if docker_container is not None:
+            if isinstance(docker_container, str):
+                docker_container = self._docker_client.containers.get(docker_container)
+            self._container = docker_container
+            return
         print('Pulling latest image... {}'.format(self._docker_image))
         self._docker_client.images.pull(self._docker_image)
         self._container = None
@@ -92,13 +183,39 @@ class Simulation():
     #_________________________________________________________________________
     def start(self):
         self._start_time = pyatmos.util.UTC_now()
-        if self._docker_image is not None:
+        if self._docker_image is not None and not self._owns_container:
+            print("Using container '{0}'.".format(self._container.name))
+        elif self._docker_image is not None:
             print('Starting Docker container...')
             self._container = self._docker_client.containers.run(self._docker_image, detach=True, tty=True)
             print("Container '{0}' running at {1}.".format(self._container.name, format_datetime(self._start_time) ))
         else:
+            if self._build_cache is not None:
+                self.install_binaries()
             print('pyatmos is ready to go! ')
 
+    #_________________________________________________________________________
+    def install_binaries(self, template=None):
+        '''
+        Link the compiled photochem and clima of the build cache into code_path, compiling them if they are not cached (local mode only)
+        Args:
+            template: string (optional), name of a template (e.g. 'ModernEarth') whose parameters.inc the models are built with, 
+                      by default the parameters.inc currently in code_path
+        Returns:
+            bool, False if a model failed to compile
+        '''
+        if self._build_cache is None or self._docker_image is not None:
+            print('ERROR: binaries can only be installed from a build cache in local mode')
+            return False
+        for model in pyatmos.build.MODELS:
+            if self._build_cache.install(self._code_path, model, template) is None:
+                print('ERROR: could not compile {0}'.format(model))
+                return False
+        # the binaries are part of the result cache keys, and match the parameters.inc now in code_path
+        self._code_version = None
+        self._compiled_parameters = None
+        return True
+
     #_________________________________________________________________________
     @staticmethod
     def split_dictionary(input_dict, species='N2'):
@@ -124,12 +241,16 @@ class Simulation():
             flux_scaling=1.0, 
             max_clima_steps=400, 
             save_logfiles = False,
-            output_directory=None):
+            output_directory=None,
+            previous_clima_solution=None,
+            template=None):
         """Test function to modify the earth--sun distance
         meant to be run iteratively 
         Args:
             flux_scaling: float, the fraction of the solar radiance relative to earth. Value of 1.0 corresponds to earth
             Distance scales as 1/a^2 (a is semi-major axis) 
+            previous_clima_solution: string (optional), path to the previous clima solution (the "TempOut.dat" file, which will become the "TempIn.dat" file)
+            template: string (optional), see run()
         """
 
         # parse input arguments
@@ -145,29 +266,40 @@ class Simulation():
         # make sure output directory exists
         os.system('mkdir -p {0}'.format(output_directory))
 
-        # modify the clima input file with the flux scaling  
-        # and make sure ICOUPLE=   0 (since we're probably not running in coupled mode?) TODO, consider if this is the case? 
-        self.debug('reading file {0}'.format(self._atmos_directory+'/CLIMA/IO/input_clima.dat'))
-
-        clima_input = self._read_container_file(self._atmos_directory+'/CLIMA/IO/input_clima.dat') # clima_input: file containing strings of input_clima.dat 
-        new_clima_file_name = tempfile.NamedTemporaryFile().name
-        new_clima_file = open(new_clima_file_name, 'w')
-        for line in clima_input:
-            if 'SOLCON=  ' in line:
-                line = 'SOLCON=    {0}\n'.format(flux_scaling)
-            if 'ICOUPLE=   ' in line:
-                line = 'ICOUPLE=   0\n'
-            new_clima_file.write(line)
-        new_clima_file.close()
-        self._write_container_file(new_clima_file_name, self._atmos_directory+'/CLIMA/IO/input_clima.dat')
-
-        # run clima
-        clima_converged = self._run_clima(max_clima_steps, output_directory, methane_concentration = 0)
+        # start from the closest converged solution
+        features = pyatmos.warmstart.run_features(flux_scaling=flux_scaling)
+        previous_clima_solution = self._select_warm_start(features, 'clima', previous_clima_solution)
+
+        with self._run_workspace():
+            self._use_template(template)
+
+            # modify the clima input file with the flux scaling  
+            # and make sure ICOUPLE=   0 (since we're probably not running in coupled mode?) TODO, consider if this is the case? 
+            self.debug('reading file {0}'.format(self._atmos_directory+'/CLIMA/IO/input_clima.dat'))
+
+            clima_input = self._read_container_file(self._atmos_directory+'/CLIMA/IO/input_clima.dat') # clima_input: file containing strings of input_clima.dat 
+            new_clima_input = ''
+            for line in clima_input:
+                if 'SOLCON=  ' in line:
+                    line = 'SOLCON=    {0}\n'.format(flux_scaling)
+                if 'ICOUPLE=   ' in line:
+                    line = 'ICOUPLE=   0\n'
+                new_clima_input += line
+            self._write_container_text(new_clima_input, self._atmos_directory+'/CLIMA/IO/input_clima.dat')
+
+            # run clima
+            clima_converged = self._run_clima(max_clima_steps, output_directory, methane_concentration = 0, previous_clima_solution = previous_clima_solution)
+
+        if self._solution_index is not None:
+            self._solution_index.add(features, output_directory, 'clima_converged' if clima_converged is True else 'clima_error')
+        if clima_converged in ['clima_timeout', 'clima_cancelled']:
+            return clima_converged
         
-        # parse the output of photochem and clima (writes output as pandas csv file) 
+        # parse the output of photochem and clima (writes the parsed tables in the output format) 
         pyatmos.parser.parse_clima(input_file = output_directory+'/clima_allout.tab',
                                     output_directory = output_directory,
-                                    debug=self._debug )
+                                    debug=self._debug,
+                                    output_format=self._output_format )
 
         return clima_converged
 
@@ -182,7 +314,11 @@ class Simulation():
             previous_clima_solution = None, 
             output_directory='/Users/Will/Documents/FDL/results',
             run_iteration_call = None,
-            save_logfiles = False
+            save_logfiles = False,
+            photochem_divergence_rule = None,
+            clima_early_stop = None,
+            clima_step_callback = None,
+            template = None
             ):
         '''
         Configures and runs ATMOS, then collects the output.  
@@ -207,9 +343,337 @@ class Simulation():
             previous_clima_solution: string, path to the previous clima solution (the "TempOut.dat" file, which will become the "TempIn.dat" file)
             output_directory: string, path to the directory to store outputs (on your own filesystem!!) 
             save_logfiles: bool, if True, the output of clima and photochem will be saved to a logfile and written to the output directory
+            photochem_divergence_rule: callable (optional), called with (iteration, emax, history) for every iteration of photochem while it runs,
+                                    photochem is aborted with status 'photochem_diverged' as soon as it returns True (see pyatmos.monitor.EmaxGrowthRule).
+                                    Independently of this, photochem is aborted with status 'photochem_nonconverged' once it reaches max_photochem_iterations
+            clima_early_stop: dictionary (optional), stop clima before max_clima_steps once it has settled. Formatted as 
+                                    { 'divfrms_tolerance' : 1e-5, 'dt_tolerance' : 1e-3, 'n_steps' : 5 } 
+                                    (all keys optional, see pyatmos.monitor.ClimaMonitor)
+            clima_step_callback: callable (optional), called with the record of every step of clima as soon as clima writes it to clima_allout.tab, 
+                                    as a dictionary of { 'NST' : step, 'JCONV' : ..., 'CHG' : ..., 'DIVFrms' : ..., 'DT(ND)' : ..., 'T(ND)' : ... } 
+                                    (see pyatmos.monitor.ClimaTail), e.g. to follow the convergence live. 
+                                    If it returns True, clima is cancelled and the run returns 'clima_cancelled'
+            template: string (optional), name of the planet template of the run (e.g. 'ModernEarth', 'ArcheanEarth'), 
+                                    defaults to the template of the Simulation. The template files are parsed once (see pyatmos.templates)
+        Returns:
+            pyatmos.result.RunResult: the status of the run ('success', 'photochem_nonconverged', 'clima_error', ...), 
+            which also holds the parsed tables of the run and the surface quantities computed from them
         '''
 
-        # check the input species dictionaries 
+        # start from the closest converged solutions, must be done before _run_atmos which modifies species_concentrations
+        features = pyatmos.warmstart.run_features(species_concentrations, species_fluxes)
+        inputs = (dict(species_concentrations), dict(species_fluxes))
+        previous_photochem_solution = self._select_warm_start(features, 'photochem', previous_photochem_solution)
+        previous_clima_solution = self._select_warm_start(features, 'clima', previous_clima_solution, reset=False)
+
+        with self._run_workspace():
+            self._use_template(template)
+            self._cache_hit = False
+            self._parsed_tables = {}
+            cache_key = None
+            status = None
+            if self._cache is not None:
+                try:
+                    cache_key = self._run_cache_key(species_concentrations, species_fluxes, max_photochem_iterations, max_clima_steps,
+                                                    previous_photochem_solution, previous_clima_solution, save_logfiles,
+                                                    photochem_divergence_rule, clima_early_stop)
+                except ValueError as e:
+                    print('Not using the cache for this run: {0}'.format(e))
+            if cache_key is not None:
+                status = self._load_cached_run(cache_key, output_directory, species_concentrations, max_photochem_iterations, max_clima_steps,
+                                               run_iteration_call, save_logfiles)
+                previous_files = pyatmos.cache.list_files(output_directory)
+
+            if status is None:
+                status = self._run_atmos(species_concentrations, species_fluxes, max_photochem_iterations, max_clima_steps,
+                                         previous_photochem_solution, previous_clima_solution, output_directory, run_iteration_call, save_logfiles,
+                                         photochem_divergence_rule, clima_early_stop, clima_step_callback)
+
+                if cache_key is not None:
+                    # only store the files written by this run
+                    output_files = [file_name for file_name, stat in pyatmos.cache.list_files(output_directory).items() if previous_files.get(file_name) != stat]
+                    self._cache.put(cache_key, status, output_directory, output_files, self.get_metadata())
+
+        if self._solution_index is not None:
+            self._solution_index.add(features, output_directory, status)
+        result = pyatmos.result.RunResult(status, output_directory, self._parsed_tables)
+        self._add_to_catalog(result, *inputs)
+        return result
+
+    #_________________________________________________________________________
+    def _add_to_catalog(self, result, species_concentrations, species_fluxes):
+        '''
+        Add a finished run to the catalog (if any). A catalog that cannot be written (e.g. a locked or corrupted database)
+        is reported, the run itself is not failed
+        '''
+        if self._catalog is None:
+            return
+        try:
+            self._catalog.add(result, species_concentrations, species_fluxes, self.get_metadata())
+        except Exception as e:
+            print('Could not add the run in {0} to the catalog: {1}: {2}'.format(result.output_directory, type(e).__name__, e))
+
+    #_________________________________________________________________________
+    def _select_warm_start(self, features, kind, previous_solution, reset=True):
+        '''
+        Pick the solution a run starts from: previous_solution if given, otherwise the closest one in the solution index (if any)
+        Args:
+            features: dictionary, see pyatmos.warmstart.run_features()
+            kind: string, 'photochem' (out.dist) or 'clima' (TempOut.dat)
+            previous_solution: string or None, solution given by the caller
+            reset: bool, forget the solutions picked for the previous run
+        Returns:
+            path of the solution, or None to start from the solution currently in atmos
+        '''
+        if reset:
+            self._warm_start = {}
+        if previous_solution is None and self._solution_index is not None:
+            previous_solution = self._solution_index.nearest(features, kind)
+            if previous_solution is not None:
+                print('Starting {0} from {1}'.format(kind, previous_solution))
+        self._warm_start[kind] = previous_solution
+        return previous_solution
+
+    #_________________________________________________________________________
+    def _run_cache_key(self, species_concentrations, species_fluxes, max_photochem_iterations, max_clima_steps,
+            previous_photochem_solution, previous_clima_solution, save_logfiles, photochem_divergence_rule, clima_early_stop):
+        '''
+        Cache key of a call of run(): hash of the arguments that change the outputs, of the version of atmos, 
+        of the template input files and of the solutions the run starts from (in.dist and TempIn.dat)
+        '''
+        input_files = [self._atmos_directory+'/'+file_name for file_name in pyatmos.cache.RUN_INPUT_FILES]
+        contents = self._get_files(input_files)
+        files = { file_name : contents.get(path) for file_name, path in zip(pyatmos.cache.RUN_INPUT_FILES, input_files) }
+
+        # the solutions the run will start from
+        previous_solutions = pyatmos.transfer.get_local_files([path for path in [previous_photochem_solution, previous_clima_solution] if path])
+        if previous_photochem_solution:
+            files['PHOTOCHEM/in.dist'] = previous_solutions.get(previous_photochem_solution)
+        if previous_clima_solution:
+            files['CLIMA/IO/TempOut.dat'] = previous_solutions.get(previous_clima_solution)
+
+        # version of atmos: the image in docker mode, the executables in local mode
+        if self._code_version is None:
+            if self._docker_image is not None:
+                self._code_version = self._container.image.id
+            else:
+                executables = self._get_files([self._atmos_directory+'/Photo.run', self._atmos_directory+'/Clima.run'])
+                self._code_version = pyatmos.cache.describe(b''.join([executables[path] for path in sorted(executables)]))
+
+        return pyatmos.cache.ResultCache.key({
+                'code_version' : self._code_version,
+                'template' : self._run_template.digest,
+                'species_concentrations' : species_concentrations,
+                'species_fluxes' : species_fluxes,
+                'max_photochem_iterations' : max_photochem_iterations,
+                'max_clima_steps' : max_clima_steps,
+                'save_logfiles' : save_logfiles,
+                'photochem_divergence_rule' : photochem_divergence_rule,
+                'clima_early_stop' : clima_early_stop,
+                'output_format' : self._output_format,
+                'files' : files,
+                })
+
+    #_________________________________________________________________________
+    def _load_cached_run(self, cache_key, output_directory, species_concentrations, max_photochem_iterations, max_clima_steps, 
+            run_iteration_call, save_logfiles):
+        '''
+        Copy the outputs of a cached run to output_directory
+        The solutions of the cached run are also put in place inside atmos, as if the run had just been made, so that the next run starts from them
+        Returns:
+            the status of the cached run, or None if the run is not in the cache
+        '''
+        entry = self._cache.materialize(cache_key, output_directory)
+        if entry is None:
+            return None
+        print('Found run in cache ({0}): {1}'.format(cache_key, entry['status']))
+
+        solutions = pyatmos.transfer.get_local_files([output_directory+'/'+file_name for file_name in ['out.dist', 'TempOut.dat'] if file_name in entry['files']])
+        self._put_files({ self._atmos_directory+target : solutions[output_directory+'/'+file_name] 
+                          for file_name, target in [('out.dist', '/PHOTOCHEM/in.dist'), ('TempOut.dat', '/CLIMA/IO/TempOut.dat')]
+                          if output_directory+'/'+file_name in solutions })
+
+        # set metadata
+        metadata = entry['metadata'] or {}
+        self._cache_hit = True
+        self._run_iteration_call = run_iteration_call
+        self._save_logfiles = save_logfiles 
+        self._species_concentrations = species_concentrations 
+        self._max_photochem_iterations = max_photochem_iterations
+        self._max_clima_steps = max_clima_steps 
+        self._run_time_start = pyatmos.util.UTC_now() 
+        self._run_time_end = self._run_time_start
+        self._photochem_duration = 0
+        self._clima_duration = 0
+        self._n_photochem_iterations = metadata.get('photochem_iterations')
+        self._n_clima_iterations = metadata.get('clima_iterations')
+        return entry['status']
+
+    #_________________________________________________________________________
+    def run_coupled(self, 
+            species_concentrations={}, 
+            species_fluxes={},
+            max_photochem_iterations=10000, 
+            max_clima_steps=200, 
+            max_coupling_iterations=10,
+            temperature_tolerance=0.1,
+            pressure_tolerance=1e-3,
+            mixing_ratio_tolerance=1e-2,
+            mixing_ratio_species=['O3', 'H2O', 'CH4', 'CO2', 'O2'],
+            previous_photochem_solution = None,
+            previous_clima_solution = None, 
+            output_directory='/Users/Will/Documents/FDL/results',
+            run_iteration_call = None,
+            save_logfiles = False,
+            photochem_divergence_rule = None,
+            clima_early_stop = None,
+            clima_step_callback = None,
+            template = None
+            ):
+        '''
+        Runs photochem and clima coupled (ICOUPLE=1): the two models are run one after the other, each starting from the 
+        solution of the other one (passed through the files of COUPLE/), until the surface temperature, the surface pressure and 
+        the surface mixing ratios of mixing_ratio_species change by less than the tolerances between two iterations 
+        (see pyatmos.monitor.coupling_converged). 
+        The outputs of iteration n are written to output_directory/iteration_n, those of the last iteration are also copied to output_directory. 
+        The timings and surface values of every iteration are reported in the metadata under 'coupling_iterations'
+
+        Args: 
+            max_coupling_iterations: int, maximum number of photochem + clima iterations
+            temperature_tolerance: float, tolerance on the change of the surface temperature [K]
+            pressure_tolerance: float, tolerance on the relative change of the surface pressure 
+            mixing_ratio_tolerance: float, tolerance on the relative change of the surface mixing ratios
+            mixing_ratio_species: list of species whose surface mixing ratio is tested for convergence
+            other arguments: see run()
+        Returns:
+            pyatmos.result.RunResult of the last iteration: 'success' once converged, 'coupling_nonconverged' if not converged after 
+            max_coupling_iterations, or the status of the model that failed ('photochem_nonconverged', 'clima_error', ...)
+        '''
+
+        # check the input species dictionaries, before the first iteration
+        self._check_species(species_concentrations, species_fluxes)
+
+        os.system('mkdir -p '+output_directory)
+
+        # set metadata
+        self._run_iteration_call = run_iteration_call
+        self._save_logfiles = save_logfiles 
+        self._species_concentrations = dict(species_concentrations)
+        self._max_photochem_iterations = max_photochem_iterations
+        self._max_clima_steps = max_clima_steps 
+        self._run_time_start = pyatmos.util.UTC_now() 
+        self._coupling_iterations = []
+        self._parsed_tables = {}
+
+        if 'CH4' in species_concentrations.keys():
+            methane_concentration = species_concentrations['CH4'] 
+        else: 
+            methane_concentration = 1.80E-06 
+
+        with self._run_workspace():
+            self._use_template(template)
+            original_inputs = self._set_coupling(1)
+            try:
+                status = 'coupling_nonconverged'
+                previous_state = None
+                for iteration in range(max_coupling_iterations):
+                    iteration_directory = os.path.join(output_directory, 'iteration_{0}'.format(iteration))
+                    os.system('mkdir -p '+iteration_directory)
+                    iteration_start = pyatmos.util.UTC_now()
+
+                    # the solutions of the previous iteration are already in place (in.dist, TempIn.dat and COUPLE/)
+                    photochem_status = self._run_photochem(dict(species_concentrations), dict(species_fluxes), max_photochem_iterations, iteration_directory, 
+                                                           previous_photochem_solution if iteration == 0 else None, photochem_divergence_rule)
+                    if photochem_status != 'success':
+                        status = photochem_status
+                        break
+                    clima_converged = self._run_clima(max_clima_steps, iteration_directory, methane_concentration, 
+                                                      previous_clima_solution if iteration == 0 else None, clima_early_stop, clima_step_callback)
+                    if clima_converged in ['clima_timeout', 'clima_cancelled']:
+                        status = clima_converged
+                        break
+                    if not clima_converged:
+                        status = 'clima_error'
+                        break
+
+                    state = self._coupling_state(iteration_directory, mixing_ratio_species)
+                    self._coupling_iterations.append({
+                            'iteration' : iteration,
+                            'photochem_duration' : self._photochem_duration,
+                            'photochem_iterations' : self._n_photochem_iterations,
+                            'clima_duration' : self._clima_duration,
+                            'clima_iterations' : self._n_clima_iterations,
+                            'duration' : pyatmos.util.UTC_now() - iteration_start,
+                            'surface_temperature' : state['T'],
+                            'surface_pressure' : state['P'],
+                            'surface_mixing_ratios' : state['mixing_ratios'],
+                            })
+                    print('coupling iteration {0}: T = {1} K, P = {2} bar, took {3} seconds'.format(iteration, state['T'], state['P'], self._coupling_iterations[-1]['duration']))
+
+                    if pyatmos.monitor.coupling_converged(previous_state, state, temperature_tolerance, pressure_tolerance, mixing_ratio_tolerance):
+                        status = 'success'
+                        break
+                    previous_state = state
+            finally:
+                self._put_files(original_inputs)
+
+        # the last iteration is the result 
+        if self._coupling_iterations:
+            for file_name in os.listdir(iteration_directory):
+                if os.path.isfile(os.path.join(iteration_directory, file_name)):
+                    shutil.copy(os.path.join(iteration_directory, file_name), output_directory)
+
+        self._run_time_end = pyatmos.util.UTC_now()
+        print('Coupled run finished after {0} iterations: {1}'.format(len(self._coupling_iterations), status))
+        result = pyatmos.result.RunResult(status, output_directory, self._parsed_tables)
+        self._add_to_catalog(result, dict(species_concentrations), dict(species_fluxes))
+        return result
+
+    #_________________________________________________________________________
+    def _set_coupling(self, icouple):
+        '''
+        Set ICOUPLE in the input files of photochem and clima 
+        Args:
+            icouple: int, 1 to couple the models, 0 otherwise
+        Returns:
+            dictionary of { 'path' : content } of the original input files, to put them back once done 
+        '''
+        input_files = [self._atmos_directory+'/PHOTOCHEM/INPUTFILES/input_photchem.dat', self._atmos_directory+'/CLIMA/IO/input_clima.dat']
+        original_inputs = self._get_files(input_files)
+        new_inputs = {}
+        for path, content in original_inputs.items():
+            lines = content.decode(errors='replace').splitlines(True)
+            new_inputs[path] = ''.join(['ICOUPLE=   {0}\n'.format(icouple) if line.startswith('ICOUPLE=') else line for line in lines])
+        self._put_files(new_inputs)
+        return original_inputs
+
+    #_________________________________________________________________________
+    def _coupling_state(self, output_directory, mixing_ratio_species):
+        '''
+        Parse the outputs of an iteration of run_coupled() and return the surface temperature, pressure and mixing ratios 
+        (see pyatmos.monitor.coupling_converged). The parsed tables are kept in _parsed_tables
+        '''
+        self._parsed_tables = pyatmos.parser.parse_clima(input_file = output_directory+'/clima_allout.tab',
+                                    output_directory = output_directory,
+                                    debug=self._debug,
+                                    output_format=self._output_format )
+        self._parsed_tables.update(pyatmos.parser.parse_photochem(input_file = output_directory+'/out.out',
+                                    output_directory = output_directory,
+                                    debug=self._debug,
+                                    output_format=self._output_format ))
+        mixing_df = self._parsed_tables['parsed_photochem_mixing_ratios']
+        surface = mixing_df.loc[mixing_df['Z'].idxmin()]
+        return {
+                'T' : pyatmos.result.surface_temperature(self._parsed_tables['parsed_clima_final']),
+                'P' : pyatmos.result.surface_pressure(self._parsed_tables['parsed_clima_final']),
+                'mixing_ratios' : { species : float(surface[species]) for species in mixing_ratio_species if species in surface.index },
+                }
+
+    #_________________________________________________________________________
+    def _check_species(self, species_concentrations, species_fluxes):
+        '''
+        A species can be given either a concentration or a flux, not both
+        '''
         concentration_keys = species_concentrations.keys()
         flux_keys          = species_fluxes.keys()
         overlapping_species = set(flux_keys).intersection( set( concentration_keys) )
@@ -219,6 +683,17 @@ class Simulation():
         if flux_keys and concentration_keys:
             print('Will attempt to modify species file with fluxes {0} and concentrations {1}'.format(species_fluxes, species_concentrations))
 
+    #_________________________________________________________________________
+    def _run_atmos(self, species_concentrations, species_fluxes, max_photochem_iterations, max_clima_steps,
+            previous_photochem_solution, previous_clima_solution, output_directory, run_iteration_call, save_logfiles,
+            photochem_divergence_rule, clima_early_stop, clima_step_callback=None):
+        '''
+        Body of run(), runs inside the workspace of this run (if any) 
+        '''
+
+        # check the input species dictionaries 
+        self._check_species(species_concentrations, species_fluxes)
+
         # make the output directory
         os.system('mkdir -p '+output_directory)
 
@@ -231,12 +706,14 @@ class Simulation():
         self._run_time_start = pyatmos.util.UTC_now() 
 
 
+        self._parsed_tables = {}
+
         # make sure we're in the right directory
         self._generic_run('cd '+self._atmos_directory) 
 
 
         # run the photochemical model 
-        photochem_converged = self._run_photochem(species_concentrations, species_fluxes, max_photochem_iterations, output_directory, previous_photochem_solution)
+        photochem_converged = self._run_photochem(species_concentrations, species_fluxes, max_photochem_iterations, output_directory, previous_photochem_solution, photochem_divergence_rule)
 
         # if photochem didn't converge, exit 
         if photochem_converged != 'success': 
@@ -249,9 +726,12 @@ class Simulation():
             methane_concentration = species_concentrations['CH4'] 
         else: 
             methane_concentration = 1.80E-06 
-        clima_converged = self._run_clima(max_clima_steps, output_directory, methane_concentration, previous_clima_solution)
+        clima_converged = self._run_clima(max_clima_steps, output_directory, methane_concentration, previous_clima_solution, clima_early_stop, clima_step_callback)
 
         # if clima didn't converge, exit
+        if clima_converged in ['clima_timeout', 'clima_cancelled']:
+            self._run_time_end = pyatmos.util.UTC_now()
+            return clima_converged
         if not clima_converged:
             self._run_time_end = pyatmos.util.UTC_now()
             return 'clima_error'
@@ -259,15 +739,17 @@ class Simulation():
             print('clima converged')
 
 
-        # parse the output of clima (writes output as pandas csv file) 
-        pyatmos.parser.parse_clima(input_file = output_directory+'/clima_allout.tab',
+        # parse the output of clima (writes the parsed tables in the output format) 
+        self._parsed_tables = pyatmos.parser.parse_clima(input_file = output_directory+'/clima_allout.tab',
                                     output_directory = output_directory,
-                                    debug=self._debug )
+                                    debug=self._debug,
+                                    output_format=self._output_format )
 
-        # parse the output of photochem (writes output as pandas csv file) 
-        pyatmos.parser.parse_photochem(input_file = output_directory+'/out.out',
+        # parse the output of photochem (writes the parsed tables in the output format) 
+        self._parsed_tables.update(pyatmos.parser.parse_photochem(input_file = output_directory+'/out.out',
                                     output_directory = output_directory,
-                                    debug=self._debug )
+                                    debug=self._debug,
+                                    output_format=self._output_format ))
 
         #########################################
         # Add *basic* plots to the output directory 
@@ -276,10 +758,8 @@ class Simulation():
 
         # get the clima dataframe
         try:
-            import pandas as pd 
             # plotting for clima
-            self.debug('read pandas dataframe {0}'.format(output_directory+'/parsed_clima_final.csv'))
-            clima_df = pd.read_csv(output_directory+'/parsed_clima_final.csv')
+            clima_df = self._parsed_tables['parsed_clima_final']
             self.debug('Creating plot {0}'.format(output_directory+'/pressure_altitide.pdf'))
             pyatmos.util.plot_scatter(clima_df, xvariable='P', xlabel='Pressure [bar]', yvariable='ALT', ylabel='Altitide [km]', save_name = output_directory+'/pressure_altitide.pdf')   
             self.debug('Creating plot {0}'.format(output_directory+'/pressure_temperature.pdf'))
@@ -290,10 +770,8 @@ class Simulation():
 
         try:
             # get photochem dataframes 
-            self.debug('read pandas dataframe {0}'.format(output_directory+'/parsed_photochem_mixing_ratios.csv'))
-            photo_mixing_df = pd.read_csv(output_directory+'/parsed_photochem_mixing_ratios.csv')
-            self.debug('read pandas dataframe {0}'.format(output_directory+'/parsed_photochem_fluxes.csv'))
-            photo_flux_df   = pd.read_csv(output_directory+'/parsed_photochem_fluxes.csv')
+            photo_mixing_df = self._parsed_tables['parsed_photochem_mixing_ratios'].copy()
+            photo_flux_df   = self._parsed_tables['parsed_photochem_fluxes'].copy()
             # convert cm to km 
             photo_mixing_df['Z']  = photo_mixing_df['Z']/1e5
             photo_flux_df['Z']    = photo_flux_df['Z']/1e5 
@@ -312,6 +790,102 @@ class Simulation():
 
         return 'success' 
 
+    #_________________________________________________________________________
+    @contextlib.contextmanager
+    def _run_workspace(self):
+        '''
+        Point the atmos directory to a fresh clone of code_path for the duration of a run, then delete the clone 
+        Does nothing unless a workspace_directory was given (local mode)
+        '''
+        if self._workspace_manager is None:
+            yield
+            return
+
+        with self._workspace_manager.clone() as workspace:
+            self.debug('running in workspace {0}'.format(workspace.path))
+            self._atmos_directory = workspace.path
+            self._installed_template = self._template
+            self._compiled_parameters = None
+            try:
+                yield
+            finally:
+                self._atmos_directory = self._code_path
+                self._installed_template = self._template
+                self._compiled_parameters = None
+
+    #_________________________________________________________________________
+    def atmos_restored(self):
+        '''
+        To be called once atmos has been restored to its original state (e.g. by pyatmos.container_pool.reset_container),
+        it is set up with the template of the Simulation again. 
+        The binaries are not restored (see pyatmos.workspace.HARDLINKED_FILES), so the parameters.inc they were compiled with is kept
+        '''
+        self._installed_template = self._template
+
+    #_________________________________________________________________________
+    def _read_atmos_files(self, file_names):
+        '''
+        Read files of atmos in one transfer
+        Args:
+            file_names: list of paths relative to the atmos directory
+        Returns:
+            dictionary of { 'relative path' : bytes }, missing files are left out
+        '''
+        contents = self._get_files([self._atmos_directory+'/'+file_name for file_name in file_names])
+        return { file_name : contents[self._atmos_directory+'/'+file_name] for file_name in file_names if self._atmos_directory+'/'+file_name in contents }
+
+    #_________________________________________________________________________
+    def _use_template(self, name=None):
+        '''
+        Set atmos up for a run with a template: write the template files into atmos if another template is in place, 
+        and recompile photochem and clima if the parameters.inc of the template differs from the one they were compiled with 
+        (which is not necessarily the parameters.inc in place, e.g. once a container has been reset)
+        Args:
+            name: string (optional), name of the template, defaults to the template of the Simulation
+        Returns:
+            pyatmos.templates.Template
+        '''
+        name = name or self._template
+        template = self._template_registry.get(name, self._read_atmos_files)
+        if self._compiled_parameters is None:
+            parameters_file = pyatmos.templates.TEMPLATE_FILES['parameters.inc'][1]
+            self._compiled_parameters = self._read_atmos_files([parameters_file]).get(parameters_file)
+        if name != self._installed_template:
+            print('Switching atmos from template {0} to {1}'.format(self._installed_template, name))
+            self._put_files(template.installed_files(self._atmos_directory))
+            self._installed_template = name
+        if template.file('parameters.inc') != self._compiled_parameters:
+            # the binaries must be compiled from the files of the template, which are not those in place if atmos was edited after 
+            # the template was registered
+            parameters_file = pyatmos.templates.TEMPLATE_FILES['parameters.inc'][1]
+            if self._read_atmos_files([parameters_file]).get(parameters_file) != template.file('parameters.inc'):
+                self._put_files(template.installed_files(self._atmos_directory))
+            # compiled with empty parameters if compiling failed, so that it is compiled again for the next run
+            self._compiled_parameters = template.file('parameters.inc') if self._compile(name) else b''
+        self._run_template = template
+        return template
+
+    #_________________________________________________________________________
+    def _compile(self, template):
+        '''
+        Recompile photochem and clima in the atmos directory for a template, through the build cache if there is one
+        Returns:
+            bool, False if a model could not be compiled
+        '''
+        self._code_version = None
+        if self._build_cache is not None and self._docker_image is None:
+            compiled = True
+            for model in pyatmos.build.MODELS:
+                if self._build_cache.install(self._atmos_directory, model, template) is None:
+                    print('ERROR: could not compile {0} for template {1}'.format(model, template))
+                    compiled = False
+            return compiled
+        print('Compiling atmos for template {0} ...'.format(template))
+        if self._generic_run("sh -c 'cd {0} && make -f PhotoMake clean && make -f PhotoMake && make -f ClimaMake clean && make -f ClimaMake'".format(self._atmos_directory)) != 0:
+            print('ERROR: could not compile atmos for template {0}'.format(template))
+            return False
+        return True
+
     #_________________________________________________________________________
     def write_metadata(self, output_path, extra_information = {}):
         metadata = self.get_metadata()
@@ -331,26 +905,30 @@ class Simulation():
                 'photochem_duration' : self._photochem_duration,
                 'photochem_iterations' : self._n_photochem_iterations,  
                 'clima_duration' : self._clima_duration,
-                #'clima_iterations' : self._n_clima_iterations, # TO DO, clima iterations not set   
+                'clima_iterations' : self._n_clima_iterations,
                 'atmos_run_duration' : self._run_time_end - self._run_time_start,
                 'input_max_clima_iterations' : self._max_clima_steps,
                 'input_max_photochem_iterations' : self._max_photochem_iterations,
                 'input_species_concentrations' : self._species_concentrations,
+                'template' : self._run_template.name if self._run_template is not None else None,
                 'write_logfiles' : self._save_logfiles,
-                'run_iteration_call' : self._run_iteration_call
+                'run_iteration_call' : self._run_iteration_call,
+                'cache_hit' : self._cache_hit,
+                'warm_start' : self._warm_start,
+                'coupling_iterations' : self._coupling_iterations
                 }
 
     #_________________________________________________________________________
-    def _run_photochem(self, species_concentrations, species_fluxes, max_photochem_iterations, output_directory, previous_photochem_solution):
+    def _run_photochem(self, species_concentrations, species_fluxes, max_photochem_iterations, output_directory, previous_photochem_solution, divergence_rule=None):
         '''
         Function to actually run the photochemical model, copies the results once finished 
+        The output of photochem is followed while it runs, and photochem is killed as soon as it can no longer converge (see pyatmos.monitor.PhotochemMonitor)
         '''
 
         ################################
         # modify species file, changes the concentrations inside species.dat as specified by species_concentrations
         ################################
-        #self._modify_atmospheric_species(self._atmos_directory+'/PHOTOCHEM/INPUTFILES/species.dat', species_concentrations, species_fluxes) 
-        self._modify_atmospheric_species(self._atmos_directory+'/PHOTOCHEM/INPUTFILES/TEMPLATES/ModernEarth/species.dat', species_concentrations, species_fluxes) 
+        self._modify_atmospheric_species(self._run_template or self._use_template(), species_concentrations, species_fluxes) 
         print('Modified species file with concentrations: {0}'.format(species_concentrations) )
         print('Modified species file with fluxes: {0}'.format(species_fluxes) )
 
@@ -366,16 +944,16 @@ class Simulation():
         ################################
         self._photochem_duration = pyatmos.util.UTC_now()
         print('About to run photochem ... ')
-        if self._docker_image is not None:
-            self._container.exec_run('./Photo.run')
-        else:
-            if self._save_logfiles:
-                self._generic_run('cd {0} && ./Photo.run > {1}/Photo_log.txt 2>&1'.format(self._atmos_directory, output_directory))
-                #self._generic_run('cd {0} && ./Photo.run 2>&1 | tee {1}/Photo_log.txt'.format(self._atmos_directory, output_directory))
-            else:
-                self._generic_run('cd {0} && ./Photo.run'.format(self._atmos_directory))
+        monitor = pyatmos.monitor.PhotochemMonitor(max_photochem_iterations, divergence_rule)
+        log_file_name = output_directory+'/Photo_log.txt' if self._save_logfiles else None
+        aborted = self._stream_command('./Photo.run', log_file_name, monitor, self._limits.get('photochem'), 'photochem_timeout')
         self._photochem_duration = pyatmos.util.UTC_now() - self._photochem_duration 
 
+        if aborted is not None:
+            self._n_photochem_iterations = monitor.iteration
+            print('photochem aborted after {0} iterations (EMAX = {1}): {2}'.format(monitor.iteration, monitor.emax, aborted))
+            return aborted
+
         # check for convergence of photochem   
         try:
             [photochem_converged, n_photochem_iterations] = self._check_photochem_convergence(max_photochem_iterations)
@@ -394,11 +972,12 @@ class Simulation():
         ################################
 
         print('Copying photochem results to {0}'.format(output_directory))
-        self._copy_container_file(self._atmos_directory+'/PHOTOCHEM/OUTPUT/out.out', output_directory)
-        self._copy_container_file(self._atmos_directory+'/PHOTOCHEM/OUTPUT/out.dist', output_directory) 
-        self._copy_container_file(self._atmos_directory+'/PHOTOCHEM/INPUTFILES/species.dat', output_directory)
-        # this command may not work if photochem has not been run before? 
-        self._copy_container_file(self._atmos_directory+'/PHOTOCHEM/in.dist', output_directory) # save the "in.dist" file that _was_ used for the next run 
+        self._copy_container_files([
+            self._atmos_directory+'/PHOTOCHEM/OUTPUT/out.out',
+            self._atmos_directory+'/PHOTOCHEM/OUTPUT/out.dist',
+            self._atmos_directory+'/PHOTOCHEM/INPUTFILES/species.dat',
+            self._atmos_directory+'/PHOTOCHEM/in.dist', # save the "in.dist" file that _was_ used for the next run (may not exist if photochem has not been run before)
+            ], output_directory)
 
         # Internal copy of photochem results inside the docker image, ready for the next run of photochem 
         self._generic_run("cp  {0}/PHOTOCHEM/OUTPUT/out.dist {0}/PHOTOCHEM/in.dist".format(self._atmos_directory))
@@ -408,9 +987,16 @@ class Simulation():
         return 'success' 
 
     #_________________________________________________________________________
-    def _run_clima(self, max_clima_steps, output_directory, methane_concentration, previous_clima_solution=None):
-
-
+    def _run_clima(self, max_clima_steps, output_directory, methane_concentration, previous_clima_solution=None, early_stop=None, step_callback=None):
+        '''
+        Function to actually run the climate model, copies the results once finished 
+        If early_stop is given (keyword arguments of pyatmos.monitor.ClimaMonitor), the steps clima writes to clima_allout.tab are followed 
+        while it runs. Once clima has settled it is stopped, and run again with NSTEPS set to the converged step so that it writes its final tables 
+        If step_callback is given, it is called with the record of every step as clima writes it to clima_allout.tab (see pyatmos.monitor.ClimaTail), 
+        clima is cancelled if it returns True
+        Returns:
+            True if clima ran without error, False if it crashed, 'clima_timeout' if it exceeded its limits, or 'clima_cancelled'
+        '''
 
         ################################
         # Deal with clima input to get it ready for running 
@@ -426,21 +1012,7 @@ class Simulation():
         # Modify CLIMA/IO/TEMPLATES/ModernEarth/input_clima.dat to change NSTEPS parameter, 
         # and also change IMET parameter depending on methane concentration.  
         clima_input = self._read_container_file(self._atmos_directory+'/CLIMA/IO/input_clima.dat') # clima_input: file containing strings of input_clima.dat 
-        replacement_clima = [] 
-        for line in clima_input:
-            if 'NSTEPS=' in line:
-                line = 'NSTEPS=    {0}           !step number (200 recommended for coupling)\n'.format(max_clima_steps)
-            if 'IMET=' in line and methane_concentration > 1e-4:
-                line = 'IMET=      1\n'
-            if 'IUP=       1' in line:
-                line = 'IUP=       0\n' 
-            replacement_clima.append(line)
-        tmp_file_name = tempfile.NamedTemporaryFile().name
-        tmp_file = open(tmp_file_name, 'w')
-        for l in replacement_clima:
-            tmp_file.write(l)
-        tmp_file.close() # VERY important to close the file!! 
-        self._write_container_file(tmp_file_name, self._atmos_directory+'/CLIMA/IO/input_clima.dat')
+        self._write_clima_input(clima_input, max_clima_steps, methane_concentration)
 
         # Set "IUP=       0" in /CLIMA/IO/input_clima.dat 
         #self._generic_run("sed -i 's/IUP=       1/IUP=       0/g' {0}/CLIMA/IO/input_clima.dat".format(self._atmos_directory))
@@ -453,23 +1025,40 @@ class Simulation():
 
         print('running clima with {0} steps ...'.format(max_clima_steps))
         self._clima_duration = pyatmos.util.UTC_now()
-        if self._docker_image is not None:
-            self._container.exec_run('./Clima.run')
-        else:
-            if self._save_logfiles:
-                self._generic_run('cd {0} && ./Clima.run > {1}/Clima_log.txt 2>&1'.format(self._atmos_directory, output_directory))
-                #self._generic_run('cd {0} && ./Clima.run 2>&1 | tee {1}/Clima_log.txt'.format(self._atmos_directory, output_directory))
-            else:
-                self._generic_run('cd {0} && ./Clima.run'.format(self._atmos_directory))
+        log_file_name = output_directory+'/Clima_log.txt' if self._save_logfiles else None
+        monitor = pyatmos.monitor.ClimaMonitor(max_clima_steps, **early_stop) if early_stop is not None else None
+        tail = None
+        if monitor is not None or step_callback is not None:
+            # follow the steps clima writes to clima_allout.tab, not those of a previous run
+            clima_output_file = self._atmos_directory+'/CLIMA/IO/clima_allout.tab'
+            self._generic_run('rm -f {0}'.format(clima_output_file))
+            read = None
+            if self._docker_image is not None:
+                read = lambda offset: self._read_container_tail(clima_output_file, offset)
+            tail = pyatmos.monitor.ClimaTail(clima_output_file, callback=step_callback, monitor=monitor, read=read)
+        limits = self._limits.get('clima')
+        stopped = self._stream_command('./Clima.run', log_file_name, None, limits, 'clima_timeout', tail)
+        self._n_clima_iterations = tail.step if tail is not None and tail.step is not None else max_clima_steps
+
+        # clima was stopped early, run it again up to the converged step to get the final tables 
+        if stopped == 'clima_converged':
+            print('clima settled after {0} steps, running it again with {0} steps ...'.format(monitor.converged_step))
+            self._write_clima_input(clima_input, monitor.converged_step, methane_concentration)
+            stopped = self._stream_command('./Clima.run', log_file_name, None, limits, 'clima_timeout')
+            self._n_clima_iterations = monitor.converged_step
         self._clima_duration = pyatmos.util.UTC_now() - self._clima_duration 
+        if stopped in ['clima_timeout', 'clima_cancelled']:
+            return stopped
         print('finished clima after {0} seconds'.format(self._clima_duration))
 
         # copy clima output files out of docker image  
-        self._copy_container_file(self._atmos_directory+'/CLIMA/IO/clima_allout.tab', output_directory)
-        self._copy_container_file(self._atmos_directory+'/CLIMA/IO/TempOut.dat', output_directory) # potentially needed for next run
-        self._copy_container_file(self._atmos_directory+'/CLIMA/IO/TempIn.dat', output_directory) # keep for debugging purposes 
-        self._copy_container_file(self._atmos_directory+'/COUPLE/mixing_ratios.dat', output_directory)  
-        self._copy_container_file(self._atmos_directory+'/CLIMA/IO/input_clima.dat', output_directory) 
+        self._copy_container_files([
+            self._atmos_directory+'/CLIMA/IO/clima_allout.tab',
+            self._atmos_directory+'/CLIMA/IO/TempOut.dat', # potentially needed for next run
+            self._atmos_directory+'/CLIMA/IO/TempIn.dat', # keep for debugging purposes 
+            self._atmos_directory+'/COUPLE/mixing_ratios.dat',
+            self._atmos_directory+'/CLIMA/IO/input_clima.dat',
+            ], output_directory)
 
 
         # post-process catch clima errors 
@@ -486,6 +1075,23 @@ class Simulation():
 
         return True 
 
+    #_________________________________________________________________________
+    def _write_clima_input(self, clima_input, max_clima_steps, methane_concentration):
+        '''
+        Write CLIMA/IO/input_clima.dat from clima_input (list of lines) with NSTEPS set to max_clima_steps, 
+        IMET depending on the methane concentration, and IUP set to 0 
+        '''
+        replacement_clima = [] 
+        for line in clima_input:
+            if 'NSTEPS=' in line:
+                line = 'NSTEPS=    {0}           !step number (200 recommended for coupling)\n'.format(max_clima_steps)
+            if 'IMET=' in line and methane_concentration > 1e-4:
+                line = 'IMET=      1\n'
+            if 'IUP=       1' in line:
+                line = 'IUP=       0\n' 
+            replacement_clima.append(line)
+        self._write_container_text(''.join(replacement_clima), self._atmos_directory+'/CLIMA/IO/input_clima.dat')
+
 
     
     #_________________________________________________________________________
@@ -494,18 +1100,15 @@ class Simulation():
         '''
         Return the gas flux at the suface from the processed photochem output file
         Args:
-            parsed_photochem_file: a processed photochem file with fluxes, in csv format
+            parsed_photochem_file: a processed photochem file with fluxes, in any of the formats of pyatmos.tables (the extension can be left out),
+                                   or the pyatmos.result.RunResult returned by run(), which keeps the fluxes once computed
             gas_fluxes: list of gases to get the flux for
         Returns:
             A dictionary of {'gas' : flux }
         '''
-        import pandas as pd
-        df = pd.read_csv(parsed_photochem_file)
-        fluxes = df[df['Z'] == 0]
-        surface_fluxes = {}
-        for gas in gas_fluxes:
-            surface_fluxes['flux_'+gas] = float(fluxes[gas]) # save only the float, that's all we need!
-        return surface_fluxes
+        if isinstance(parsed_photochem_file, pyatmos.result.RunResult):
+            return parsed_photochem_file.surface_fluxes(gas_fluxes)
+        return pyatmos.result.surface_fluxes(pyatmos.tables.read_table(parsed_photochem_file), gas_fluxes)
 
 
 
@@ -515,14 +1118,13 @@ class Simulation():
         '''
         Return the surface temperature in Kelvin [K] from the processed clima output 
         Args:
-            parsed_clima_file: a processed clima file in csv format
+            parsed_clima_file: a processed clima file in any of the formats of pyatmos.tables (the extension can be left out), or a RunResult
         Returns:
             temperature at the surface in Kelvin
         '''
-        import pandas as pd 
-        df = pd.read_csv(parsed_clima_file)
-        temp = df[df['ALT'] ==0]['T']
-        return float(temp) 
+        if isinstance(parsed_clima_file, pyatmos.result.RunResult):
+            return parsed_clima_file.surface_temperature
+        return pyatmos.result.surface_temperature(pyatmos.tables.read_table(parsed_clima_file))
         
 
     #_________________________________________________________________________
@@ -531,24 +1133,25 @@ class Simulation():
         '''
         Return the surface pressure in [bar] from the processed clima output
         Args:
-            parsed_clima_file: a processed clima file in csv format
+            parsed_clima_file: a processed clima file in any of the formats of pyatmos.tables (the extension can be left out), or a RunResult
         Returns:
             pressure at the surface in bar
         '''
-        import pandas as pd
-        df = pd.read_csv(parsed_clima_file)
-        pressure = df[df['ALT'] ==0]['P']
-        return float(pressure)
+        if isinstance(parsed_clima_file, pyatmos.result.RunResult):
+            return parsed_clima_file.surface_pressure
+        return pyatmos.result.surface_pressure(pyatmos.tables.read_table(parsed_clima_file))
 
     #_________________________________________________________________________
     @staticmethod
     def get_final_clima_deviation(parsed_clima_file):
-        import pandas as pd
-        df = pd.read_csv(parsed_clima_file)
-        n_iterations = df['NST'].max()
-        new_df = df[df['NST'] == n_iterations]
-        DIVFrms = new_df['DIVFrms']
-        return float(DIVFrms)
+        '''
+        Return DIVFrms at the last step of clima
+        Args:
+            parsed_clima_file: the processed steps of clima (parsed_clima_iterations), or a RunResult
+        '''
+        if isinstance(parsed_clima_file, pyatmos.result.RunResult):
+            return parsed_clima_file.final_clima_deviation
+        return pyatmos.result.final_clima_deviation(pyatmos.tables.read_table(parsed_clima_file))
 
 
     #_________________________________________________________________________
@@ -561,12 +1164,11 @@ class Simulation():
 
 
     #_________________________________________________________________________
-    def _modify_atmospheric_species(self, old_species_filename, species_concentrations, species_fluxes):
+    def _modify_atmospheric_species(self, template, species_concentrations, species_fluxes):
         '''
-        Modify the species file (species_file_name) to find-and-replace the concentrations listed in species_concentrations
-        Copies the files out of the docker image, modifies them, and then puts them back 
+        Write the species file of a template with the concentrations and fluxes listed in species_concentrations and species_fluxes
         Args:
-            old_species_filename: string, path to species file inside the docker image
+            template: pyatmos.templates.Template, its species.dat is parsed once
             species_concentrations: dictionary, containing species' concentrations' to modify
             species_fluxes: dictionary, containing species' fluxes to modify 
         '''
@@ -576,12 +1178,8 @@ class Simulation():
         ll_fluxes, sl_fluxes                 = self.split_dictionary(species_fluxes, 'N2')
         
 
-        # copy existing species file
-        tmp_input_file_name = tempfile.NamedTemporaryFile().name
-        self._copy_container_file( old_species_filename, tmp_input_file_name )
-        
-        # parse existing species file
-        longlived_df, other_df = pyatmos.modify_species_file.speciesfile_to_df(tmp_input_file_name)
+        # copies of the parsed species file of the template
+        longlived_df, other_df = template.species()
 
         # modify the species dataframes with the new concentrations and fluxes 
         longlived_df = pyatmos.modify_species_file.modify_flux(longlived_df, ll_fluxes)
@@ -591,16 +1189,12 @@ class Simulation():
         other_df = pyatmos.modify_species_file.modify_concentrations(other_df, sl_concentrations)
 
         # write the new species file 
-        new_species_filename = tempfile.NamedTemporaryFile().name
-        ofile = open(new_species_filename, 'w')
-        ofile.write( pyatmos.modify_species_file.species_header() ) 
-        ofile.write( pyatmos.modify_species_file.write_species_longlived( longlived_df ))
-        ofile.write( pyatmos.modify_species_file.write_species_other( other_df ))
-        ofile.close()
+        new_species = pyatmos.modify_species_file.species_header()
+        new_species += pyatmos.modify_species_file.write_species_longlived( longlived_df )
+        new_species += pyatmos.modify_species_file.write_species_other( other_df )
 
         # Over-write the species file 
-        #self._write_container_file(new_species_filename, old_species_filename) 
-        self._write_container_file(new_species_filename, self._atmos_directory+'/PHOTOCHEM/INPUTFILES/species.dat' ) 
+        self._write_container_text(new_species, self._atmos_directory+'/PHOTOCHEM/INPUTFILES/species.dat' ) 
     
 
     #_________________________________________________________________________
@@ -611,27 +1205,51 @@ class Simulation():
         Args:
             max_photochem_iterations: an interger with the maximum number of iterations for convergence 
         '''
-        #output = self._generic_run("grep 'N =' /code/atmos/PHOTOCHEM/OUTPUT/out.out")
-        #print('output\n')
-        #print(output)
-
-        # output is a string containing the lines of /PHOTOCHEM/OUTPUT/out.out 
-        output = self._read_container_file(self._atmos_directory+'/PHOTOCHEM/OUTPUT/out.out')
-
-        # find last "N = " and "EMAX"
-        iterations = []
-        for line in output:
-            if 'N =' in line and 'EMAX' in line:
-                iterations.append(line)
-        last_line = iterations[-1]
-        last_line = ' '.join(last_line.split()) # merge whitespace 
-        number_of_iterations = int(last_line.split()[2])
+        # only the last iteration line is read, searching out.out backwards (see pyatmos.sections)
+        out_file_name = self._atmos_directory+'/PHOTOCHEM/OUTPUT/out.out'
+        if self._docker_image is None:
+            index = pyatmos.sections.SectionIndex(out_file_name, save_index=False)
+        else:
+            index = pyatmos.sections.SectionIndex(data=self._read_container_bytes(out_file_name))
+        with index:
+            last_iteration = index.last_iteration()
+        if last_iteration is None:
+            raise IndexError('no iteration line in {0}'.format(out_file_name))
+        number_of_iterations = last_iteration[0]
 
         if number_of_iterations < max_photochem_iterations:
             return [True, number_of_iterations]
         else:
             return [False, number_of_iterations] 
 
+    #_________________________________________________________________________
+    def _put_files(self, files):
+        '''
+        Writes files INTO the docker image (or the local atmos directory), in one transfer 
+        Args:
+            files: dictionary of { 'path inside docker image' : content (bytes or string) }
+        '''
+        self.debug('put {0}'.format(list(files.keys())))
+        if self._docker_image is not None:
+            pyatmos.transfer.put_files(self._container, files)
+        else:
+            pyatmos.transfer.put_local_files(files)
+
+    #_________________________________________________________________________
+    def _get_files(self, file_names):
+        '''
+        Reads files OUT of the docker image (or the local atmos directory), in one transfer 
+        Args:
+            file_names: list of paths inside the docker image
+        Returns:
+            dictionary of { 'path inside docker image' : bytes }, missing files are left out
+        '''
+        self.debug('get {0}'.format(file_names))
+        if self._docker_image is not None:
+            return pyatmos.transfer.get_files(self._container, file_names)
+        else:
+            return pyatmos.transfer.get_local_files(file_names)
+
     #_________________________________________________________________________
     def _write_container_file(self, input_file_name, output_file_name):
         '''
@@ -640,12 +1258,8 @@ class Simulation():
             input_file_name: string, path of file on local filesystem
             output_file_name: string, path of file inside docker image
         '''
-        if self._docker_image is not None:
-            cmd = 'docker cp {0} {1}:{2}'.format(input_file_name, self._container.name, output_file_name)
-        else:
-            cmd = 'cp {0} {1}'.format(input_file_name, output_file_name)
-        self.debug(cmd)
-        os.system(cmd)
+        with open(input_file_name, 'rb') as file:
+            self._put_files({ output_file_name : file.read() })
 
     #_________________________________________________________________________
     def _copy_container_file(self, input_file_name, output_path):
@@ -655,26 +1269,195 @@ class Simulation():
             input_file_name: string, path of file inside the docker image
             output_path: string, destination path (or directory) of file 
         '''
+        if os.path.isdir(output_path):
+            self._copy_container_files([input_file_name], output_path)
+            return
 
-        if self._docker_image is not None:
-            cmd = 'docker cp ' + self._container.name +':'+input_file_name + ' ' + output_path  
-        else:
-            cmd = 'cp {0} {1}'.format(input_file_name, output_path)
-        self.debug(cmd)
-        os.system(cmd) 
+        for content in self._get_files([input_file_name]).values():
+            with open(output_path, 'wb') as file:
+                file.write(content)
+
+    #_________________________________________________________________________
+    def _copy_container_files(self, input_file_names, output_directory):
+        '''
+        Copies several files OUT of the docker image into a directory, in one transfer
+        Args:
+            input_file_names: list of paths of files inside the docker image
+            output_directory: string, destination directory
+        '''
+        if self._docker_image is None:
+            for input_file_name in input_file_names:
+                if os.path.exists(input_file_name):
+                    self.debug('cp {0} {1}'.format(input_file_name, output_directory))
+                    shutil.copy(input_file_name, output_directory)
+            return
+
+        for input_file_name, content in self._get_files(input_file_names).items():
+            with open(os.path.join(output_directory, os.path.basename(input_file_name)), 'wb') as file:
+                file.write(content)
 
 
+    #_________________________________________________________________________
+    def _write_container_text(self, text, output_file_name):
+        '''
+        Writes a string INTO the docker image as a file, without going through a file on the host
+        Args:
+            text: string, content of the file
+            output_file_name: string, path of file inside docker image
+        '''
+        self._put_files({ output_file_name : text })
+
+    #_________________________________________________________________________
+    def _read_container_bytes(self, container_file_name):
+        '''
+        Read a file out of the container into memory
+        Returns:
+            bytes, content of the file
+        '''
+        files = self._get_files([container_file_name])
+        if container_file_name not in files:
+            raise FileNotFoundError(container_file_name)
+        return files[container_file_name]
+
     #_________________________________________________________________________
     def _read_container_file(self, container_file_name):
         '''
-        Copy file out of the container and turn it into python strings 
+        Read a file out of the container and turn it into python strings (one per line), in memory 
         '''
-        tmp_file_name = tempfile.NamedTemporaryFile().name
-        self._copy_container_file(container_file_name, tmp_file_name) 
-        #cmd = 'docker cp ' + self._container.name + ':' + container_file_name + ' ' + tmp_file_name
-        #self.debug(cmd)
-        #os.system(cmd)
-        return pyatmos.util.strings_file(tmp_file_name)
+        return self._read_container_bytes(container_file_name).decode(errors='replace').splitlines(True)
+
+    #_________________________________________________________________________
+    def _read_container_tail(self, container_file_name, offset):
+        '''
+        Read the end of a file out of the container, from offset (see pyatmos.monitor.ClimaTail)
+        Returns:
+            bytes, empty if the file does not exist (yet)
+        '''
+        status, output = self._container.exec_run(['sh', '-c', 'tail -c +{0} {1} 2>/dev/null'.format(offset+1, container_file_name)])
+        return output if status == 0 else b''
+
+    #_________________________________________________________________________
+    def _stream_command(self, command, log_file_name=None, monitor=None, limits=None, timeout_status='timeout', tail=None, poll_interval=1.0):
+        '''
+        Runs a model executable (e.g. './Photo.run') in the atmos directory, and follows its output line by line while it runs 
+        Args:
+            command: string, the command to be executed
+            log_file_name: string (optional), path of a file (on the host) the output is written to
+            monitor: object with an update(line) method (optional), the command is killed as soon as update() returns something other than None
+            limits: dictionary (optional), resource limits of the command { 'wall_time' : seconds, 'cpu_time' : seconds, 'memory' : bytes }, 
+                    all keys optional. The command is killed after wall_time seconds, or once it has used cpu_time seconds of CPU 
+                    (RLIMIT_CPU, ulimit -t in docker). memory limits its address space (RLIMIT_AS, ulimit -v in docker)
+            timeout_status: value returned if the command was killed for exceeding wall_time or cpu_time
+            tail: object with a poll() method and a status attribute (optional, see pyatmos.monitor.ClimaTail), to follow an output file 
+                  of the command rather than its output stream. It is polled every poll_interval seconds while the command runs, and once 
+                  more after it finished. The command is killed as soon as status is something other than None
+            poll_interval: float, seconds between two polls of tail
+        Returns:
+            the value returned by monitor.update() (or the status of tail) that caused the command to be killed, timeout_status if the command exceeded its limits, 
+            or None if it ran to completion
+        '''
+        self.debug(command)
+        limits = limits or {}
+
+        if self._docker_image is not None:
+            # remember the pid of the command inside the container, so that it can be killed
+            pid_file = '/tmp/pyatmos_{0}.pid'.format(command.strip('./').split()[0])
+            ulimits = ''
+            if limits.get('cpu_time'):
+                ulimits += 'ulimit -t {0}; '.format(int(math.ceil(limits['cpu_time'])))
+            if limits.get('memory'):
+                ulimits += 'ulimit -v {0}; '.format(int(limits['memory']/1024))
+            exec_command = ['sh', '-c', 'echo $$ > {0}; {1}exec {2} 2>&1'.format(pid_file, ulimits, command)]
+            # low level api, to get the exit code of the command once it has finished
+            api = self._container.client.api
+            exec_id = api.exec_create(self._container.id, exec_command)['Id']
+            stream = api.exec_start(exec_id, stream=True)
+            process = None
+        else:
+            preexec_fn = (lambda: _set_resource_limits(limits)) if limits else None
+            process = subprocess.Popen(command, shell=True, cwd=self._atmos_directory, preexec_fn=preexec_fn,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+            stream = process.stdout
+
+        def kill():
+            if process is not None:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            else:
+                self._container.exec_run(['sh', '-c', 'kill -9 $(cat {0})'.format(pid_file)])
+
+        # polls the output file followed by tail, kills the command from its own thread
+        stop_polling = threading.Event()
+        tail_killed = threading.Event()
+        poller = None
+        if tail is not None:
+            def poll():
+                while not stop_polling.wait(poll_interval):
+                    tail.poll()
+                    if tail.status is not None:
+                        tail_killed.set()
+                        kill()
+                        return
+            poller = threading.Thread(target=poll)
+            poller.daemon = True
+            poller.start()
+
+        # wall clock watchdog, kills the command from its own thread
+        timed_out = threading.Event()
+        timer = None
+        if limits.get('wall_time'):
+            def watchdog():
+                timed_out.set()
+                kill()
+            timer = threading.Timer(limits['wall_time'], watchdog)
+            timer.daemon = True
+            timer.start()
+
+        log_file = open(log_file_name, 'w') if log_file_name else None
+        aborted = None
+        try:
+            for line in pyatmos.util.iterate_lines(stream):
+                if log_file is not None:
+                    log_file.write(line)
+                elif process is not None:
+                    print(line, end='')
+
+                if monitor is not None:
+                    aborted = monitor.update(line)
+                    if aborted is not None:
+                        self.debug('killing {0}: {1}'.format(command, aborted))
+                        kill()
+                        break
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if log_file is not None:
+                log_file.close()
+            if process is not None:
+                process.stdout.close()
+                process.wait()
+            if poller is not None:
+                stop_polling.set()
+                poller.join()
+
+        if tail is not None:
+            # the steps written since the last poll
+            tail.poll()
+            if tail_killed.is_set():
+                self.debug('killed {0}: {1}'.format(command, tail.status))
+                return tail.status
+
+        if aborted is not None:
+            return aborted
+
+        # the command was killed by the watchdog, or by the kernel once it used up its cpu time
+        exit_code = process.returncode if process is not None else api.exec_inspect(exec_id).get('ExitCode')
+        if timed_out.is_set() or (limits.get('cpu_time') and _killed_by_limit(exit_code)):
+            print('{0} exceeded its limits {1} and was killed'.format(command, limits))
+            return timeout_status
+        return None
 
     #_________________________________________________________________________
     def _generic_run(self, command):
@@ -682,17 +1465,20 @@ class Simulation():
         Runs command either inside docker or simple os system command
         Args:
             command: string, the command to be executed
+        Returns:
+            int, exit status of the command, 0 if it succeeded
         '''
         if self._docker_image is not None:
-            self._container.exec_run(command)
+            status = self._container.exec_run(command)[0]
         else:
-            os.system(command)
+            status = os.system(command)
 
 
         if self._debug: 
             caller_name = inspect.stack()[1][3]
             debug_message = '{0}(): {1}'.format(caller_name, command)
             print(pyatmos.util.printcol(debug_message, 'yellow'))
+        return status
 
 
 
@@ -746,6 +1532,6 @@ class Simulation():
     #_________________________________________________________________________
     def close(self):
         print('Exiting...')
-        if (self._container is not None) and (self._docker_image is not None):
+        if (self._container is not None) and (self._docker_image is not None) and self._owns_container:
             print('Container {0} killed.'.format(self._container.name))
             self._container.kill()
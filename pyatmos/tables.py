@@ -0,0 +1,132 @@
+import os
+
+# Formats the parsed tables of photochem and clima can be written in, with their file extension.
+# csv is the default, feather and parquet need pyarrow
+FORMATS = {
+        'csv' : '.csv',
+        'npz' : '.npz',
+        'feather' : '.feather',
+        'parquet' : '.parquet',
+        }
+
+# Order of preference of read_table() between files of a table written at the same time, the binary formats first
+READ_ORDER = ['feather', 'parquet', 'npz', 'csv']
+
+
+#_________________________________________________________________________
+def unique_columns(columns):
+    '''
+    Rename repeated column names the way pandas.read_csv does ('Z', 'Z.1', 'Z.2'), the binary formats need unique names
+    Args:
+        columns: list of column names
+    Returns:
+        list of strings
+    '''
+    names = []
+    for column in columns:
+        name = str(column)
+        n = 0
+        while name in names:
+            n += 1
+            name = '{0}.{1}'.format(column, n)
+        names.append(name)
+    return names
+
+
+#_________________________________________________________________________
+def columnar(df):
+    '''
+    The columnar form of a parsed table, as it is stored in the binary formats: float64 columns with unique names, no index
+    Args:
+        df: pandas dataframe
+    Returns:
+        pandas dataframe
+    '''
+    import numpy as np
+    df = df.reset_index(drop=True)
+    df.columns = unique_columns(df.columns)
+    return df.astype(np.float64)
+
+
+#_________________________________________________________________________
+def write_table(df, path, output_format='csv', index=True):
+    '''
+    Write a parsed table
+    Args:
+        df: pandas dataframe
+        path: string, path of the file without its extension (e.g. output_directory+'/parsed_photochem_fluxes')
+        output_format: string, one of FORMATS. The binary formats store the columns as float64, without the index
+        index: bool, write the index as the first column (csv only)
+    Returns:
+        path of the file written
+    '''
+    import numpy as np
+    if output_format not in FORMATS:
+        raise ValueError('unknown output format {0}, expected one of {1}'.format(output_format, sorted(FORMATS)))
+    file_name = path+FORMATS[output_format]
+    if output_format == 'csv':
+        df.to_csv(file_name, index=index)
+        return file_name
+
+    df = columnar(df)
+    if output_format == 'npz':
+        # not compressed, so that loading the values is a plain read
+        np.savez(file_name, columns=np.array(df.columns, dtype=str), values=df.to_numpy())
+    elif output_format == 'feather':
+        df.to_feather(file_name, compression='uncompressed')
+    elif output_format == 'parquet':
+        df.to_parquet(file_name, index=False)
+    return file_name
+
+
+#_________________________________________________________________________
+def find_table(path):
+    '''
+    Find the file of a parsed table
+    Args:
+        path: string, path of the file with or without its extension
+    Returns:
+        (path of the file, format). When a table was written in several formats, the newest file is taken
+        (e.g. the csv of a run parsed again after a feather file was written), then the first in READ_ORDER
+    '''
+    extension = os.path.splitext(path)[1]
+    for output_format, format_extension in FORMATS.items():
+        if extension == format_extension:
+            return path, output_format
+    found = []
+    for preference, output_format in enumerate(READ_ORDER):
+        try:
+            found.append((os.stat(path+FORMATS[output_format]).st_mtime_ns, -preference, output_format))
+        except OSError:
+            continue
+    if found:
+        output_format = max(found)[2]
+        return path+FORMATS[output_format], output_format
+    raise IOError('no parsed table {0} ({1})'.format(path, ', '.join(FORMATS[output_format] for output_format in READ_ORDER)))
+
+
+#_________________________________________________________________________
+def read_table(path, columns=None, memory_map=True):
+    '''
+    Read a parsed table written by write_table() (or by the parsers of older versions of pyatmos, in csv)
+    Args:
+        path: string, path of the file, the extension can be left out (see find_table())
+        columns: list of strings (optional), only read these columns, the feather and parquet files only load them from disk
+        memory_map: bool, memory-map the feather and parquet files instead of reading them
+    Returns:
+        pandas dataframe
+    '''
+    import pandas as pd
+    file_name, output_format = find_table(path)
+    if output_format == 'csv':
+        return pd.read_csv(file_name, usecols=columns)
+    if output_format == 'npz':
+        import numpy as np
+        with np.load(file_name) as npz:
+            df = pd.DataFrame(data=npz['values'], columns=list(npz['columns']))
+        return df[columns] if columns is not None else df
+    if output_format == 'feather':
+        import pyarrow.feather
+        return pyarrow.feather.read_table(file_name, columns=columns, memory_map=memory_map).to_pandas()
+    import pyarrow.parquet
+    return pyarrow.parquet.read_table(file_name, columns=columns, memory_map=memory_map).to_pandas()
@@ -0,0 +1,140 @@
+import threading
+
+import pyatmos
+
+# Files of a template: { 'file name' : (path of the template file, path of the file atmos reads) }, relative to the atmos directory,
+# {0} is the name of the template. Mirrors docker/pyatmos_coupled_init.sh
+TEMPLATE_FILES = {
+        'species.dat' : ('PHOTOCHEM/INPUTFILES/TEMPLATES/{0}/species.dat', 'PHOTOCHEM/INPUTFILES/species.dat'),
+        'input_photchem.dat' : ('PHOTOCHEM/INPUTFILES/TEMPLATES/{0}/input_photchem.dat', 'PHOTOCHEM/INPUTFILES/input_photchem.dat'),
+        'reactions.rx' : ('PHOTOCHEM/INPUTFILES/TEMPLATES/{0}/reactions.rx', 'PHOTOCHEM/INPUTFILES/reactions.rx'),
+        'parameters.inc' : ('PHOTOCHEM/INPUTFILES/TEMPLATES/{0}/parameters.inc', 'PHOTOCHEM/INPUTFILES/parameters.inc'),
+        'PLANET.dat' : ('PHOTOCHEM/INPUTFILES/TEMPLATES/{0}/PLANET.dat', 'PHOTOCHEM/INPUTFILES/PLANET.dat'),
+        'in.dist' : ('PHOTOCHEM/INPUTFILES/TEMPLATES/{0}/in.dist', 'PHOTOCHEM/in.dist'),
+        'input_clima.dat' : ('CLIMA/IO/TEMPLATES/{0}/input_clima.dat', 'CLIMA/IO/input_clima.dat'),
+        }
+
+
+#_________________________________________________________________________
+def parse_input_file(lines):
+    '''
+    Parse an input file of photochem or clima (input_photchem.dat, input_clima.dat), made of lines such as
+        NSTEPS=    10           !step number
+    Args:
+        lines: list of strings, the lines of the file
+    Returns:
+        dictionary of { 'parameter' : 'value as written in the file' }
+    '''
+    parameters = {}
+    for line in lines:
+        line = line.split('!')[0]
+        if line.startswith('*') or '=' not in line:
+            continue
+        name, value = line.split('=', 1)
+        parameters[name.strip()] = value.strip()
+    return parameters
+
+
+#_________________________________________________________________________
+class Template():
+    def __init__(self, name, files):
+        '''
+        A planet template of atmos, parsed once. Treat it as read-only: the accessors return copies
+        name: string, name of the template directory (e.g. 'ModernEarth')
+        files: dictionary of { 'file name' : bytes }, see TEMPLATE_FILES. Files missing from the template are left out
+        '''
+        self.name = name
+        self._files = dict(files)
+        self.digest = pyatmos.cache.ResultCache.key({'name' : name, 'files' : self._files})
+
+        self._lines = { file_name : tuple(content.decode(errors='replace').splitlines(True)) for file_name, content in self._files.items()
+                        if file_name != 'in.dist' }
+        self._species = None
+        if 'species.dat' in self._lines:
+            self._species = pyatmos.modify_species_file.species_lines_to_df(self._lines['species.dat'])
+        self._parameters = { file_name : parse_input_file(self._lines[file_name]) for file_name in ['input_photchem.dat', 'input_clima.dat']
+                             if file_name in self._lines }
+
+    #_________________________________________________________________________
+    def file(self, file_name):
+        '''
+        Returns:
+            bytes, content of a file of the template, None if the template does not have it
+        '''
+        return self._files.get(file_name)
+
+    #_________________________________________________________________________
+    def lines(self, file_name):
+        '''
+        Returns:
+            list of strings, the lines of a text file of the template
+        '''
+        return list(self._lines.get(file_name, ()))
+
+    #_________________________________________________________________________
+    def species(self):
+        '''
+        Returns:
+            copies of the long-lived and other species dataframes of species.dat, see pyatmos.modify_species_file.speciesfile_to_df
+        '''
+        if self._species is None:
+            raise ValueError('template {0} has no species.dat'.format(self.name))
+        longlived_df, other_df = self._species
+        return longlived_df.copy(), other_df.copy()
+
+    #_________________________________________________________________________
+    def parameters(self, file_name):
+        '''
+        Returns:
+            dictionary of the parameters of input_photchem.dat or input_clima.dat, see parse_input_file()
+        '''
+        return dict(self._parameters.get(file_name, {}))
+
+    #_________________________________________________________________________
+    def installed_files(self, atmos_directory):
+        '''
+        Returns:
+            dictionary of { 'path atmos reads the file from' : bytes }, to set atmos up with this template
+        '''
+        return { atmos_directory+'/'+TEMPLATE_FILES[file_name][1] : content for file_name, content in self._files.items() }
+
+
+#_________________________________________________________________________
+class TemplateRegistry():
+    def __init__(self):
+        '''
+        Parsed templates of one atmos tree, kept in memory so that each template is only read and parsed once.
+        Can be shared by the Simulations (and threads) of a process that use the same atmos tree
+        '''
+        self._templates = {}
+        self._lock      = threading.Lock()
+
+    #_________________________________________________________________________
+    def get(self, name, read_files):
+        '''
+        Look up a template, reading and parsing it the first time
+        Args:
+            name: string, name of the template directory (e.g. 'ModernEarth', 'ArcheanEarth')
+            read_files: callable, takes a list of paths relative to the atmos directory and returns { 'path' : bytes }
+                        (missing files left out), e.g. reads them out of the docker container
+        Returns:
+            Template
+        '''
+        with self._lock:
+            template = self._templates.get(name)
+            if template is None:
+                paths = { file_name : source.format(name) for file_name, (source, destination) in TEMPLATE_FILES.items() }
+                contents = read_files(list(paths.values()))
+                if paths['species.dat'] not in contents:
+                    raise ValueError('template {0} not found'.format(name))
+                template = Template(name, { file_name : contents[path] for file_name, path in paths.items() if path in contents })
+                self._templates[name] = template
+            return template
+
+    #_________________________________________________________________________
+    def names(self):
+        '''
+        Returns:
+            list of the names of the templates parsed so far
+        '''
+        return sorted(self._templates)
@@ -0,0 +1,159 @@
+import docker
+import io
+import os
+import shlex
+import tarfile
+import time
+
+# mktemp template of the temporary archives made inside the container to fetch several files in one stream
+TRANSFER_ARCHIVE = '/tmp/pyatmos_transfer.XXXXXX'
+
+
+#_________________________________________________________________________
+def _to_bytes(content):
+    if isinstance(content, str):
+        return content.encode()
+    return content
+
+
+#_________________________________________________________________________
+def make_archive(files):
+    '''
+    Build an in-memory tar archive
+    Args:
+        files: dictionary of { 'absolute path' : content (bytes or string) }
+    Returns:
+        bytes of the tar archive, paths are stored relative to '/'
+    '''
+    stream = io.BytesIO()
+    now = time.time()
+    with tarfile.open(fileobj=stream, mode='w') as archive:
+        for path, content in files.items():
+            content = _to_bytes(content)
+            info = tarfile.TarInfo(name=path.lstrip('/'))
+            info.size = len(content)
+            info.mode = 0o644
+            info.mtime = now
+            archive.addfile(info, io.BytesIO(content))
+    return stream.getvalue()
+
+
+#_________________________________________________________________________
+def read_archive(data):
+    '''
+    Extract the regular files of a tar archive into memory
+    Args:
+        data: bytes of the tar archive
+    Returns:
+        dictionary of { 'path inside the archive' : bytes }
+    '''
+    files = {}
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r') as archive:
+        for member in archive.getmembers():
+            if member.isfile():
+                files[member.name] = archive.extractfile(member).read()
+    return files
+
+
+#_________________________________________________________________________
+def put_files(container, files):
+    '''
+    Write several files into a container with a single put_archive call
+    Args:
+        container: docker container
+        files: dictionary of { 'absolute path inside the container' : content (bytes or string) }
+    '''
+    if not files:
+        return
+    if not container.put_archive('/', make_archive(files)):
+        raise IOError('put_archive failed for {0}'.format(list(files.keys())))
+
+
+#_________________________________________________________________________
+def get_files(container, paths):
+    '''
+    Read several files out of a container as one tar stream.
+    The files are first packed into a temporary archive inside the container (see TRANSFER_ARCHIVE), which is then fetched 
+    with get_archive and removed
+    Args:
+        container: docker container
+        paths: list of absolute paths inside the container
+    Returns:
+        dictionary of { 'absolute path' : bytes }, files that do not exist are left out
+    '''
+    if not paths:
+        return {}
+
+    if len(paths) == 1:
+        archive_path = paths[0]
+    else:
+        relative_paths = ' '.join([shlex.quote(path.lstrip('/')) for path in paths])
+        command = 'archive=$(mktemp {0}) && {{ tar -cf "$archive" -C / {1} 2>/dev/null; echo "$archive"; }}'.format(TRANSFER_ARCHIVE, relative_paths)
+        exit_code, output = container.exec_run(['sh', '-c', command])
+        if exit_code != 0:
+            return {}
+        archive_path = output.decode().strip()
+
+    try:
+        stream, _ = container.get_archive(archive_path)
+        data = b''.join(stream)
+    except docker.errors.NotFound:
+        return {}
+    finally:
+        if len(paths) > 1:
+            container.exec_run(['rm', '-f', archive_path])
+    outer = read_archive(data)
+    if not outer:
+        return {}
+
+    if len(paths) == 1:
+        # get_archive stores the file under its base name
+        return { paths[0] : list(outer.values())[0] }
+
+    files = read_archive(list(outer.values())[0])
+    contents = {}
+    for path in paths:
+        name = os.path.normpath(path).lstrip('/')
+        if name in files:
+            contents[path] = files[name]
+    return contents
+
+
+#_________________________________________________________________________
+def put_local_files(files):
+    '''
+    Local counterpart of put_files().
+    Each file is written to a temporary file that then replaces the target, so the target is never modified
+    in place (it may be hardlinked to other workspaces, see pyatmos.workspace)
+    Args:
+        files: dictionary of { 'path' : content (bytes or string) }
+    '''
+    for path, content in files.items():
+        tmp_path = '{0}.pyatmos_tmp'.format(path)
+        try:
+            with open(tmp_path, 'wb') as file:
+                file.write(_to_bytes(content))
+            os.replace(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+#_________________________________________________________________________
+def get_local_files(paths):
+    '''
+    Local counterpart of get_files()
+    Args:
+        paths: list of paths
+    Returns:
+        dictionary of { 'path' : bytes }, files that do not exist are left out
+    '''
+    files = {}
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                files[path] = file.read()
+        except FileNotFoundError:
+            pass
+    return files
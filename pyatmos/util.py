@@ -29,6 +29,30 @@ def UTC_now():
     unixtime = calendar.timegm(d.utctimetuple())
     return unixtime 
 
+#____________________________________________________________________________
+def append_line(file_name, line, sync=False):
+    '''
+    Append a line to a file of records, in a single write so that lines written by several processes do not interleave.
+    If the file does not end with a newline (a write interrupted by a crash), the line is started on a new line, 
+    so that only the torn record is lost
+    Args:
+        file_name: string, path of the file (created if needed)
+        line: string, ending with a newline
+        sync: bool, fsync the file once written
+    '''
+    import os
+    os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+    data = line.encode()
+    with open(file_name, 'a+b') as file:
+        if file.seek(0, os.SEEK_END) > 0:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b'\n':
+                data = b'\n'+data
+        file.write(data)
+        file.flush()
+        if sync:
+            os.fsync(file.fileno())
+
 #____________________________________________________________________________
 def strings_file(file_name):
     li = []
@@ -37,6 +61,27 @@ def strings_file(file_name):
             li.append(line)
     return li 
 
+#____________________________________________________________________________
+def iterate_lines(chunks):
+    '''
+    Turn a stream of chunks (bytes or strings, e.g. the output of a process) into complete lines 
+    Args:
+        chunks: iterable of bytes or strings, split at arbitrary positions
+    Yields:
+        strings, one per line, including the trailing newline (except maybe for the last one)
+    '''
+    buffer = ''
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode(errors='replace')
+        buffer += chunk
+        lines = buffer.split('\n')
+        buffer = lines.pop()
+        for line in lines:
+            yield line+'\n'
+    if buffer:
+        yield buffer
+
 #____________________________________________________________________________
 def printcol(text, fgcol='white', style='normal', bgcol='none'):
     '''
@@ -0,0 +1,148 @@
+import os
+import json
+import math
+
+import pyatmos
+
+# Statuses of Simulation.run for which the converged solutions can be used to start other runs
+PHOTOCHEM_CONVERGED_STATUSES = ['success', 'clima_error']
+CLIMA_CONVERGED_STATUSES     = ['success']
+
+# Solution files of a run, relative to its output directory
+SOLUTION_FILES = {
+        'photochem' : 'out.dist',
+        'clima' : 'TempOut.dat',
+        }
+
+
+#_________________________________________________________________________
+def run_features(species_concentrations=None, species_fluxes=None, flux_scaling=None):
+    '''
+    Turn the input parameters of a run into a feature vector, in which runs are compared
+    Concentrations are log10 scaled, fluxes are scaled with a signed log10(1+|flux|) since they can be zero or negative
+    Args:
+        species_concentrations: dictionary (optional), see Simulation.run
+        species_fluxes: dictionary (optional), see Simulation.run
+        flux_scaling: float (optional), SOLCON, see Simulation.run_distance_modification
+    Returns:
+        dictionary of { 'feature name' : float }
+    '''
+    features = {}
+    for species, concentration in (species_concentrations or {}).items():
+        features['concentration_'+species] = math.log10(max(float(concentration), 1e-300))
+    for species, flux in (species_fluxes or {}).items():
+        flux = float(flux)
+        features['flux_'+species] = math.copysign(math.log10(1+abs(flux)), flux)
+    if flux_scaling is not None:
+        features['SOLCON'] = float(flux_scaling)
+    return features
+
+
+#_________________________________________________________________________
+def distance(features_a, features_b, missing_penalty=1.0):
+    '''
+    Euclidean distance between two feature vectors (see run_features())
+    A feature set in only one of the vectors (e.g. a species left at its template value) adds missing_penalty
+    '''
+    total = 0
+    for name in set(features_a).union(features_b):
+        if name in features_a and name in features_b:
+            total += (features_a[name] - features_b[name])**2
+        else:
+            total += missing_penalty**2
+    return math.sqrt(total)
+
+
+#_________________________________________________________________________
+class SolutionIndex():
+    def __init__(self, index_file, max_distance=None, missing_penalty=1.0):
+        '''
+        Index of the converged solutions of past runs, to start new runs from the closest one (see Simulation(solution_index=...))
+        The index is a file with one json record per line:
+            { 'features' : ..., 'output_directory' : ..., 'photochem' : path to out.dist, 'clima' : path to TempOut.dat }
+        Records are only ever appended, so the index can be shared by the workers of a SimulationPool.
+        The latest record of an output directory replaces the previous ones.
+        index_file: string, path of the index file (created if needed)
+        max_distance: float (optional), solutions further away than this are not used
+        missing_penalty: float, see distance()
+        '''
+        self._index_file      = index_file
+        self._max_distance    = max_distance
+        self._missing_penalty = missing_penalty
+        self._records         = {}
+        self._offset          = 0
+
+    #_________________________________________________________________________
+    def _load(self):
+        '''
+        Read the records appended to the index file since the last call
+        '''
+        if not os.path.exists(self._index_file):
+            return
+        with open(self._index_file, 'rb') as file:
+            file.seek(self._offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    # being written by another process
+                    break
+                self._offset += len(line)
+                try:
+                    record = json.loads(line.decode())
+                except ValueError:
+                    continue
+                self._records[record['output_directory']] = record
+
+    #_________________________________________________________________________
+    @property
+    def records(self):
+        self._load()
+        return list(self._records.values())
+
+    #_________________________________________________________________________
+    def add(self, features, output_directory, status):
+        '''
+        Add the solutions of a finished run to the index
+        Args:
+            features: dictionary, see run_features()
+            output_directory: string, output directory of the run
+            status: string, status of the run, see Simulation.run (or 'clima_converged' for run_distance_modification)
+        Returns:
+            the record added. Its solutions are None if the run did not converge, which also hides the solutions 
+            of previous runs made in the same output directory
+        '''
+        record = {'features' : features, 'output_directory' : os.path.abspath(output_directory), 'photochem' : None, 'clima' : None}
+        if status in PHOTOCHEM_CONVERGED_STATUSES:
+            record['photochem'] = os.path.join(record['output_directory'], SOLUTION_FILES['photochem'])
+        if status in CLIMA_CONVERGED_STATUSES + ['clima_converged']:
+            record['clima'] = os.path.join(record['output_directory'], SOLUTION_FILES['clima'])
+        for kind in SOLUTION_FILES:
+            if record[kind] is not None and not os.path.exists(record[kind]):
+                record[kind] = None
+
+        pyatmos.util.append_line(self._index_file, json.dumps(record, sort_keys=True)+'\n')
+        return record
+
+    #_________________________________________________________________________
+    def nearest(self, features, kind='photochem'):
+        '''
+        Find the closest converged solution
+        Args:
+            features: dictionary, see run_features()
+            kind: string, 'photochem' (out.dist) or 'clima' (TempOut.dat)
+        Returns:
+            path of the solution file, or None if there is no solution close enough
+        '''
+        best_path = None
+        best_distance = self._max_distance
+        for record in self.records:
+            path = record[kind]
+            if path is None:
+                continue
+            d = distance(features, record['features'], self._missing_penalty)
+            if best_distance is not None and d >= best_distance:
+                continue
+            if not os.path.exists(path):
+                continue
+            best_path = path
+            best_distance = d
+        return best_path
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import contextlib
+import socketserver
+import xmlrpc.client
+import xmlrpc.server
+
+import pyatmos
+from .pool import run_spec
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spec TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT
+)
+'''
+
+
+#_________________________________________________________________________
+class WorkQueue():
+    def __init__(self, database_file, lease_duration=600, max_attempts=3):
+        '''
+        Queue of run specs in an SQLite database. Workers lease one job at a time, and must renew the lease (heartbeat) while
+        the job runs. The job of a worker that died goes back to the queue once its lease has expired.
+        Jobs are 'pending', 'leased', 'done' (the result was reported) or 'failed' (leased max_attempts times without result)
+        The database can be shared by processes on the same machine, other machines must go through a Coordinator:
+        lease() is exclusive because of the file locks of SQLite, which network filesystems such as NFS do not implement reliably
+        database_file: string, path of the database (created if needed)
+        lease_duration: float, seconds a lease is valid for without heartbeat
+        max_attempts: int, number of times a job is handed out before it is given up
+        '''
+        self._database_file  = database_file
+        self._lease_duration = lease_duration
+        self._max_attempts   = max_attempts
+        with self._connect() as connection:
+            connection.execute(_SCHEMA)
+
+    #_________________________________________________________________________
+    @contextlib.contextmanager
+    def _connect(self):
+        '''
+        One connection per operation, so that the queue can be used from several threads and processes.
+        The transaction takes the write lock immediately, so that two workers never lease the same job
+        '''
+        connection = sqlite3.connect(self._database_file, timeout=60, isolation_level=None)
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+                connection.execute('COMMIT')
+            except:
+                connection.execute('ROLLBACK')
+                raise
+        finally:
+            connection.close()
+
+    #_________________________________________________________________________
+    def add(self, specs):
+        '''
+        Add run specs to the queue
+        Args:
+            specs: list of dictionaries, see SimulationPool.imap
+        Returns:
+            list of job ids
+        '''
+        with self._connect() as connection:
+            return [connection.execute('INSERT INTO jobs (spec) VALUES (?)', (json.dumps(spec, sort_keys=True),)).lastrowid for spec in specs]
+
+    #_________________________________________________________________________
+    def _requeue_expired(self, connection):
+        now = time.time()
+        connection.execute("UPDATE jobs SET state = 'failed' WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, self._max_attempts))
+        connection.execute("UPDATE jobs SET state = 'pending', worker = NULL WHERE state = 'leased' AND lease_expires < ?", (now,))
+
+    #_________________________________________________________________________
+    def lease(self, worker):
+        '''
+        Take the next pending job
+        Args:
+            worker: string, identifier of the worker
+        Returns:
+            (job id, spec as a json string), or None if there is no pending job
+        '''
+        with self._connect() as connection:
+            self._requeue_expired(connection)
+            row = connection.execute("SELECT id, spec FROM jobs WHERE state = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                               (worker, time.time() + self._lease_duration, row[0]))
+            return list(row)
+
+    #_________________________________________________________________________
+    def heartbeat(self, job_id, worker):
+        '''
+        Renew the lease of a job
+        Returns:
+            bool, False if the job is no longer leased by this worker (its lease expired and it was handed to another worker)
+        '''
+        with self._connect() as connection:
+            cursor = connection.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                                        (time.time() + self._lease_duration, job_id, worker))
+            return cursor.rowcount == 1
+
+    #_________________________________________________________________________
+    def complete(self, job_id, worker, result):
+        '''
+        Report the result of a job
+        Args:
+            result: string, json of the result dictionary (see pyatmos.pool.run_spec)
+        Returns:
+            bool, False if the job is no longer leased by this worker
+        '''
+        with self._connect() as connection:
+            cursor = connection.execute("UPDATE jobs SET state = 'done', result = ?, lease_expires = NULL WHERE id = ? AND worker = ? AND state = 'leased'",
+                                        (result, job_id, worker))
+            return cursor.rowcount == 1
+
+    #_________________________________________________________________________
+    def counts(self):
+        '''
+        Returns:
+            dictionary of { 'state' : number of jobs }, for all the states
+        '''
+        with self._connect() as connection:
+            self._requeue_expired(connection)
+            counts = {'pending' : 0, 'leased' : 0, 'done' : 0, 'failed' : 0}
+            for state, count in connection.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state'):
+                counts[state] = count
+            return counts
+
+    #_________________________________________________________________________
+    def finished(self):
+        '''
+        Returns:
+            bool, True once no job is pending or leased
+        '''
+        counts = self.counts()
+        return counts['pending'] == 0 and counts['leased'] == 0
+
+    #_________________________________________________________________________
+    def results(self):
+        '''
+        Returns:
+            list of dictionaries with keys 'id', 'spec', 'state', 'attempts' and 'result', in the order the jobs were added
+        '''
+        with self._connect() as connection:
+            rows = connection.execute('SELECT id, spec, state, attempts, result FROM jobs ORDER BY id').fetchall()
+        return [{'id' : job_id, 'spec' : json.loads(spec), 'state' : state, 'attempts' : attempts, 'result' : json.loads(result) if result else None}
+                for job_id, spec, state, attempts, result in rows]
+
+
+#_________________________________________________________________________
+class _ThreadedXMLRPCServer(socketserver.ThreadingMixIn, xmlrpc.server.SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+#_________________________________________________________________________
+class Coordinator():
+    def __init__(self, queue, host='0.0.0.0', port=8765):
+        '''
+        Serves a WorkQueue to workers on other machines, over XML-RPC
+        queue: WorkQueue
+        host: string, address to listen on
+        port: int, port to listen on (0 picks a free port, see the port attribute)
+        '''
+        self._queue = queue
+        self._server = _ThreadedXMLRPCServer((host, port), logRequests=False, allow_none=True)
+        for name in ['lease', 'heartbeat', 'complete', 'counts', 'finished']:
+            self._server.register_function(getattr(queue, name), name)
+        self.port = self._server.server_address[1]
+
+    #_________________________________________________________________________
+    def serve(self, exit_when_finished=True, poll_interval=1.0):
+        '''
+        Serve the queue, until all the jobs are done or failed if exit_when_finished
+        '''
+        print('Coordinator listening on port {0}'.format(self.port))
+        self._server.timeout = poll_interval
+        try:
+            while not (exit_when_finished and self._queue.finished()):
+                self._server.handle_request()
+        finally:
+            self._server.server_close()
+        print('All jobs finished: {0}'.format(self._queue.counts()))
+
+
+#_________________________________________________________________________
+def connect(address, lease_duration=600):
+    '''
+    Connect to a work queue
+    Args:
+        address: string, 'http://host:port' of a Coordinator, or the path of the database of a WorkQueue. 
+                 The database can only be used directly by processes on the machine that holds it (see WorkQueue), 
+                 workers on other machines must connect to a Coordinator
+    Returns:
+        object with the lease(), heartbeat(), complete(), counts() and finished() methods of WorkQueue
+    '''
+    if address.startswith('http://'):
+        return xmlrpc.client.ServerProxy(address, allow_none=True)
+    return WorkQueue(address, lease_duration)
+
+
+#_________________________________________________________________________
+class Worker():
+    def __init__(self, address, simulation_kwargs, worker_id=None, heartbeat_interval=60, poll_interval=10):
+        '''
+        Pulls jobs from a work queue, runs them through a Simulation and reports the results, until the queue is finished
+        address: string, see connect()
+        simulation_kwargs: dictionary, keyword arguments of pyatmos.Simulation
+        worker_id: string (optional), identifier of the worker, defaults to hostname:pid
+        heartbeat_interval: float, seconds between two renewals of the lease of the running job, must be well under the lease duration of the queue
+        poll_interval: float, seconds to wait when no job is pending but some are still leased by other workers (they are requeued if a worker dies)
+        '''
+        self._address            = address
+        self._simulation_kwargs  = simulation_kwargs
+        self._worker_id          = worker_id or '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        self._heartbeat_interval = heartbeat_interval
+        self._poll_interval      = poll_interval
+
+    #_________________________________________________________________________
+    def _heartbeat(self, job_id, stop):
+        '''
+        Renews the lease of job_id until stop is set, runs in its own thread with its own connection
+        '''
+        queue = connect(self._address)
+        while not stop.wait(self._heartbeat_interval):
+            if not queue.heartbeat(job_id, self._worker_id):
+                print('Lost the lease of job {0}'.format(job_id))
+
+    #_________________________________________________________________________
+    def run(self):
+        '''
+        Run jobs until the queue is finished
+        Returns:
+            int, number of jobs run
+        '''
+        queue = connect(self._address)
+        simulation_kwargs = dict(self._simulation_kwargs)
+        workspace_root = None
+        if simulation_kwargs.get('code_path') is not None and simulation_kwargs.get('workspace_directory') is None:
+            workspace_root = tempfile.mkdtemp(prefix='pyatmos_worker_')
+            simulation_kwargs['workspace_directory'] = workspace_root
+        simulation = pyatmos.Simulation(**simulation_kwargs)
+        simulation.start()
+
+        n_jobs = 0
+        try:
+            while True:
+                try:
+                    job = queue.lease(self._worker_id)
+                    if job is None and queue.finished():
+                        break
+                except ConnectionError:
+                    # the coordinator exits once all the jobs are finished
+                    print('Coordinator {0} is gone'.format(self._address))
+                    break
+                if job is None:
+                    time.sleep(self._poll_interval)
+                    continue
+
+                job_id, spec = job
+                print('Worker {0} running job {1}'.format(self._worker_id, job_id))
+                stop = threading.Event()
+                heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, stop), daemon=True)
+                heartbeat.start()
+                try:
+                    result = run_spec(simulation, job_id, json.loads(spec))
+                finally:
+                    stop.set()
+                    heartbeat.join()
+                result['worker'] = self._worker_id
+                queue.complete(job_id, self._worker_id, json.dumps(result, default=str))
+                n_jobs += 1
+        finally:
+            simulation.close()
+            if workspace_root is not None:
+                shutil.rmtree(workspace_root, ignore_errors=True)
+        print('Worker {0} finished after {1} jobs'.format(self._worker_id, n_jobs))
+        return n_jobs
@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import errno
+
+# Directories (relative to the atmos directory) whose files are modified, either by pyatmos or by the Fortran models.
+# Only the files directly inside these directories are copied, sub-directories such as TEMPLATES are not
+COPIED_DIRECTORIES = ['', 'PHOTOCHEM', 'PHOTOCHEM/INPUTFILES', 'CLIMA/IO']
+
+# Directories that are written to as a whole by the models, every file below them is copied
+COPIED_TREES = ['PHOTOCHEM/OUTPUT', 'COUPLE']
+
+# Files inside COPIED_DIRECTORIES that are never modified (the compiled models), these are hardlinked
+HARDLINKED_FILES = ['Photo.run', 'Clima.run']
+
+# ioctl request number of FICLONE on linux, clones a file by sharing its extents (reflink)
+_FICLONE = 0x40049409
+
+
+#_________________________________________________________________________
+def is_copied(relative_path):
+    '''
+    Decide whether a file of the atmos tree needs a private copy in a workspace, or if it can be hardlinked
+    Args:
+        relative_path: string, path of the file relative to the atmos directory
+    Returns:
+        True if the file may be modified during a run
+    '''
+    relative_path = relative_path.replace(os.sep, '/')
+    directory, file_name = os.path.split(relative_path)
+    for tree in COPIED_TREES:
+        if relative_path.startswith(tree+'/'):
+            return True
+    if directory in COPIED_DIRECTORIES and file_name not in HARDLINKED_FILES:
+        return True
+    return False
+
+
+#_________________________________________________________________________
+class Workspace():
+    def __init__(self, path):
+        '''
+        A private clone of the atmos tree, made by WorkspaceManager.clone()
+        path: string, path to the cloned atmos directory
+        '''
+        self.path = path
+
+    #_________________________________________________________________________
+    def remove(self):
+        '''
+        Delete the clone
+        '''
+        if self.path is not None:
+            shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+            self.path = None
+
+    #_________________________________________________________________________
+    def __enter__(self):
+        return self
+
+    #_________________________________________________________________________
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.remove()
+
+
+#_________________________________________________________________________
+class WorkspaceManager():
+    def __init__(self, code_path, workspace_directory=None):
+        '''
+        Makes cheap per-run clones of a local atmos directory.
+        Large read-only inputs (DATA directories, sources, binaries) are hardlinked into the clone,
+        the few files that get modified (see COPIED_DIRECTORIES and COPIED_TREES) are copied,
+        using a reflink where the filesystem supports it.
+        code_path: string, path to the pristine atmos directory
+        workspace_directory: string (optional), where the clones are created. Defaults to the system temp directory.
+                             Should be on the same filesystem as code_path, otherwise hardlinks fall back to copies
+        '''
+        self._code_path           = os.path.abspath(code_path)
+        self._workspace_directory = workspace_directory
+        self._reflink             = True  # set to False once the filesystem refuses a reflink
+        self._hardlink            = True  # set to False once the filesystem refuses a hardlink
+
+    #_________________________________________________________________________
+    def clone(self):
+        '''
+        Clone the atmos directory
+        Returns:
+            Workspace, the path of the clone is Workspace.path
+        '''
+        if self._workspace_directory is not None:
+            os.makedirs(self._workspace_directory, exist_ok=True)
+        root = tempfile.mkdtemp(prefix='pyatmos_workspace_', dir=self._workspace_directory)
+        clone_path = os.path.join(root, os.path.basename(self._code_path))
+
+        try:
+            for directory, sub_directories, file_names in os.walk(self._code_path):
+                relative_directory = os.path.relpath(directory, self._code_path)
+                if relative_directory == '.':
+                    relative_directory = ''
+                new_directory = os.path.join(clone_path, relative_directory)
+                os.makedirs(new_directory, exist_ok=True)
+
+                # os.walk does not follow symbolic links to directories, recreate them as links
+                for name in list(sub_directories):
+                    source = os.path.join(directory, name)
+                    if os.path.islink(source):
+                        os.symlink(os.readlink(source), os.path.join(new_directory, name))
+                        sub_directories.remove(name)
+
+                for name in file_names:
+                    source      = os.path.join(directory, name)
+                    destination = os.path.join(new_directory, name)
+                    if os.path.islink(source):
+                        os.symlink(os.readlink(source), destination)
+                    elif is_copied(os.path.join(relative_directory, name)):
+                        self._copy(source, destination)
+                    else:
+                        self._link(source, destination)
+        except:
+            shutil.rmtree(root, ignore_errors=True)
+            raise
+
+        return Workspace(clone_path)
+
+    #_________________________________________________________________________
+    def _link(self, source, destination):
+        '''
+        Hardlink source to destination, copy if the filesystem does not allow it
+        '''
+        if self._hardlink:
+            try:
+                os.link(source, destination)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                self._hardlink = False
+        self._copy(source, destination)
+
+    #_________________________________________________________________________
+    def _copy(self, source, destination):
+        '''
+        Copy source to destination, as a reflink if possible
+        '''
+        if self._reflink:
+            try:
+                import fcntl
+                with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+                shutil.copystat(source, destination)
+                return
+            except (ImportError, OSError):
+                self._reflink = False
+        shutil.copy2(source, destination)
@@ -33,4 +33,5 @@ setup(
     classifiers=['Development Status :: 4 - Beta', 'License :: OSI Approved :: BSD License', 'Programming Language :: Python :: 3.5'],
     license='BSD',
     keywords='astrobiology',
+    entry_points={'console_scripts' : ['pyatmos=pyatmos.cli:main']},
 )
@@ -0,0 +1,18 @@
+'''
+Outputs of clima (clima_allout.tab) shared by the tests
+'''
+
+BINDING = " J     P         ALT         T        CONVEC       DT          TOLD        FH20       FSAVE        FO3        TCOOL       THEAT\n"
+ROW = "  {0}  1.000E-0{0}  {1}.000E+01  {2:.4E}  0  1.0E-02  2.5E+02  1.0E-03  1.0E-03  1.0E-07  1.0E+00  1.0E+00\n"
+STEP = " NST=   {0}  JCONV=  1  CHG= 1.000E+00  dt0= 1.00E+04  DIVF(1)= 1.000E-02  DIVFrms= 1.000E-0{0}  DT(ND)= 5.000E-01  T(ND)= 2.890E+02\n"
+
+def clima_allout(n_steps=2, surface_temperature=290.0, surface_row=None):
+    '''
+    Text of a clima_allout.tab: the initial table (levels at 40 km and 0 km), n_steps steps (DIVFrms of step n is 10^-n)
+    and the final table (levels at 30 km and 0 km, the surface at surface_temperature, or surface_row if given).
+    The surface pressure is 0.01 bar
+    '''
+    initial = BINDING+ROW.format(1, 4, 290.0)+ROW.format(2, 0, 290.0)+BINDING
+    steps = ''.join([STEP.format(n) for n in range(1, n_steps+1)])
+    final = BINDING+ROW.format(1, 3, 290.0)+(surface_row or ROW.format(2, 0, surface_temperature))+BINDING
+    return initial+steps+final
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+MAKEFILE = '''Photo.run: PHOTOCHEM/main.f PHOTOCHEM/INPUTFILES/parameters.inc
+\techo built >> build.log
+\tcat PHOTOCHEM/INPUTFILES/parameters.inc > Photo.run
+clean:
+\trm -f Photo.run
+'''
+
+class BuildCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.atmos = os.path.join(self.directory, 'atmos')
+        for template, size in [('ModernEarth', 'NQ=1'), ('Archean', 'NQ=2')]:
+            os.makedirs(os.path.join(self.atmos, 'PHOTOCHEM/INPUTFILES/TEMPLATES', template))
+            with open(os.path.join(self.atmos, 'PHOTOCHEM/INPUTFILES/TEMPLATES', template, 'parameters.inc'), 'w') as file:
+                file.write(size)
+        with open(os.path.join(self.atmos, 'PHOTOCHEM/main.f'), 'w') as file:
+            file.write('      END')
+        with open(os.path.join(self.atmos, 'PhotoMake'), 'w') as file:
+            file.write(MAKEFILE)
+        self.build_cache = pyatmos.build.BuildCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def n_builds(self):
+        with open(os.path.join(self.atmos, 'build.log')) as file:
+            return len(file.readlines())
+
+    def binary(self):
+        with open(os.path.join(self.atmos, 'Photo.run')) as file:
+            return file.read()
+
+    def test_install(self):
+        for template in ['ModernEarth', 'Archean', 'ModernEarth', 'Archean']:
+            self.assertIsNotNone(self.build_cache.install(self.atmos, 'photochem', template))
+        self.assertEqual(self.n_builds(), 2)
+        self.assertEqual(self.binary(), 'NQ=2')
+        self.assertTrue(os.path.islink(os.path.join(self.atmos, 'Photo.run')))
+
+        # a change of the sources invalidates the binaries
+        with open(os.path.join(self.atmos, 'PHOTOCHEM/main.f'), 'a') as file:
+            file.write('\n')
+        self.build_cache.install(self.atmos, 'photochem', 'ModernEarth')
+        self.assertEqual(self.n_builds(), 3)
+        self.assertEqual(self.binary(), 'NQ=1')
+
+    def test_build_error(self):
+        os.remove(os.path.join(self.atmos, 'PHOTOCHEM/main.f'))
+        self.assertIsNone(self.build_cache.install(self.atmos, 'photochem', 'ModernEarth'))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
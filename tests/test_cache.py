@@ -0,0 +1,87 @@
+import io
+import os
+import contextlib
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+class ResultCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_directory = os.path.join(self.directory, 'output')
+        os.makedirs(self.output_directory)
+        for file_name in ['out.out', 'out.dist']:
+            with open(os.path.join(self.output_directory, file_name), 'w') as file:
+                file.write(file_name*100)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key(self):
+        key = pyatmos.cache.ResultCache.key({'species_concentrations' : {'CH4' : 1e-4, 'O2' : 0.2}, 'files' : {'in.dist' : b'1'}})
+        self.assertEqual(key, pyatmos.cache.ResultCache.key({'files' : {'in.dist' : b'1'}, 'species_concentrations' : {'O2' : 0.2, 'CH4' : 1e-4}}))
+        self.assertNotEqual(key, pyatmos.cache.ResultCache.key({'species_concentrations' : {'CH4' : 1e-4, 'O2' : 0.2}, 'files' : {'in.dist' : b'2'}}))
+        rule = pyatmos.monitor.EmaxGrowthRule(max_growth=10)
+        self.assertEqual(pyatmos.cache.ResultCache.key({'rule' : rule}), pyatmos.cache.ResultCache.key({'rule' : pyatmos.monitor.EmaxGrowthRule(max_growth=10)}))
+
+    def test_key_callables(self):
+        key = pyatmos.cache.ResultCache.key
+        self.assertNotEqual(key({'rule' : lambda i, e, h: e > 1}), key({'rule' : lambda i, e, h: e > 2}))
+        self.assertNotEqual(key({'rule' : lambda i, e, h: e > 1}), key({'rule' : lambda i, e, h: e < 1}))
+        self.assertEqual(key({'rule' : lambda i, e, h: e > 1}), key({'rule' : lambda i, e, h: e > 1}))
+
+        def make_rule(threshold):
+            return lambda i, e, h: e > threshold
+        self.assertNotEqual(key({'rule' : make_rule(1)}), key({'rule' : make_rule(2)}))
+        self.assertEqual(key({'rule' : make_rule(1)}), key({'rule' : make_rule(1)}))
+
+        with self.assertRaises(ValueError):
+            key({'rule' : object()})
+
+    def test_put_materialize(self):
+        cache = pyatmos.cache.ResultCache(os.path.join(self.directory, 'cache'))
+        cache.put('abcd', 'photochem_nonconverged', self.output_directory, ['out.out'], {'photochem_iterations' : 10})
+        cache.put('efgh', 'error', self.output_directory, ['out.out'])
+        self.assertIsNone(cache.get('efgh'))
+
+        destination = os.path.join(self.directory, 'destination')
+        entry = cache.materialize('abcd', destination)
+        self.assertEqual(entry['status'], 'photochem_nonconverged')
+        self.assertEqual(entry['metadata']['photochem_iterations'], 10)
+        self.assertEqual(os.listdir(destination), ['out.out'])
+
+    def test_evict(self):
+        cache = pyatmos.cache.ResultCache(os.path.join(self.directory, 'cache'), max_size=1500)
+        cache.put('aaaa', 'success', self.output_directory, ['out.out'])
+        os.utime(os.path.join(self.directory, 'cache', 'aa', 'aaaa', 'entry.json'), (0, 0))
+        cache.put('bbbb', 'success', self.output_directory, ['out.out', 'out.dist'])
+        self.assertIsNone(cache.get('aaaa'))
+        self.assertIsNotNone(cache.get('bbbb'))
+
+    def test_evict_scans(self):
+        cache = pyatmos.cache.ResultCache(os.path.join(self.directory, 'cache'), max_size=2000)
+        scans = []
+        evict = cache.evict
+        cache.evict = lambda: scans.append(len(os.listdir(os.path.join(self.directory, 'cache')))) or evict()
+        for key in ['aaaa', 'bbbb']:
+            cache.put(key, 'success', self.output_directory, ['out.out'])
+        os.utime(os.path.join(self.directory, 'cache', 'aa', 'aaaa', 'entry.json'), (0, 0))
+        # only the first entry scans the cache, until it grows over max_size
+        self.assertEqual(scans, [1])
+        cache.put('cccc', 'success', self.output_directory, ['out.out'])
+        self.assertEqual(scans, [1, 3])
+        self.assertIsNone(cache.get('aaaa'))
+        self.assertIsNotNone(cache.get('cccc'))
+
+    def test_put_missing_file(self):
+        cache = pyatmos.cache.ResultCache(os.path.join(self.directory, 'cache'))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            cache.put('abcd', 'success', self.output_directory, ['out.out', 'missing.out'])
+        self.assertIn('Could not store the outputs', output.getvalue())
+        self.assertIsNone(cache.get('abcd'))
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'cache', 'ab')), [])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+from clima_fixtures import clima_allout
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class RunCatalog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.runs = [os.path.join(self.directory, 'run_{0}'.format(i)) for i in range(3)]
+        for run in self.runs:
+            os.makedirs(run)
+            shutil.copy(os.path.join(TEST_DIRECTORY, 'out.out'), run)
+            with open(os.path.join(run, 'clima_allout.tab'), 'w') as file:
+                file.write(clima_allout(n_steps=1, surface_temperature=200.0))
+        self.catalog = pyatmos.catalog.RunCatalog(os.path.join(self.directory, 'catalog.db'))
+        metadata = {'template' : 'ModernEarth', 'clima_iterations' : 50, 'run_iteration_call' : object()}
+        for run, status, methane in zip(self.runs, ['success', 'clima_error', 'success'], [1e-3, 1e-3, 1e-5]):
+            self.catalog.add(pyatmos.result.RunResult(status, run), {'CH4' : methane}, {'O2' : 1e11}, metadata)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_query(self):
+        self.assertEqual(len(self.catalog), 3)
+        self.assertEqual(self.catalog.query(status='success', concentrations={'CH4' : (1e-4, None)}, surface_temperature=(150, None)), [self.runs[0]])
+        self.assertEqual(self.catalog.query(surface_temperature=(273, None)), [])
+        self.assertEqual(self.catalog.query(status=['success', 'clima_error'], concentrations={'CH4' : 1e-3}), self.runs[:2])
+        self.assertEqual(self.catalog.query(surface_fluxes={'O2' : (60, 62)}, template='ModernEarth'), self.runs)
+        self.assertEqual(self.catalog.query(concentrations={'H2' : (None, 1)}), [])
+        self.assertEqual(self.catalog.query(clima_iterations=(None, 49)), [])
+        with self.assertRaises(ValueError):
+            self.catalog.query(metadata='x')
+
+    def test_get(self):
+        run = self.catalog.get(self.runs[1])
+        self.assertEqual(run['status'], 'clima_error')
+        self.assertIsNone(run['surface_temperature'])
+        self.assertEqual(run['surface_fluxes']['O2'], 61.21)
+        self.assertEqual(run['fluxes'], {'O2' : 1e11})
+
+        # a run made again in the same directory replaces the previous one
+        self.catalog.add(pyatmos.result.RunResult('photochem_nonconverged', self.runs[1]), {'CH4' : 1e-2})
+        self.assertEqual(len(self.catalog), 3)
+        run = self.catalog.get(self.runs[1])
+        self.assertEqual((run['status'], run['concentrations'], run['surface_fluxes']), ('photochem_nonconverged', {'CH4' : 1e-2}, {}))
+        self.assertIsNone(self.catalog.get(self.directory))
+
+class CatalogErrors(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database_file = os.path.join(self.directory, 'catalog.db')
+        catalog = pyatmos.catalog.RunCatalog(self.database_file)
+        with open(self.database_file, 'wb') as file:
+            file.write(b'not a database'*1000)
+        self.simulation = pyatmos.Simulation(code_path=self.directory, catalog=catalog)
+        self.simulation._use_template = lambda template: None
+        self.simulation._run_atmos = lambda *arguments: 'success'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_run(self):
+        # the run is finished, the catalog error is only reported
+        result = self.simulation.run(output_directory=os.path.join(self.directory, 'run_0'))
+        self.assertEqual(result.status, 'success')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,122 @@
+import os
+import queue
+import shutil
+import tempfile
+import subprocess
+import unittest
+import pyatmos
+
+class FakeContainer():
+    '''
+    Runs the commands of the pool on the local atmos tree instead of inside a container, and records them
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.commands = []
+        self.killed = False
+
+    def exec_run(self, command):
+        self.commands.append(command)
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return process.returncode, process.stdout
+
+    def kill(self):
+        self.killed = True
+
+class FakeContainers():
+    def __init__(self):
+        self.started = []
+
+    def run(self, image, detach, tty):
+        container = FakeContainer('container_{0}'.format(len(self.started)))
+        self.started.append((image, container))
+        return container
+
+class FakeDockerClient():
+    def __init__(self):
+        self.containers = FakeContainers()
+
+class FakeImage():
+    id = 'sha256:abcd'
+
+class ContainerPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.atmos_directory = os.path.join(self.directory, 'atmos')
+        for file_name in ['Photo.run', 'Clima.run', 'make.log', 'PHOTOCHEM/in.dist', 'PHOTOCHEM/INPUTFILES/species.dat', 'PHOTOCHEM/DATA/cross_sections.dat',
+                          'PHOTOCHEM/OUTPUT/out.out', 'CLIMA/IO/input_clima.dat', 'CLIMA/IO/TEMPLATES/ModernEarth/input_clima.dat', 'COUPLE/coupling_params.out']:
+            self.write(file_name, file_name)
+        self.pristine_snapshot = pyatmos.container_pool.PRISTINE_SNAPSHOT
+        pyatmos.container_pool.PRISTINE_SNAPSHOT = os.path.join(self.directory, 'pristine.tar')
+
+    def tearDown(self):
+        pyatmos.container_pool.PRISTINE_SNAPSHOT = self.pristine_snapshot
+        shutil.rmtree(self.directory)
+
+    def write(self, file_name, content):
+        path = os.path.join(self.atmos_directory, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+
+    def read(self, file_name):
+        with open(os.path.join(self.atmos_directory, file_name)) as file:
+            return file.read()
+
+    def test_writable_files_command(self):
+        command = pyatmos.container_pool._writable_files_command(self.atmos_directory)
+        output = subprocess.run(['sh', '-c', command], stdout=subprocess.PIPE, check=True).stdout.decode()
+        self.assertEqual(sorted(os.path.normpath(line) for line in output.splitlines()),
+                         ['CLIMA/IO/input_clima.dat', 'COUPLE/coupling_params.out', 'PHOTOCHEM/INPUTFILES/species.dat', 'PHOTOCHEM/OUTPUT/out.out',
+                          'PHOTOCHEM/in.dist', 'make.log'])
+
+    def test_acquire_release(self):
+        pool = pyatmos.container_pool.ContainerPool('atmos_image', 2, self.atmos_directory)
+        pool._docker_client = FakeDockerClient()
+        pool._image = FakeImage()
+
+        container = pool.acquire()
+        self.assertEqual([image for image, _ in pool._docker_client.containers.started], ['sha256:abcd', 'sha256:abcd'])
+        self.assertEqual(len(container.commands), 1)
+        self.assertTrue(os.path.isfile(pyatmos.container_pool.PRISTINE_SNAPSHOT))
+        other_container = pool.acquire()
+        self.assertIsNot(other_container, container)
+        with self.assertRaises(queue.Empty):
+            pool.acquire(timeout=0.01)
+
+        # a run modifies the inputs and writes new outputs
+        self.write('PHOTOCHEM/in.dist', 'solution')
+        self.write('PHOTOCHEM/OUTPUT/new.out', 'new')
+        self.write('COUPLE/new.out', 'new')
+        self.write('PHOTOCHEM/new.dist', 'new')
+        self.write('CLIMA/IO/TempIn.dat', 'new')
+        self.write('new.log', 'new')
+        pool.release(container)
+        self.assertEqual(len(container.commands), 2)
+        self.assertEqual(container.commands[-1][:2], ['sh', '-c'])
+        self.assertEqual(self.read('PHOTOCHEM/in.dist'), 'PHOTOCHEM/in.dist')
+        self.assertEqual(self.read('PHOTOCHEM/OUTPUT/out.out'), 'PHOTOCHEM/OUTPUT/out.out')
+        self.assertFalse(os.path.exists(os.path.join(self.atmos_directory, 'PHOTOCHEM/OUTPUT/new.out')))
+        self.assertFalse(os.path.exists(os.path.join(self.atmos_directory, 'COUPLE/new.out')))
+        for file_name in ['PHOTOCHEM/new.dist', 'CLIMA/IO/TempIn.dat', 'new.log']:
+            self.assertFalse(os.path.exists(os.path.join(self.atmos_directory, file_name)))
+        for file_name in ['make.log', 'Photo.run', 'PHOTOCHEM/INPUTFILES/species.dat', 'CLIMA/IO/TEMPLATES/ModernEarth/input_clima.dat']:
+            self.assertTrue(os.path.exists(os.path.join(self.atmos_directory, file_name)))
+        self.assertEqual(self.read('PHOTOCHEM/DATA/cross_sections.dat'), 'PHOTOCHEM/DATA/cross_sections.dat')
+        self.assertIs(pool.acquire(timeout=0.01), container)
+
+        # the container is reset even if the with block fails
+        pool.release(container)
+        with self.assertRaises(RuntimeError):
+            with pool.container(timeout=0.01) as borrowed:
+                self.write('CLIMA/IO/input_clima.dat', 'modified')
+                raise RuntimeError()
+        self.assertEqual(self.read('CLIMA/IO/input_clima.dat'), 'CLIMA/IO/input_clima.dat')
+        self.assertIs(pool.acquire(timeout=0.01), borrowed)
+
+        pool.close()
+        self.assertTrue(container.killed and other_container.killed)
+        self.assertEqual(pool.containers, [])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
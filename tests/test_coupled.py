@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+from clima_fixtures import clima_allout
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class RunCoupled(unittest.TestCase):
+    '''
+    photochem and clima are stubbed, the outputs of every iteration are the fixtures with the surface temperature of the iteration
+    '''
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.atmos_directory = os.path.join(self.directory, 'atmos')
+        self.output_directory = os.path.join(self.directory, 'output')
+        for file_name, input_file in [('input_photchem.dat', 'PHOTOCHEM/INPUTFILES/input_photchem.dat'), ('input_clima.dat', 'CLIMA/IO/input_clima.dat')]:
+            os.makedirs(os.path.dirname(os.path.join(self.atmos_directory, input_file)), exist_ok=True)
+            shutil.copy(os.path.join(TEST_DIRECTORY, file_name), os.path.join(self.atmos_directory, input_file))
+        self.simulation = pyatmos.Simulation(code_path=self.atmos_directory)
+        self.simulation._use_template = lambda template: None
+
+        self.couplings = []
+        self.temperatures = []
+        self.photochem_status = 'success'
+        self.simulation._set_coupling = lambda icouple: self.couplings.append(icouple) or {}
+        self.simulation._run_photochem = self._run_photochem
+        self.simulation._run_clima = self._run_clima
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _run_photochem(self, species_concentrations, species_fluxes, max_photochem_iterations, output_directory, previous_photochem_solution, divergence_rule):
+        shutil.copy(os.path.join(TEST_DIRECTORY, 'out.out'), output_directory)
+        return self.photochem_status
+
+    def _run_clima(self, max_clima_steps, output_directory, methane_concentration, previous_clima_solution, early_stop, step_callback):
+        with open(os.path.join(output_directory, 'clima_allout.tab'), 'w') as file:
+            file.write(clima_allout(n_steps=1, surface_temperature=self.temperatures.pop(0)))
+        return True
+
+    def test_converged(self):
+        self.temperatures = [290.0, 285.0, 285.05, 280.0]
+        result = self.simulation.run_coupled(output_directory=self.output_directory, max_coupling_iterations=10, temperature_tolerance=0.1)
+        self.assertEqual(result.status, 'success')
+        self.assertEqual(self.couplings, [1])
+        iterations = self.simulation.get_metadata()['coupling_iterations']
+        self.assertEqual([iteration['surface_temperature'] for iteration in iterations], [290.0, 285.0, 285.05])
+        self.assertEqual(iterations[2]['surface_mixing_ratios'], iterations[1]['surface_mixing_ratios'])
+        self.assertEqual(sorted(os.listdir(self.output_directory))[:3], ['clima_allout.tab', 'iteration_0', 'iteration_1'])
+        self.assertEqual(result.surface_temperature, 285.05)
+
+    def test_iteration_cap(self):
+        self.temperatures = [290.0, 285.0, 280.0, 275.0]
+        result = self.simulation.run_coupled(output_directory=self.output_directory, max_coupling_iterations=3)
+        self.assertEqual(result.status, 'coupling_nonconverged')
+        self.assertEqual(len(self.simulation.get_metadata()['coupling_iterations']), 3)
+        self.assertEqual(self.temperatures, [275.0])
+        self.assertEqual(result.surface_temperature, 280.0)
+
+    def test_photochem_failed(self):
+        self.photochem_status = 'photochem_nonconverged'
+        result = self.simulation.run_coupled(output_directory=self.output_directory)
+        self.assertEqual(result.status, 'photochem_nonconverged')
+        self.assertEqual(self.simulation.get_metadata()['coupling_iterations'], [])
+
+    def test_flux_and_concentration(self):
+        with self.assertRaises(RuntimeError):
+            self.simulation.run_coupled(species_concentrations={'CH4' : 1e-4}, species_fluxes={'CH4' : 1e11}, output_directory=self.output_directory)
+        self.assertEqual(self.couplings, [])
+        self.assertFalse(os.path.exists(self.output_directory))
+
+    def test_catalog_error(self):
+        database_file = os.path.join(self.directory, 'catalog.db')
+        self.simulation._catalog = pyatmos.catalog.RunCatalog(database_file)
+        with open(database_file, 'wb') as file:
+            file.write(b'not a database'*1000)
+        self.temperatures = [290.0, 290.0]
+        result = self.simulation.run_coupled(output_directory=self.output_directory)
+        self.assertEqual(result.status, 'success')
+
+class SetCoupling(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_files = [os.path.join(self.directory, 'PHOTOCHEM/INPUTFILES/input_photchem.dat'), os.path.join(self.directory, 'CLIMA/IO/input_clima.dat')]
+        for file_name, input_file in zip(['input_photchem.dat', 'input_clima.dat'], self.input_files):
+            os.makedirs(os.path.dirname(input_file), exist_ok=True)
+            shutil.copy(os.path.join(TEST_DIRECTORY, file_name), input_file)
+        self.original_inputs = pyatmos.transfer.get_local_files(self.input_files)
+        self.simulation = pyatmos.Simulation(code_path=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_set_coupling(self):
+        original_inputs = self.simulation._set_coupling(1)
+        self.assertEqual(original_inputs, self.original_inputs)
+        for input_file, content in pyatmos.transfer.get_local_files(self.input_files).items():
+            lines = content.decode().splitlines()
+            self.assertEqual([line for line in lines if line.startswith('ICOUPLE=')], ['ICOUPLE=   1'])
+            self.assertEqual(len(lines), len(self.original_inputs[input_file].decode().splitlines()))
+        self.simulation._set_coupling(0)
+        for content in pyatmos.transfer.get_local_files(self.input_files).values():
+            self.assertIn('ICOUPLE=   0\n', content.decode())
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import numpy as np
+import pyatmos
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class EnsembleStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store_directory = os.path.join(self.directory, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _profile(self, n_levels, temperature):
+        return {'parsed_clima_final' : pd.DataFrame({'ALT' : np.arange(n_levels, dtype=float)[::-1], 'T' : temperature+np.arange(n_levels)})}
+
+    def test_append(self):
+        store = pyatmos.ensemble.EnsembleStore(self.store_directory)
+        store.extend([('a', self._profile(3, 200.0)), ('b', self._profile(2, 300.0))])
+        store.append(3, {'parsed_clima_final' : self._profile(3, 250.0)['parsed_clima_final'].assign(P=1.0)})
+        with self.assertRaises(ValueError):
+            store.append('a', self._profile(3, 0.0))
+        with self.assertRaises(ValueError):
+            store.append('c', self._profile(4, 0.0))
+
+        store = pyatmos.ensemble.EnsembleStore(self.store_directory)
+        self.assertEqual(store.run_ids, ['a', 'b', 3])
+        self.assertEqual(store.columns('parsed_clima_final'), ['ALT', 'T', 'P'])
+        temperatures = store.load('parsed_clima_final', 'T')
+        self.assertEqual(temperatures.shape, (3, 3))
+        self.assertEqual(list(temperatures[0]), [200.0, 201.0, 202.0])
+        self.assertTrue(np.isnan(temperatures[1, 2]))
+        self.assertEqual(store.load('parsed_clima_final', 'T', runs=[3, 'a'], levels=slice(0, 1)).tolist(), [[250.0], [200.0]])
+        self.assertTrue(np.isnan(store.load('parsed_clima_final', 'P')[:2]).all())
+        self.assertEqual(len(store.frame('parsed_clima_final', 'b')), 2)
+
+    def test_interrupted_append(self):
+        store = pyatmos.ensemble.EnsembleStore(self.store_directory)
+        store.append('a', self._profile(3, 200.0))
+        # values of a run written, but not its metadata
+        with open(os.path.join(self.store_directory, 'parsed_clima_final', 'column_1.f64'), 'ab') as file:
+            np.zeros(2).tofile(file)
+        store = pyatmos.ensemble.EnsembleStore(self.store_directory)
+        self.assertEqual(len(store), 1)
+        store.append('b', self._profile(3, 300.0))
+        self.assertEqual(store.load('parsed_clima_final', 'T')[:, 0].tolist(), [200.0, 300.0])
+
+    def test_run_directory(self):
+        shutil.copy(os.path.join(TEST_DIRECTORY, 'out.out'), self.directory)
+        store = pyatmos.ensemble.EnsembleStore(self.store_directory)
+        store.append('run_0', self.directory)
+        mixing_ratios = pyatmos.result.RunResult('success', self.directory).photochem_mixing_ratios
+        self.assertEqual(store.tables, ['parsed_photochem_fluxes', 'parsed_photochem_mixing_ratios'])
+        self.assertEqual(store.load('parsed_photochem_mixing_ratios', 'O3')[0].tolist(), list(mixing_ratios['O3']))
+        self.assertTrue((store.frame('parsed_photochem_mixing_ratios', 'run_0').values == mixing_ratios.values).all())
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
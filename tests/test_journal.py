@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+class SweepJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.directory, 'journal.jsonl')
+        self.spec = {'species_concentrations' : {'CH4' : 1e-4}, 'output_directory' : os.path.join(self.directory, 'run_0'), 'run_id' : 0}
+        os.makedirs(self.spec['output_directory'])
+        with open(os.path.join(self.spec['output_directory'], 'out.out'), 'w') as file:
+            file.write('N = 1')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume(self):
+        journal = pyatmos.journal.SweepJournal(self.journal_file)
+        self.assertIsNone(journal.completed(self.spec))
+        journal.record(self.spec, {'status' : 'success'})
+
+        # a crash in the middle of writing a line
+        with open(self.journal_file, 'a') as file:
+            file.write('{"key" : ')
+
+        resumed = pyatmos.journal.SweepJournal(self.journal_file)
+        self.assertEqual(resumed.completed(dict(self.spec, run_id=5))['result']['status'], 'success')
+        self.assertIsNone(resumed.completed(dict(self.spec, species_concentrations={'CH4' : 1e-5})))
+
+    def test_record_after_torn_line(self):
+        journal = pyatmos.journal.SweepJournal(self.journal_file)
+        journal.record(self.spec, {'status' : 'success'})
+        # the crash cut the last record in the middle
+        with open(self.journal_file, 'r+') as file:
+            file.truncate(os.path.getsize(self.journal_file)//2)
+
+        other_spec = dict(self.spec, species_concentrations={'CH4' : 1e-5})
+        resumed = pyatmos.journal.SweepJournal(self.journal_file)
+        self.assertIsNone(resumed.completed(self.spec))
+        resumed.record(other_spec, {'status' : 'success'})
+
+        reloaded = pyatmos.journal.SweepJournal(self.journal_file)
+        self.assertEqual(reloaded.completed(other_spec)['result']['status'], 'success')
+        self.assertIsNone(reloaded.completed(self.spec))
+
+    def test_retry(self):
+        journal = pyatmos.journal.SweepJournal(self.journal_file, verify='hash')
+        journal.record(self.spec, {'status' : 'error'})
+        self.assertIsNone(journal.completed(self.spec))
+        journal.record(self.spec, {'status' : 'photochem_nonconverged'})
+        self.assertIsNotNone(journal.completed(self.spec))
+
+        # the outputs were modified since the run was recorded
+        with open(os.path.join(self.spec['output_directory'], 'out.out'), 'w') as file:
+            file.write('N = 2')
+        self.assertIsNone(journal.completed(self.spec))
+
+    def test_retry_statuses(self):
+        journal = pyatmos.journal.SweepJournal(self.journal_file)
+        for status in ['photochem_timeout', 'clima_timeout', 'clima_cancelled']:
+            journal.record(self.spec, {'status' : status})
+            self.assertIsNone(journal.completed(self.spec))
+        journal.record(self.spec, {'status' : 'photochem_nonconverged'})
+        self.assertIsNotNone(journal.completed(self.spec))
+        retried = pyatmos.journal.SweepJournal(self.journal_file, retried_statuses=['photochem_nonconverged'])
+        self.assertIsNone(retried.completed(self.spec))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,34 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+class ResourceLimits(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'Photo.run'), 'w') as file:
+            file.write('#!/bin/sh\necho started\nwhile true; do :; done\n')
+        os.chmod(os.path.join(self.directory, 'Photo.run'), 0o755)
+        self.simulation = pyatmos.Simulation(code_path=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_wall_time(self):
+        start = time.time()
+        status = self.simulation._stream_command('./Photo.run', limits={'wall_time' : 1}, timeout_status='photochem_timeout')
+        self.assertEqual(status, 'photochem_timeout')
+        self.assertLess(time.time()-start, 10)
+
+    def test_cpu_time(self):
+        status = self.simulation._stream_command('./Photo.run', limits={'cpu_time' : 1}, timeout_status='photochem_timeout')
+        self.assertEqual(status, 'photochem_timeout')
+
+    def test_no_limit_reached(self):
+        status = self.simulation._stream_command('echo done', limits={'wall_time' : 10, 'cpu_time' : 10})
+        self.assertIsNone(status)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,118 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+def clima_lines(divfrms, dts):
+    return [' NST=   {0}  JCONV=  0  CHG= 1.0E-01  dt0= 1.00E+04  DIVF(1)= 1.0E-03  DIVFrms= {1:.3E}  DT(ND)= {2:.3E}  T(ND)= 2.88E+02\n'.format(n+1, d, t)
+            for n, (d, t) in enumerate(zip(divfrms, dts))]
+
+class PhotochemMonitor(unittest.TestCase):
+    def _lines(self, emaxes):
+        return ['   N =    {0}   EMAX = {1:.3E} FOR SPECIES O3    AT Z =  1   TIME = 1.0E+05\n'.format(n+1, e) for n, e in enumerate(emaxes)]
+
+    def test_parse_iteration_line(self):
+        self.assertEqual(pyatmos.monitor.parse_photochem_iteration_line(self._lines([1e-3])[0]), (1, 1e-3))
+        self.assertIsNone(pyatmos.monitor.parse_photochem_iteration_line(' MIXING RATIOS OF LONG-LIVED SPECIES\n'))
+
+    def test_max_iterations(self):
+        monitor = pyatmos.monitor.PhotochemMonitor(max_iterations=3)
+        statuses = [monitor.update(line) for line in self._lines([1.0, 0.1, 0.01])]
+        self.assertEqual(statuses, [None, None, 'photochem_nonconverged'])
+        self.assertEqual(monitor.iteration, 3)
+
+    def test_divergence_rule(self):
+        monitor = pyatmos.monitor.PhotochemMonitor(max_iterations=100, divergence_rule=pyatmos.monitor.EmaxGrowthRule(max_growth=1e3, min_iterations=0))
+        statuses = [monitor.update(line) for line in self._lines([1.0, 1e-3, 1e-1, 10.0])]
+        self.assertEqual(statuses, [None, None, None, 'photochem_diverged'])
+
+class ClimaMonitor(unittest.TestCase):
+    def _lines(self, divfrms, dts):
+        return clima_lines(divfrms, dts)
+
+    def test_parse_iteration_line(self):
+        record = pyatmos.parser.parse_clima_iteration_line(self._lines([1e-4], [0.5])[0])
+        self.assertEqual(record['NST'], 1)
+        self.assertEqual(record['DIVFrms'], 1e-4)
+        self.assertEqual(record['DT(ND)'], 0.5)
+
+    def test_early_stop(self):
+        monitor = pyatmos.monitor.ClimaMonitor(max_steps=100, divfrms_tolerance=1e-3, dt_tolerance=0.1, n_steps=2)
+        statuses = [monitor.update(line) for line in self._lines([1e-2, 1e-4, 1e-2, 1e-4, 1e-5], [0.01, 0.01, 0.01, 0.01, -0.05])]
+        self.assertEqual(statuses, [None, None, None, None, 'clima_converged'])
+        self.assertEqual(monitor.converged_step, 5)
+
+    def test_no_stop_late_convergence(self):
+        # stopping and running again up to step 4 would cost more than finishing the 6 steps
+        monitor = pyatmos.monitor.ClimaMonitor(max_steps=6, divfrms_tolerance=1e-3, dt_tolerance=0.1, n_steps=1)
+        statuses = [monitor.update(line) for line in self._lines([1e-2, 1e-2, 1e-2, 1e-4, 1e-4, 1e-4], [0.01]*6)]
+        self.assertEqual(statuses, [None]*6)
+        self.assertEqual(monitor.converged_step, 4)
+
+class ClimaTail(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.lines = clima_lines([1e-2, 1e-4, 1e-5], [0.5, 0.01, 0.01])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_poll(self):
+        file_name = os.path.join(self.directory, 'clima_allout.tab')
+        published = []
+        tail = pyatmos.monitor.ClimaTail(file_name, callback=published.append)
+        self.assertEqual(tail.poll(), [])
+        with open(file_name, 'w') as file:
+            file.write(' J     P         ALT\n'+self.lines[0]+self.lines[1][:20])
+        self.assertEqual([record['NST'] for record in tail.poll()], [1])
+        self.assertEqual(tail.poll(), [])
+        with open(file_name, 'a') as file:
+            file.write(self.lines[1][20:]+self.lines[2])
+        self.assertEqual([record['NST'] for record in tail.poll()], [2, 3])
+        self.assertEqual(tail.offset, os.path.getsize(file_name))
+        self.assertEqual([record['DIVFrms'] for record in published], [1e-2, 1e-4, 1e-5])
+
+    def test_cancel(self):
+        monitor = pyatmos.monitor.ClimaMonitor(max_steps=100, divfrms_tolerance=1e-3, dt_tolerance=0.1, n_steps=1)
+        tail = pyatmos.monitor.ClimaTail(callback=lambda record: record['NST'] >= 3, monitor=monitor)
+        self.assertEqual([tail.update(line) for line in self.lines], [None, 'clima_converged', 'clima_converged'])
+        tail = pyatmos.monitor.ClimaTail(callback=lambda record: record['NST'] >= 2)
+        self.assertEqual([record['NST'] for record in tail.feed(''.join(self.lines))], [1, 2, 3])
+        self.assertEqual(tail.status, 'clima_cancelled')
+        self.assertEqual(tail.step, 3)
+
+    def test_stream_command(self):
+        # clima writes its steps to clima_allout.tab only, not to its output stream
+        file_name = os.path.join(self.directory, 'clima_allout.tab')
+        with open(os.path.join(self.directory, 'Clima.run'), 'w') as file:
+            file.write('#!/bin/sh\n'+''.join(["printf '%s' '{0}' >> clima_allout.tab\nsleep 0.1\n".format(line) for line in self.lines])+'sleep 30\n')
+        os.chmod(os.path.join(self.directory, 'Clima.run'), 0o755)
+        simulation = pyatmos.Simulation(code_path=self.directory)
+        monitor = pyatmos.monitor.ClimaMonitor(max_steps=100, divfrms_tolerance=1e-3, dt_tolerance=0.1, n_steps=1)
+        tail = pyatmos.monitor.ClimaTail(file_name, monitor=monitor)
+        start = time.time()
+        status = simulation._stream_command('./Clima.run', tail=tail, poll_interval=0.05)
+        self.assertEqual(status, 'clima_converged')
+        self.assertLess(time.time()-start, 10)
+        self.assertEqual(monitor.converged_step, 2)
+
+        # a file that is not on this machine
+        data = ''.join(self.lines).encode()
+        tail = pyatmos.monitor.ClimaTail(read=lambda offset: data[offset:])
+        self.assertEqual([record['NST'] for record in tail.poll()], [1, 2, 3])
+        self.assertEqual(tail.poll(), [])
+        self.assertEqual(tail.offset, len(data))
+
+class CouplingConverged(unittest.TestCase):
+    def test_coupling_converged(self):
+        state = {'T' : 288.0, 'P' : 1.0, 'mixing_ratios' : {'O3' : 1e-6, 'CH4' : 1.8e-6}}
+        close = {'T' : 288.05, 'P' : 1.0005, 'mixing_ratios' : {'O3' : 1.005e-6, 'CH4' : 1.8e-6}}
+        self.assertFalse(pyatmos.monitor.coupling_converged(None, state))
+        self.assertTrue(pyatmos.monitor.coupling_converged(state, close))
+        self.assertFalse(pyatmos.monitor.coupling_converged(state, dict(close, T=289.0)))
+        self.assertFalse(pyatmos.monitor.coupling_converged(state, dict(close, mixing_ratios={'O3' : 2e-6, 'CH4' : 1.8e-6})))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
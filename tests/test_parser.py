@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class ParsePhotochem(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # parse_photochem keeps the index of out.out next to it
+        self.input_file = os.path.join(self.directory, 'out.out')
+        shutil.copy(os.path.join(TEST_DIRECTORY, 'out.out'), self.input_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_iterate_tables(self):
+        with open(self.input_file) as file:
+            tables = list(pyatmos.parser.iterate_photochem_tables(file))
+        # the iteration lines before the first block (N = ... AT Z = ...) look like tables too
+        tables = [table for table in tables if table[1] > 0]
+        self.assertEqual([(kind, block) for kind, block, table in tables],
+                         [('mixing_ratios', 1), ('mixing_ratios', 1), ('mixing_ratios', 2), ('mixing_ratios', 2), ('fluxes', 2), ('fluxes', 2)])
+        kind, block, table = tables[2]
+        self.assertEqual(table[0], ['Z', 'O', 'O2', 'H2O', 'CH4'])
+        self.assertEqual(table[1][1], '9.410E+02')
+        self.assertEqual(len(table), 7)
+
+    def test_same_as_fixtures(self):
+        # the fixtures were written by the previous two-pass parser
+        pyatmos.parser.parse_photochem(self.input_file, self.directory, False)
+        for name in ['fluxes', 'mixing_ratios']:
+            with open(os.path.join(self.directory, 'parsed_photochem_{0}.csv'.format(name))) as file:
+                parsed = file.read()
+            with open(os.path.join(TEST_DIRECTORY, 'out_parsed_photochem_{0}.csv'.format(name))) as file:
+                self.assertEqual(parsed, file.read())
+
+class FortranToFloatArray(unittest.TestCase):
+    def test_missing_exponent(self):
+        data = pyatmos.parser.fortran_to_float_array(b' 5.36-102  -5.36-102  1.0E-102\n 2.5+100  1.0E+00  -3.\n')
+        self.assertEqual(data.shape, (2, 3))
+        self.assertEqual(list(data[0]), [5.36e-102, -5.36e-102, 1e-102])
+        self.assertEqual(list(data[1]), [2.5e100, 1.0, -3.0])
+
+    def test_rows(self):
+        data = pyatmos.parser.fortran_to_float_array([['1.0', '2.0'], ['3.0']], 3)
+        self.assertEqual(data.shape, (2, 3))
+        self.assertEqual(data[1, 0], 3.0)
+        self.assertTrue(all(value != value for value in data[1, 1:]))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
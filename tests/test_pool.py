@@ -0,0 +1,83 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+class FakeSimulation():
+    '''
+    Writes out.out in the output directory of every run, fails the runs with a negative CH4 concentration
+    The runs of the first specs take longer, so that they finish last
+    '''
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def start(self):
+        pass
+
+    def run(self, species_concentrations, output_directory):
+        with open(os.path.join(output_directory, 'calls'), 'a') as file:
+            file.write('run\n')
+        if species_concentrations['CH4'] < 0:
+            raise ValueError('negative concentration')
+        time.sleep(0.5/(1+species_concentrations['CH4'])**2)
+        with open(os.path.join(output_directory, 'out.out'), 'w') as file:
+            file.write(str(species_concentrations['CH4']))
+        return 'success'
+
+    def get_metadata(self):
+        return {'kwargs' : sorted(self.kwargs), 'template' : self.kwargs.get('template')}
+
+class SimulationPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # the workers are forked, they make their Simulation from the patched module
+        self.simulation_class = pyatmos.Simulation
+        pyatmos.Simulation = FakeSimulation
+        self.specs = []
+        for i, concentration in enumerate([0, 1, -1, 3]):
+            output_directory = os.path.join(self.directory, 'run_{0}'.format(i))
+            os.makedirs(output_directory)
+            self.specs.append({'species_concentrations' : {'CH4' : concentration}, 'output_directory' : output_directory, 'run_id' : 'run_{0}'.format(i)})
+
+    def tearDown(self):
+        pyatmos.Simulation = self.simulation_class
+        shutil.rmtree(self.directory)
+
+    def calls(self, spec):
+        with open(os.path.join(spec['output_directory'], 'calls')) as file:
+            return len(file.readlines())
+
+    def test_run(self):
+        pool = pyatmos.SimulationPool(n_workers=4, workspace_directory=self.directory, template='ArcheanEarth')
+        finished = [result['index'] for result in pool.imap(self.specs)]
+        self.assertEqual(sorted(finished), [0, 1, 2, 3])
+        self.assertNotEqual(finished, [0, 1, 2, 3])
+
+        results = pool.run(self.specs)
+        self.assertEqual([result['run_id'] for result in results], ['run_0', 'run_1', 'run_2', 'run_3'])
+        self.assertEqual([result['status'] for result in results], ['success', 'success', 'error', 'success'])
+        self.assertEqual(results[2]['error'], 'ValueError: negative concentration')
+        self.assertIsNone(results[2]['metadata'])
+        self.assertEqual(results[0]['metadata']['kwargs'], sorted(pool._simulation_kwargs))
+        self.assertIn('catalog', results[0]['metadata']['kwargs'])
+        self.assertEqual(results[0]['metadata']['template'], 'ArcheanEarth')
+        self.assertEqual(sorted(os.listdir(self.directory)), ['run_0', 'run_1', 'run_2', 'run_3'])
+
+    def test_resume(self):
+        journal_file = os.path.join(self.directory, 'journal.jsonl')
+        pyatmos.SimulationPool(n_workers=2, journal=pyatmos.journal.SweepJournal(journal_file)).run(self.specs)
+        self.assertEqual([self.calls(spec) for spec in self.specs], [1, 1, 1, 1])
+
+        # the output of a completed run was lost
+        os.remove(os.path.join(self.specs[3]['output_directory'], 'out.out'))
+
+        results = pyatmos.SimulationPool(n_workers=2, journal=pyatmos.journal.SweepJournal(journal_file)).run(self.specs)
+        self.assertEqual([result['journaled'] for result in results], [True, True, False, False])
+        self.assertEqual([result['status'] for result in results], ['success', 'success', 'error', 'success'])
+        self.assertEqual([result['run_id'] for result in results], ['run_0', 'run_1', 'run_2', 'run_3'])
+        self.assertEqual([self.calls(spec) for spec in self.specs], [1, 1, 2, 2])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+import pyatmos.cli
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class Reparse(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.runs = [os.path.join(self.directory, 'run_0'), os.path.join(self.directory, 'run_1', 'iteration_0')]
+        for run in self.runs:
+            os.makedirs(run)
+            shutil.copy(os.path.join(TEST_DIRECTORY, 'out.out'), run)
+        self.broken = os.path.join(self.directory, 'run_2')
+        os.makedirs(self.broken)
+        with open(os.path.join(self.broken, 'out.out'), 'w') as file:
+            file.write(' nothing to parse\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reparse(self):
+        self.assertEqual(list(pyatmos.reparse.find_run_directories(self.directory)), self.runs+[self.broken])
+        summary = pyatmos.reparse.reparse(self.directory, 'npz', n_workers=2)
+        self.assertEqual(summary['parsed'], 2)
+        self.assertEqual([directory for directory, error in summary['failed']], [self.broken])
+        for run in self.runs:
+            self.assertTrue(os.path.isfile(os.path.join(run, 'parsed_photochem_fluxes.npz')))
+            self.assertEqual(pyatmos.reparse.stale_outputs(run, 'npz'), [])
+            self.assertEqual(pyatmos.reparse.stale_outputs(run, 'csv'), ['out.out'])
+
+        # only the runs whose outputs changed are parsed again
+        os.utime(os.path.join(self.runs[0], 'out.out'))
+        os.remove(os.path.join(self.broken, 'out.out'))
+        summary = pyatmos.reparse.reparse(self.directory, 'npz', n_workers=2)
+        self.assertEqual((summary['parsed'], summary['skipped'], summary['failed']), (1, 1, []))
+
+    def test_cli(self):
+        failures = os.path.join(self.directory, 'failures.txt')
+        with self.assertRaises(SystemExit):
+            pyatmos.cli.main(['reparse', self.directory, '--processes', '1', '--failures', failures])
+        with open(failures) as file:
+            self.assertEqual([line.split('\t')[0] for line in file], [self.broken])
+        self.assertTrue(os.path.isfile(os.path.join(self.runs[1], 'parsed_photochem_mixing_ratios.csv')))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,52 @@
+import os
+import json
+import pickle
+import shutil
+import tempfile
+import unittest
+import pyatmos
+from clima_fixtures import clima_allout
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class RunResult(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        shutil.copy(os.path.join(TEST_DIRECTORY, 'out.out'), self.directory)
+        with open(os.path.join(self.directory, 'clima_allout.tab'), 'w') as file:
+            file.write(clima_allout(surface_temperature=200.0))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_status(self):
+        result = pyatmos.result.RunResult('success', self.directory)
+        self.assertEqual(result, 'success')
+        self.assertIn(result, ['success', 'photochem_nonconverged'])
+        self.assertEqual(json.dumps({'status' : result}), '{"status": "success"}')
+        self.assertEqual(pickle.loads(pickle.dumps(result)).output_directory, self.directory)
+
+    def test_lazy_tables(self):
+        result = pyatmos.result.RunResult('success', self.directory)
+        self.assertEqual(result.surface_temperature, 200.0)
+        self.assertEqual(result.surface_pressure, 0.01)
+        self.assertEqual(result.final_clima_deviation, 0.01)
+        self.assertEqual(result.surface_fluxes(['CH4', 'O2']), {'flux_CH4' : 8.111e-07, 'flux_O2' : 61.21})
+        self.assertEqual(sorted(result._tables), sorted(pyatmos.result.TABLES))
+        # parsed in memory only
+        self.assertEqual([file_name for file_name in os.listdir(self.directory) if file_name.startswith('parsed_')], [])
+
+        # the derived quantities are computed once
+        result._tables = {}
+        self.assertEqual(result.surface_temperature, 200.0)
+        self.assertEqual(result._tables, {})
+
+    def test_save(self):
+        pyatmos.result.RunResult('success', self.directory).save('npz')
+        os.remove(os.path.join(self.directory, 'out.out'))
+        result = pyatmos.result.RunResult('success', self.directory)
+        self.assertEqual(pyatmos.Simulation.get_surface_fluxes(result, ['O2']), {'flux_O2' : 61.21})
+        self.assertEqual(pyatmos.Simulation.get_surface_temperature(os.path.join(self.directory, 'parsed_clima_final')), 200.0)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
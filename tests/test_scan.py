@@ -0,0 +1,45 @@
+import unittest
+import pyatmos
+
+class FakeSimulation():
+    '''
+    Clima only converges when SOLCON changes by less than 0.3 from the solution it starts from
+    '''
+    def __init__(self):
+        self.solutions = {}
+        self.calls = []
+
+    def run_distance_modification(self, flux_scaling, output_directory, previous_clima_solution=None):
+        self.calls.append(flux_scaling)
+        previous = self.solutions.get(previous_clima_solution, 1.0)
+        if abs(flux_scaling - previous) > 0.3:
+            return False
+        self.solutions[output_directory+'/TempOut.dat'] = flux_scaling
+        return True
+
+class ContinuationScan(unittest.TestCase):
+    def test_order_points(self):
+        points = [{'flux_scaling' : s} for s in [1.0, 0.2, 0.5, 0.9]]
+        self.assertEqual(pyatmos.scan.order_points(points, 'given'), [0, 1, 2, 3])
+        self.assertEqual(pyatmos.scan.order_points(points, 'sorted'), [1, 2, 3, 0])
+        points = [{'species_concentrations' : {'CH4' : c}} for c in [1e-6, 1e-2, 1e-5, 1e-3]]
+        self.assertEqual(pyatmos.scan.order_points(points, 'nearest'), [0, 2, 3, 1])
+
+    def test_interpolate_point(self):
+        start = {'species_concentrations' : {'CH4' : 1e-6}, 'species_fluxes' : {'O2' : 0.0}}
+        target = {'species_concentrations' : {'CH4' : 1e-4}, 'species_fluxes' : {'O2' : 2.0}, 'output_directory' : 'a'}
+        point = pyatmos.scan.interpolate_point(start, target, 0.5)
+        self.assertAlmostEqual(point['species_concentrations']['CH4'], 1e-5)
+        self.assertEqual(point['species_fluxes']['O2'], 1.0)
+        self.assertEqual(target['species_concentrations']['CH4'], 1e-4)
+
+    def test_bisection(self):
+        simulation = FakeSimulation()
+        points = [{'flux_scaling' : 1.0, 'output_directory' : 'a'}, {'flux_scaling' : 0.5, 'output_directory' : 'b'}]
+        results = pyatmos.scan.ContinuationScan(simulation, 'run_distance_modification', order='given').run(points)
+        self.assertEqual([r['converged'] for r in results], [True, True])
+        self.assertEqual(simulation.calls, [1.0, 0.5, 0.75, 0.5])
+        self.assertEqual(results[1]['n_runs'], 3)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class SectionIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.directory, 'out.out')
+        shutil.copy(os.path.join(TEST_DIRECTORY, 'out.out'), self.out_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sections(self):
+        with pyatmos.sections.SectionIndex(self.out_file) as index:
+            self.assertEqual([index.count(name) for name in ['mixing_ratios', 'ozone_column_depth', 'fluxes', 'aqueous_phase_species', 'iterations']],
+                             [2, 2, 1, 1, 6])
+            lines = list(index.lines('mixing_ratios'))
+            self.assertEqual(lines, index.section('mixing_ratios').decode().splitlines(True))
+            self.assertIn(pyatmos.parser.PHOTOCHEM_MIXING_RATIOS_START, lines[0])
+            self.assertIn(pyatmos.parser.PHOTOCHEM_MIXING_RATIOS_END, lines[-1])
+            self.assertEqual(len(lines), 22)
+            self.assertEqual(len(list(index.lines('fluxes'))), 20)
+            self.assertEqual(list(index.lines('fluxes', None)), index.section('fluxes', None).decode().splitlines(True))
+            self.assertEqual(list(index.lines('mixing_ratios', None, closed=False)), index.section('mixing_ratios', None, closed=False).decode().splitlines(True))
+            # the lines are read while they are iterated
+            flux_lines = index.lines('fluxes')
+            self.assertIs(iter(flux_lines), flux_lines)
+            self.assertIn(pyatmos.parser.PHOTOCHEM_FLUXES_START, next(flux_lines))
+            self.assertEqual(index.last_iteration(), (151, 1e-6))
+        self.assertEqual(list(pyatmos.sections.SectionIndex(data=b'no sections\n').lines('fluxes')), [])
+
+    def test_index_file(self):
+        with pyatmos.sections.SectionIndex(self.out_file) as index:
+            offsets = index.offsets()
+        self.assertTrue(os.path.isfile(self.out_file+'.index'))
+        with pyatmos.sections.SectionIndex(self.out_file) as index:
+            self.assertEqual(index._load_index(), offsets)
+
+        # the index of a modified file is not reused
+        with open(self.out_file, 'a') as file:
+            file.write('   N =    152   EMAX = 1.000E-07 FOR SPECIES O3    AT Z =  1   TIME = 1.0E+17\n')
+        with pyatmos.sections.SectionIndex(self.out_file) as index:
+            self.assertIsNone(index._load_index())
+            self.assertEqual(index.count('iterations'), 7)
+            self.assertEqual(index.last_iteration(), (152, 1e-7))
+
+    def test_data(self):
+        with open(self.out_file, 'rb') as file:
+            index = pyatmos.sections.SectionIndex(data=file.read())
+        self.assertEqual(index.last_iteration(), (151, 1e-6))
+        self.assertIsNone(pyatmos.sections.SectionIndex(data=b'no iterations\n').last_iteration())
+        self.assertFalse(os.path.exists(self.out_file+'.index'))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
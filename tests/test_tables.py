@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+from clima_fixtures import BINDING, ROW, clima_allout
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class Tables(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_unique_columns(self):
+        self.assertEqual(pyatmos.tables.unique_columns(['Z', 'O', 'Z', 'Z']), ['Z', 'O', 'Z.1', 'Z.2'])
+
+    def test_find_newest(self):
+        path = os.path.join(self.directory, 'parsed_clima_final')
+        for output_format in ['csv', 'npz']:
+            with open(path+'.'+output_format, 'w') as file:
+                file.write(output_format)
+        os.utime(path+'.csv', ns=(10**18, 10**18))
+        os.utime(path+'.npz', ns=(10**18, 10**18))
+        self.assertEqual(pyatmos.tables.find_table(path), (path+'.npz', 'npz'))
+        # parsed again as csv
+        os.utime(path+'.csv', ns=(2*10**18, 2*10**18))
+        self.assertEqual(pyatmos.tables.find_table(path), (path+'.csv', 'csv'))
+        with self.assertRaises(IOError):
+            pyatmos.tables.find_table(os.path.join(self.directory, 'parsed_clima_initial'))
+
+    def test_photochem_npz(self):
+        csv_directory = os.path.join(self.directory, 'csv')
+        os.makedirs(csv_directory)
+        input_file = os.path.join(self.directory, 'out.out')
+        shutil.copy(os.path.join(TEST_DIRECTORY, 'out.out'), input_file)
+        pyatmos.parser.parse_photochem(input_file, csv_directory, False)
+        pyatmos.parser.parse_photochem(input_file, self.directory, False, output_format='npz')
+        for name in ['fluxes', 'mixing_ratios']:
+            path = os.path.join(self.directory, 'parsed_photochem_{0}'.format(name))
+            self.assertEqual(pyatmos.tables.find_table(path), (path+'.npz', 'npz'))
+            expected = pyatmos.tables.read_table(os.path.join(csv_directory, 'parsed_photochem_{0}'.format(name))).drop(columns='Unnamed: 0')
+            parsed = pyatmos.tables.read_table(path)
+            self.assertEqual(list(parsed.columns), list(expected.columns))
+            self.assertTrue((parsed.values == expected.values).all())
+            self.assertEqual(list(pyatmos.tables.read_table(path, columns=['Z.1']).columns), ['Z.1'])
+
+    def test_clima(self):
+        input_file = os.path.join(self.directory, 'clima_allout.tab')
+        with open(input_file, 'w') as file:
+            file.write(clima_allout())
+        for output_format in ['csv', 'npz']:
+            pyatmos.parser.parse_clima(input_file, self.directory, output_format=output_format)
+            path = os.path.join(self.directory, 'parsed_clima_final.'+output_format)
+            self.assertEqual(pyatmos.Simulation.get_surface_temperature(path), 290.0)
+            self.assertEqual(list(pyatmos.tables.read_table(path)['ALT']), [30.0, 0.0])
+            iterations = pyatmos.tables.read_table(os.path.join(self.directory, 'parsed_clima_iterations.'+output_format))
+            self.assertEqual(list(iterations['DIVFrms']), [0.1, 0.01])
+        with open(os.path.join(self.directory, 'parsed_clima_initial.csv')) as file:
+            self.assertEqual(file.readline(), ','.join(BINDING.split())+'\n')
+
+    def test_clima_overflow(self):
+        input_file = os.path.join(self.directory, 'clima_allout.tab')
+        overflow = ROW.format(2, 0, 290.0).replace('1.0E+00  1.0E+00', '*********  NaN')
+        with open(input_file, 'w') as file:
+            file.write(clima_allout(n_steps=1, surface_row=overflow))
+        for output_format in ['csv', 'npz']:
+            tables = pyatmos.parser.parse_clima(input_file, self.directory, output_format=output_format)
+            dfs = [tables['parsed_clima_final']]
+            if output_format != 'csv':
+                dfs.append(pyatmos.tables.read_table(os.path.join(self.directory, 'parsed_clima_final.'+output_format)))
+            for df in dfs:
+                self.assertEqual(list(df['ALT']), [30.0, 0.0])
+                self.assertEqual(df['TCOOL'][0], 1.0)
+                self.assertTrue(df['TCOOL'][1] != df['TCOOL'][1])
+                self.assertTrue(df['THEAT'][1] != df['THEAT'][1])
+        # the csv tables are written as printed by clima
+        with open(os.path.join(self.directory, 'parsed_clima_final.csv')) as file:
+            self.assertIn('*********', file.read())
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class TemplateRegistry(unittest.TestCase):
+    def setUp(self):
+        self.reads = []
+
+    def read_files(self, file_names):
+        self.reads.append(file_names)
+        contents = {}
+        for file_name in file_names:
+            name = os.path.basename(file_name)
+            if os.path.exists(os.path.join(TEST_DIRECTORY, name)):
+                with open(os.path.join(TEST_DIRECTORY, name), 'rb') as file:
+                    contents[file_name] = file.read()
+        return contents
+
+    def test_parse_once(self):
+        registry = pyatmos.templates.TemplateRegistry()
+        template = registry.get('ModernEarth', self.read_files)
+        self.assertIs(registry.get('ModernEarth', self.read_files), template)
+        self.assertEqual(len(self.reads), 1)
+        self.assertIn('PHOTOCHEM/INPUTFILES/TEMPLATES/ModernEarth/species.dat', self.reads[0])
+
+        self.assertEqual(template.parameters('input_clima.dat')['NSTEPS'], '10')
+        self.assertIsNone(template.file('in.dist'))
+        self.assertEqual(set(template.installed_files('/atmos')), 
+                         {'/atmos/PHOTOCHEM/INPUTFILES/species.dat', '/atmos/PHOTOCHEM/INPUTFILES/input_photchem.dat', '/atmos/CLIMA/IO/input_clima.dat'})
+
+    def test_species_copies(self):
+        template = pyatmos.templates.TemplateRegistry().get('ModernEarth', self.read_files)
+        longlived_df, other_df = template.species()
+        pyatmos.modify_species_file.modify_concentrations(longlived_df, {'CH4' : 1e-3})
+        self.assertEqual(template.species()[0].at['CH4', 'FIXEDMR'], '1.8E-06')
+        self.assertIn('N2', other_df.index)
+
+class UseTemplate(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for template in ['A', 'B']:
+            self._write('PHOTOCHEM/INPUTFILES/TEMPLATES/{0}/parameters.inc'.format(template), 'parameters of {0}\n'.format(template))
+            shutil.copy(os.path.join(TEST_DIRECTORY, 'species.dat'), os.path.join(self.directory, 'PHOTOCHEM/INPUTFILES/TEMPLATES', template))
+        self._write('PHOTOCHEM/INPUTFILES/parameters.inc', 'parameters of A\n')
+        self.simulation = pyatmos.Simulation(code_path=self.directory, template='A')
+        self.compiled = []
+        self.simulation._compile = lambda template: self.compiled.append(template) or True
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _read(self, file_name):
+        with open(os.path.join(self.directory, file_name)) as file:
+            return file.read()
+
+    def _write(self, file_name, text):
+        path = os.path.join(self.directory, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(text)
+
+    def test_switch_and_reset(self):
+        self.simulation._use_template('A')
+        self.simulation._use_template('B')
+        self.assertEqual(self.compiled, ['B'])
+
+        # what pyatmos.container_pool.reset_container does: the template files are restored, the binaries are not
+        self._write('PHOTOCHEM/INPUTFILES/parameters.inc', 'parameters of A\n')
+        self.simulation.atmos_restored()
+        self.simulation._use_template('A')
+        self.simulation._use_template('A')
+        self.assertEqual(self.compiled, ['B', 'A'])
+
+    def test_failed_compile(self):
+        self.simulation._compile = lambda template: self.compiled.append(template) and False
+        self.simulation._use_template('B')
+        self.simulation._use_template('B')
+        self.assertEqual(self.compiled, ['B', 'B'])
+
+    def test_edited_atmos(self):
+        # parameters.inc was edited after the template was registered
+        self.simulation._template_registry.get('A', self.simulation._read_atmos_files)
+        self._write('PHOTOCHEM/INPUTFILES/parameters.inc', 'edited parameters\n')
+        simulation = pyatmos.Simulation(code_path=self.directory, template='A', template_registry=self.simulation._template_registry)
+        compiled_parameters = []
+        simulation._compile = lambda template: compiled_parameters.append(self._read('PHOTOCHEM/INPUTFILES/parameters.inc')) or True
+        simulation._use_template('A')
+        self.assertEqual(compiled_parameters, ['parameters of A\n'])
+
+    def test_make_failed(self):
+        simulation = pyatmos.Simulation(code_path=self.directory, template='A')
+        simulation._generic_run = lambda command: 512
+        self.assertFalse(simulation._compile('A'))
+        simulation._generic_run = lambda command: 0
+        self.assertTrue(simulation._compile('A'))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,77 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import subprocess
+import unittest
+import docker
+import pyatmos
+
+class FakeContainer():
+    '''
+    Runs the commands on the local filesystem instead of inside a container, and records them
+    '''
+    def __init__(self):
+        self.commands = []
+
+    def exec_run(self, command):
+        self.commands.append(command)
+        process = subprocess.run(command, stdout=subprocess.PIPE)
+        return process.returncode, process.stdout
+
+    def get_archive(self, path):
+        if not os.path.exists(path):
+            raise docker.errors.NotFound(path)
+        stream = io.BytesIO()
+        with tarfile.open(fileobj=stream, mode='w') as archive:
+            archive.add(path, arcname=os.path.basename(path))
+        return iter([stream.getvalue()]), {}
+
+class Transfer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_files(self):
+        files = { os.path.join(self.directory, file_name) : file_name.encode() for file_name in ['in.dist', 'with space.dat', "it's; rm -rf x.dat"] }
+        pyatmos.transfer.put_local_files(files)
+        missing = os.path.join(self.directory, 'missing.dat')
+        container = FakeContainer()
+        self.assertEqual(pyatmos.transfer.get_files(container, list(files)+[missing]), files)
+
+        # the archive made in the container is removed
+        archive_path = container.commands[-1][-1]
+        self.assertEqual(container.commands[-1], ['rm', '-f', archive_path])
+        self.assertTrue(archive_path.startswith('/tmp/pyatmos_transfer.'))
+        self.assertFalse(os.path.exists(archive_path))
+
+        self.assertEqual(pyatmos.transfer.get_files(container, [missing]), {})
+
+    def test_archive_round_trip(self):
+        files = {'/code/atmos/PHOTOCHEM/in.dist' : b'1.0E+00\n', '/code/atmos/CLIMA/IO/input_clima.dat' : 'NSTEPS= 1000', '/empty.dat' : b''}
+        extracted = pyatmos.transfer.read_archive(pyatmos.transfer.make_archive(files))
+        self.assertEqual(extracted, {'code/atmos/PHOTOCHEM/in.dist' : b'1.0E+00\n', 'code/atmos/CLIMA/IO/input_clima.dat' : b'NSTEPS= 1000', 'empty.dat' : b''})
+        self.assertEqual(pyatmos.transfer.read_archive(pyatmos.transfer.make_archive({})), {})
+
+    def test_put_local_files(self):
+        path = os.path.join(self.directory, 'species.dat')
+        link = os.path.join(self.directory, 'species_link.dat')
+        with open(path, 'w') as file:
+            file.write('original')
+        # e.g. the same file in another workspace
+        os.link(path, link)
+        pyatmos.transfer.put_local_files({path : 'modified'})
+        self.assertEqual(pyatmos.transfer.get_local_files([path, link]), {path : b'modified', link : b'original'})
+        self.assertFalse(os.path.samefile(path, link))
+
+        # a write that fails leaves the target as it was
+        with self.assertRaises(TypeError):
+            pyatmos.transfer.put_local_files({path : 1})
+        self.assertEqual(pyatmos.transfer.get_local_files([path])[path], b'modified')
+        self.assertEqual(sorted(os.listdir(self.directory)), ['species.dat', 'species_link.dat'])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
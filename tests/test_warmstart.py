@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pyatmos
+
+class SolutionIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = pyatmos.warmstart.SolutionIndex(os.path.join(self.directory, 'index.jsonl'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _add_run(self, name, concentration, status):
+        output_directory = os.path.join(self.directory, name)
+        os.makedirs(output_directory, exist_ok=True)
+        for file_name in ['out.dist', 'TempOut.dat']:
+            open(os.path.join(output_directory, file_name), 'w').close()
+        features = pyatmos.warmstart.run_features({'CH4' : concentration})
+        return self.index.add(features, output_directory, status)
+
+    def test_nearest(self):
+        self._add_run('low', 1e-6, 'success')
+        self._add_run('high', 1e-3, 'success')
+        self._add_run('clima_failed', 2e-4, 'clima_error')
+        features = pyatmos.warmstart.run_features({'CH4' : 1e-4})
+        self.assertEqual(self.index.nearest(features, 'photochem'), os.path.join(self.directory, 'clima_failed', 'out.dist'))
+        self.assertEqual(self.index.nearest(features, 'clima'), os.path.join(self.directory, 'high', 'TempOut.dat'))
+
+    def test_failed_run_replaces_record(self):
+        self._add_run('run', 1e-4, 'success')
+        self._add_run('run', 1e-4, 'photochem_nonconverged')
+        features = pyatmos.warmstart.run_features({'CH4' : 1e-4})
+        self.assertIsNone(self.index.nearest(features, 'photochem'))
+
+    def test_add_after_torn_line(self):
+        self._add_run('torn', 1e-4, 'success')
+        # the process adding the run was killed in the middle of the write
+        with open(self.index._index_file, 'r+') as file:
+            file.truncate(os.path.getsize(self.index._index_file)//2)
+        self.index = pyatmos.warmstart.SolutionIndex(self.index._index_file)
+        self._add_run('run', 1e-3, 'success')
+
+        reloaded = pyatmos.warmstart.SolutionIndex(self.index._index_file)
+        self.assertEqual([record['output_directory'] for record in reloaded.records], [os.path.join(self.directory, 'run')])
+
+    def test_shared_index(self):
+        # a second index on the same file sees the records added by the first one
+        self._add_run('run', 1e-4, 'success')
+        other = pyatmos.warmstart.SolutionIndex(self.index._index_file, max_distance=0.5)
+        self.assertIsNotNone(other.nearest(pyatmos.warmstart.run_features({'CH4' : 2e-4})))
+        self.assertIsNone(other.nearest(pyatmos.warmstart.run_features({'CH4' : 1e-2})))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,56 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import pyatmos
+
+class WorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, 'jobs.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lease_complete(self):
+        queue = pyatmos.workqueue.WorkQueue(self.database)
+        queue.add([{'flux_scaling' : 1.0}, {'flux_scaling' : 0.9}])
+        job_id, spec = queue.lease('a')
+        self.assertEqual(json.loads(spec), {'flux_scaling' : 1.0})
+        self.assertEqual(queue.lease('b')[0], job_id+1)
+        self.assertIsNone(queue.lease('c'))
+        self.assertFalse(queue.complete(job_id, 'b', '{}'))
+        self.assertTrue(queue.complete(job_id, 'a', json.dumps({'status' : True})))
+        self.assertEqual(queue.counts(), {'pending' : 0, 'leased' : 1, 'done' : 1, 'failed' : 0})
+        self.assertEqual(queue.results()[0]['result'], {'status' : True})
+
+    def test_requeue(self):
+        queue = pyatmos.workqueue.WorkQueue(self.database, lease_duration=0.2, max_attempts=2)
+        queue.add([{'flux_scaling' : 1.0}])
+        job_id, _ = queue.lease('dead')
+        time.sleep(0.3)
+        self.assertEqual(queue.lease('alive')[0], job_id)
+        self.assertFalse(queue.heartbeat(job_id, 'dead'))
+        self.assertTrue(queue.heartbeat(job_id, 'alive'))
+        time.sleep(0.3)
+        self.assertEqual(queue.counts()['failed'], 1)
+        self.assertTrue(queue.finished())
+
+    def test_coordinator(self):
+        queue = pyatmos.workqueue.WorkQueue(self.database)
+        queue.add([{'flux_scaling' : 1.0}])
+        coordinator = pyatmos.workqueue.Coordinator(queue, 'localhost', 0)
+        thread = threading.Thread(target=coordinator.serve, kwargs={'poll_interval' : 0.1})
+        thread.start()
+        client = pyatmos.workqueue.connect('http://localhost:{0}'.format(coordinator.port))
+        job_id, spec = client.lease('remote')
+        self.assertTrue(client.complete(job_id, 'remote', json.dumps({'status' : 'success'})))
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(queue.results()[0]['state'], 'done')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
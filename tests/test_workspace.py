@@ -0,0 +1,39 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pyatmos
+
+class Workspace(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._code_path = os.path.join(self._directory, 'atmos')
+        for file_name in ['Photo.run', 'PHOTOCHEM/in.dist', 'PHOTOCHEM/INPUTFILES/species.dat', 'PHOTOCHEM/DATA/cross_sections.dat',
+                          'PHOTOCHEM/OUTPUT/out.out', 'CLIMA/IO/input_clima.dat', 'CLIMA/IO/TEMPLATES/ModernEarth/input_clima.dat']:
+            path = os.path.join(self._code_path, file_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(file_name)
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_clone(self):
+        manager = pyatmos.workspace.WorkspaceManager(self._code_path, os.path.join(self._directory, 'workspaces'))
+        with manager.clone() as workspace:
+            clone_path = workspace.path
+            # read-only files are shared, modified files are private copies
+            self.assertTrue(os.path.samefile(os.path.join(clone_path, 'Photo.run'), os.path.join(self._code_path, 'Photo.run')))
+            self.assertTrue(os.path.samefile(os.path.join(clone_path, 'PHOTOCHEM/DATA/cross_sections.dat'), os.path.join(self._code_path, 'PHOTOCHEM/DATA/cross_sections.dat')))
+            self.assertTrue(os.path.samefile(os.path.join(clone_path, 'CLIMA/IO/TEMPLATES/ModernEarth/input_clima.dat'), os.path.join(self._code_path, 'CLIMA/IO/TEMPLATES/ModernEarth/input_clima.dat')))
+            for file_name in ['PHOTOCHEM/in.dist', 'PHOTOCHEM/INPUTFILES/species.dat', 'PHOTOCHEM/OUTPUT/out.out', 'CLIMA/IO/input_clima.dat']:
+                self.assertFalse(os.path.samefile(os.path.join(clone_path, file_name), os.path.join(self._code_path, file_name)))
+
+            with open(os.path.join(clone_path, 'PHOTOCHEM/in.dist'), 'w') as file:
+                file.write('modified')
+            with open(os.path.join(self._code_path, 'PHOTOCHEM/in.dist')) as file:
+                self.assertEqual(file.read(), 'PHOTOCHEM/in.dist')
+        self.assertFalse(os.path.exists(clone_path))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)